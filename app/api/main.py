@@ -1,24 +1,122 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
-from app.api.schemas import QueryRequest
+from fastapi.responses import Response, StreamingResponse
+from app.api.schemas import BatchQueryRequest, QueryRequest
 from app.rag.pipeline import RAGPipeline
+from app.retrieval.async_retriever import RetrievalOverloaded
+from app.models.http_client import open_http_client, close_http_client
+from app.core.config import get_settings
 from app.core.logging import setup_logging
+from app.core import metrics
 import faulthandler
+import json
+import math
 import traceback
 
 faulthandler.enable()
 log = setup_logging()
 
-app = FastAPI(title="Enterprise RAG Intelligence Hub")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled upstream client per process, opened on startup and closed on shutdown
+    await open_http_client()
+    await pipeline.llm.start()
+    try:
+        yield
+    finally:
+        await pipeline.llm.aclose()
+        await close_http_client()
+
+app = FastAPI(title="Enterprise RAG Intelligence Hub", lifespan=lifespan)
+app.add_middleware(metrics.TraceMiddleware)
 pipeline = RAGPipeline()
 
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Per-stage and per-route latency histograms in the Prometheus text format."""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/cache/stats")
+async def cache_stats():
+    if pipeline.answer_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **pipeline.answer_cache.snapshot()}
+
+def _overloaded(e: RetrievalOverloaded) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail=str(e),
+        headers={"Retry-After": str(math.ceil(e.retry_after_s))},
+    )
+
+def _sse(event: dict) -> str:
+    name = event.pop("event")
+    return f"event: {name}\ndata: {json.dumps(event, default=str)}\n\n"
+
+@app.get("/llm/endpoints")
+async def llm_endpoints():
+    return pipeline.llm.router.snapshot()
+
+@app.post("/query/stream")
+async def query_stream(req: QueryRequest):
+    """Server-sent events: `context`, then one `token` per generated token, then `done` with citations."""
+    events = pipeline.run_stream(req.question, filters=req.filter_dict())
+    try:
+        # Pull the first event (retrieval) eagerly so overload/errors still map to a status code
+        first = await events.__anext__()
+    except RetrievalOverloaded as e:
+        raise _overloaded(e)
+    except Exception as e:
+        log.error(f"query_stream_error | error={str(e)}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail="Internal error")
+
+    async def body():
+        yield _sse(first)
+        try:
+            async for event in events:
+                yield _sse(event)
+        except Exception as e:
+            log.error(f"query_stream_error | error={str(e)}")
+            yield _sse({"event": "error", "detail": "Internal error"})
+        finally:
+            # A disconnect closes this body; pass it on so generation stops instead of running unread
+            await events.aclose()
+
+    return StreamingResponse(body(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.post("/query/batch")
+async def query_batch(req: BatchQueryRequest):
+    """
+    NDJSON, one line per question as soon as its answer is ready (completion order, not input order):
+    {"index": i, "question": ..., "answer": ..., ...}. Identical questions are answered once.
+    """
+    limit = get_settings().batch_max_questions
+    if len(req.questions) > limit:
+        raise HTTPException(status_code=413, detail=f"At most {limit} questions per batch")
+    filters = req.filter_dict()
+
+    async def body():
+        events = pipeline.run_many(req.questions, filters=filters)
+        try:
+            async for i, result in events:
+                yield json.dumps({"index": i, "question": req.questions[i], **result}, default=str) + "\n"
+        except Exception as e:
+            log.error(f"query_batch_error | error={str(e)}")
+            traceback.print_exc()
+            yield json.dumps({"error": "Internal error"}) + "\n"
+        finally:
+            await events.aclose()
+
+    return StreamingResponse(body(), media_type="application/x-ndjson", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.post("/query")
 async def query(req: QueryRequest):
     try:
-        print("inside query-", req.question)
-        result = await pipeline.run(req.question)
-        print("Final result keys:", list(result.keys()))
-        return result
+        return await pipeline.run(req.question, filters=req.filter_dict())
+    except RetrievalOverloaded as e:
+        raise _overloaded(e)
     except Exception as e:
-        log.error("query_error", extra={"error": str(e)})
+        log.error(f"query_error | error={str(e)}")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail="Internal error")
\ No newline at end of file
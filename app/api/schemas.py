@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Union
 
 class RetrievedDoc(BaseModel):
     text: str
@@ -7,9 +7,32 @@ class RetrievedDoc(BaseModel):
     meta: Dict[str, Any] = Field(default_factory=dict)
 
 
-class QueryRequest(BaseModel):
+class QueryFilters(BaseModel):
+    """Metadata filters, applied before ranking (see app.retrieval.filters). List values are ORed."""
+    model_config = {"extra": "forbid"}
+
+    folder: Optional[Union[str, List[str]]] = None
+    file_type: Optional[Union[str, List[str]]] = None
+    file: Optional[Union[str, List[str]]] = None
+    page_min: Optional[int] = Field(default=None, ge=0)
+    page_max: Optional[int] = Field(default=None, ge=0)
+
+
+class FilteredRequest(BaseModel):
+    filters: Optional[QueryFilters] = None
+
+    def filter_dict(self) -> Optional[Dict[str, Any]]:
+        return self.filters.model_dump(exclude_none=True) or None if self.filters else None
+
+
+class QueryRequest(FilteredRequest):
     question: str
 
+
+class BatchQueryRequest(FilteredRequest):
+    """Questions answered by /query/batch; `filters` apply to every question."""
+    questions: List[str] = Field(min_length=1)
+
 class QueryResponse(BaseModel):
     answer: str
     confidence: float
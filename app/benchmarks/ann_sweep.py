@@ -0,0 +1,135 @@
+# app/benchmarks/ann_sweep.py
+"""
+Recall/latency/memory sweep over FAISS index types, to pick `faiss_index_factory` and its tunables.
+
+    python -m app.benchmarks.ann_sweep --cache ./embedding_cache --k 10 --out ann_sweep.json
+    python -m app.benchmarks.ann_sweep --synthetic 200000 --dim 384 --factories "Flat" "IVF{nlist},Flat" "HNSW32"
+
+Vectors come from the on-disk embedding cache (the real corpus) or a synthetic clustered set.
+`--queries` of them are held out as queries; ground truth is exact L2 search over the rest.
+"{nlist}" in a factory is replaced by ~4*sqrt(N). Every IVF index is measured at each nprobe and
+every HNSW index at each efSearch.
+"""
+from __future__ import annotations
+import argparse
+import json
+import math
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import faiss
+import numpy as np
+from app.benchmarks.common import latency_summary, timed, write_report
+from app.retrieval.ann import apply_search_params, base_index, build_index, train
+
+DEFAULT_FACTORIES = ["Flat", "IVF{nlist},Flat", "IVF{nlist},SQ8", "IVF{nlist},PQ{pq_m}", "HNSW32", "HNSW32,SQ8"]
+NPROBES = [1, 4, 16, 64]
+EF_SEARCHES = [16, 32, 64, 128]
+
+
+def load_cache_vectors(cache_dir: str) -> np.ndarray:
+    """All vectors of an EmbeddingCache model directory (the one holding meta.json/vectors.bin)."""
+    root = Path(cache_dir)
+    if not (root / "meta.json").exists():
+        subdirs = [p for p in root.iterdir() if (p / "meta.json").exists()]
+        if len(subdirs) != 1:
+            raise SystemExit(f"Expected one model directory under {root}, found {len(subdirs)}")
+        root = subdirs[0]
+    meta = json.loads((root / "meta.json").read_text(encoding="utf-8"))
+    dim, dtype = int(meta["dim"]), np.dtype(meta["dtype"])
+    rows = (root / "vectors.bin").stat().st_size // (dim * dtype.itemsize)
+    return np.asarray(np.memmap(root / "vectors.bin", dtype=dtype, mode="r", shape=(rows, dim)), dtype=np.float32)
+
+
+def synthetic_vectors(n: int, dim: int, clusters: int = 256, seed: int = 0) -> np.ndarray:
+    # Clustered and unit-normalised, like sentence embeddings; uniform noise would flatter IVF/PQ
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    x = centers[rng.integers(0, clusters, n)] + 0.35 * rng.standard_normal((n, dim)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def _recall(found: np.ndarray, truth: np.ndarray) -> float:
+    k = truth.shape[1]
+    return float(np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)]))
+
+
+def _measure(index: faiss.Index, queries: np.ndarray, truth: np.ndarray, k: int) -> Dict[str, Any]:
+    latencies, found = [], []
+    for q in queries:
+        (_, labels), elapsed = timed(lambda: index.search(q[None, :], k))
+        latencies.append(elapsed)
+        found.append(labels[0])
+    _, batch_s = timed(lambda: index.search(queries, k))
+    return {
+        f"recall@{k}": round(_recall(np.asarray(found), truth), 4),
+        **latency_summary(latencies),
+        "batch_qps": round(len(queries) / batch_s, 1) if batch_s else None,
+    }
+
+
+def run(vectors: np.ndarray, factories: List[str], k: int, n_queries: int, train_max: int,
+        nprobes: Optional[List[int]] = None, ef_searches: Optional[List[int]] = None) -> Dict[str, Any]:
+    rng = np.random.default_rng(1)
+    order = rng.permutation(len(vectors))
+    queries = np.ascontiguousarray(vectors[order[:n_queries]])
+    base = np.ascontiguousarray(vectors[order[n_queries:]])
+    n, dim = base.shape
+    exact = faiss.IndexFlatL2(dim)
+    exact.add(base)
+    _, truth = exact.search(queries, k)
+
+    nlist = max(1, int(4 * math.sqrt(n)))
+    # PQ sub-quantizers must divide dim; ~4 dims per byte keeps PQ recall usable
+    pq_m = next((m for m in (64, 48, 32, 16, 8, 4, 2) if dim % m == 0 and m <= dim // 4), 1)
+    results = []
+    for template in factories:
+        factory = template.format(nlist=nlist, pq_m=pq_m)
+        index = build_index(factory, dim)
+        _, train_s = timed(lambda: train(index, base, train_max) if not index.is_trained else 0)
+        _, add_s = timed(lambda: index.add_with_ids(base, np.arange(n, dtype=np.int64)))
+        entry = {
+            "factory": factory,
+            "build_s": round(train_s + add_s, 3),
+            "train_s": round(train_s, 3),
+            "size_mb": round(faiss.serialize_index(index).nbytes / 2**20, 2),
+            "runs": [],
+        }
+        inner = base_index(index)
+        if isinstance(inner, faiss.IndexIVF):
+            sweep = [("nprobe", v) for v in (nprobes or NPROBES) if v <= inner.nlist]
+        elif isinstance(inner, faiss.IndexHNSW):
+            sweep = [("efSearch", v) for v in (ef_searches or EF_SEARCHES)]
+        else:
+            sweep = [(None, None)]
+        for name, value in sweep:
+            if name == "nprobe":
+                apply_search_params(index, nprobe=value)
+            elif name == "efSearch":
+                apply_search_params(index, ef_search=value)
+            entry["runs"].append({**({name: value} if name else {}), **_measure(index, queries, truth, k)})
+        results.append(entry)
+    return {"vectors": n, "dim": dim, "queries": n_queries, "k": k, "nlist": nlist, "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep FAISS index types for recall vs latency vs memory.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--cache", help="Embedding cache dir (settings.embedding_cache_dir or one model dir in it)")
+    source.add_argument("--synthetic", type=int, help="Number of synthetic clustered vectors")
+    parser.add_argument("--dim", type=int, default=384, help="Dimension for --synthetic")
+    parser.add_argument("--factories", nargs="+", default=DEFAULT_FACTORIES)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--train-max", type=int, default=100000)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=None)
+    parser.add_argument("--ef-search", type=int, nargs="+", default=None)
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+    vectors = load_cache_vectors(args.cache) if args.cache else synthetic_vectors(args.synthetic, args.dim)
+    if len(vectors) <= args.queries:
+        raise SystemExit(f"Need more than {args.queries} vectors, got {len(vectors)}")
+    write_report(run(vectors, args.factories, args.k, args.queries, args.train_max, args.nprobe, args.ef_search), args.out)
+
+
+if __name__ == "__main__":
+    main()
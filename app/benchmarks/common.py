@@ -0,0 +1,109 @@
+# app/benchmarks/common.py
+from __future__ import annotations
+import json
+import resource
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(p / 100.0 * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+def latency_summary(latencies_s: List[float]) -> Dict[str, float]:
+    ms = [v * 1000.0 for v in latencies_s]
+    return {
+        "n": len(ms),
+        "mean_ms": round(sum(ms) / len(ms), 3) if ms else 0.0,
+        "p50_ms": round(percentile(ms, 50), 3),
+        "p95_ms": round(percentile(ms, 95), 3),
+        "p99_ms": round(percentile(ms, 99), 3),
+    }
+
+
+def concurrent_load(fn: Callable[[str], Any], queries: List[str], clients: int) -> Dict[str, Any]:
+    """`queries` split over `clients` threads started together; QPS over the wall time plus latency percentiles."""
+    per_client = [queries[i::clients] for i in range(clients)]
+    latencies: List[float] = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(clients + 1)
+
+    def client(mine: List[str]):
+        barrier.wait()
+        local = []
+        for q in mine:
+            t0 = time.perf_counter()
+            fn(q)
+            local.append(time.perf_counter() - t0)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client, args=(m,)) for m in per_client]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+    return {"qps": round(len(latencies) / wall, 2) if wall else 0.0, **latency_summary(latencies)}
+
+
+def rss_mb() -> float:
+    """Current resident set size (Linux), else the peak reported by getrusage."""
+    try:
+        with open("/proc/self/statm") as f:
+            return round(int(f.read().split()[1]) * resource.getpagesize() / 2**20, 1)
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / 2**20 if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def timed(fn: Callable[[], Any]) -> Tuple[Any, float]:
+    start = time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - start
+
+
+def load_jsonl(path: str | Path) -> List[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _norm(text: str) -> str:
+    return " ".join(text.split()).lower()
+
+
+def _matches_context(chunk: Dict[str, Any], context: str) -> bool:
+    a, b = _norm(chunk.get("text", "")), _norm(context)
+    return bool(a and b) and (a in b or b in a)
+
+
+def recall_at_k(results: Iterable[Dict[str, Any]], sample: Dict[str, Any]) -> float:
+    """
+    Fraction of a sample's expected evidence found in `results`: `relevant_ids` are matched
+    against chunk ids, `contexts` by text containment either way round.
+    """
+    results = list(results)
+    ids = list(sample.get("relevant_ids") or [])
+    contexts = list(sample.get("contexts") or [])
+    if not ids and not contexts:
+        return 0.0
+    found = {(r.get("meta") or {}).get("id") for r in results}
+    hits = sum(i in found for i in ids)
+    hits += sum(any(_matches_context(r, c) for r in results) for c in contexts)
+    return hits / (len(ids) + len(contexts))
+
+
+def write_report(report: Dict[str, Any], out: str | None = None):
+    text = json.dumps(report, indent=2)
+    if out:
+        Path(out).write_text(text, encoding="utf-8")
+    print(text)
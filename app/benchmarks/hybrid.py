@@ -0,0 +1,62 @@
+# app/benchmarks/hybrid.py
+"""
+Recall@k and latency of vector-only, BM25-only and each hybrid fusion strategy on the live index.
+
+    python -m app.benchmarks.hybrid --eval .jsonl --k 5 --out hybrid_bench.json
+
+The eval file is JSONL with a "question" plus "relevant_ids" (chunk ids) and/or "contexts"
+(expected passages) per line.
+"""
+from __future__ import annotations
+import argparse
+from typing import Any, Callable, Dict, List
+from app.benchmarks.common import latency_summary, load_jsonl, recall_at_k, timed, write_report
+from app.retrieval.fusion import FUSION_STRATEGIES
+from app.retrieval.hybrid_retriever import HybridRetriever
+
+
+def run(samples: List[Dict[str, Any]], k: int, retriever: HybridRetriever | None = None) -> Dict[str, Any]:
+    retriever = retriever or HybridRetriever()
+    modes: Dict[str, Callable[[str], List[Dict]]] = {
+        "vector": lambda q: retriever.vector_search(q, k),
+        "bm25": lambda q: retriever.lexical_search(q, k),
+    }
+    for strategy in FUSION_STRATEGIES:
+        modes[f"hybrid_{strategy}"] = lambda q, s=strategy: retriever.retrieve(q, k=k, strategy=s)
+
+    # Warm up so model load and page-in are not billed to whichever mode runs first
+    for s in samples[:3]:
+        for fn in modes.values():
+            fn(s["question"])
+
+    report: Dict[str, Any] = {"k": k, "samples": len(samples), "modes": {}}
+    for name, fn in modes.items():
+        recalls, latencies = [], []
+        for s in samples:
+            results, elapsed = timed(lambda: fn(s["question"]))
+            recalls.append(recall_at_k(results, s))
+            latencies.append(elapsed)
+        report["modes"][name] = {
+            f"recall@{k}": round(sum(recalls) / len(recalls), 4) if recalls else 0.0,
+            **latency_summary(latencies),
+        }
+
+    vec = report["modes"]["vector"]
+    for name, row in report["modes"].items():
+        if name.startswith("hybrid_"):
+            row["recall_gain_vs_vector"] = round(row[f"recall@{k}"] - vec[f"recall@{k}"], 4)
+            row["added_p50_ms_vs_vector"] = round(row["p50_ms"] - vec["p50_ms"], 3)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark hybrid fusion against single retrievers.")
+    parser.add_argument("--eval", required=True, help="JSONL with question + relevant_ids/contexts")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--out", default=None, help="Optional path for the JSON report")
+    args = parser.parse_args()
+    write_report(run(load_jsonl(args.eval), args.k), args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# app/benchmarks/query_batching.py
+"""
+Vector-search throughput and latency with and without query micro-batching, at 1/8/64 concurrent clients.
+
+    python -m app.benchmarks.query_batching --clients 1 8 64 --requests 20 --out batching.json
+
+Queries are word windows sampled from the indexed chunks, each made unique so the in-process
+query-embedding LRU never short-circuits the model.
+"""
+from __future__ import annotations
+import argparse
+import random
+from typing import Any, Dict, List
+from app.benchmarks.common import concurrent_load, write_report
+from app.core.config import get_settings
+from app.retrieval.sharded_store import VectorStore, open_vector_store
+from app.retrieval.query_batcher import QueryBatcher
+
+
+def sample_queries(store: VectorStore, n: int, words: int = 8, seed: int = 13) -> List[str]:
+    rnd = random.Random(seed)
+    texts = [d["text"].split() for d in store.get_all_documents()]
+    texts = [t for t in texts if t] or [["empty", "index"]]
+    out = []
+    for i in range(n):
+        toks = rnd.choice(texts)
+        start = rnd.randrange(max(1, len(toks) - words))
+        out.append(" ".join(toks[start:start + words]) + f" #{i}")
+    return out
+
+
+def run(clients: List[int], requests_per_client: int, k: int) -> Dict[str, Any]:
+    settings = get_settings()
+    store = open_vector_store()
+    batcher = QueryBatcher(store, max(2, settings.query_batch_max_size), settings.query_batch_max_wait_ms)
+    report: Dict[str, Any] = {"k": k, "max_batch": batcher.max_batch,
+                              "max_wait_ms": batcher.max_wait_s * 1000, "clients": {}}
+    total = sum(clients) * requests_per_client
+    queries = sample_queries(store, 2 * total + 8)
+    store.similarity_search(queries[-1], k)  # warm-up: model load and first page-in
+    offset = 0
+    for n in clients:
+        m = n * requests_per_client
+        unbatched = concurrent_load(lambda q: store.similarity_search(q, k), queries[offset:offset + m], n)
+        offset += m
+        before = dict(batcher.stats)
+        batched = concurrent_load(lambda q: batcher.search(q, k), queries[offset:offset + m], n)
+        offset += m
+        batches = batcher.stats["batches"] - before["batches"]
+        batched["mean_batch_size"] = round((batcher.stats["queries"] - before["queries"]) / batches, 2) if batches else 0.0
+        report["clients"][str(n)] = {"unbatched": unbatched, "batched": batched}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark query micro-batching.")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 8, 64])
+    parser.add_argument("--requests", type=int, default=20, help="Queries issued per client")
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+    write_report(run(args.clients, args.requests, args.k), args.out)
+
+
+if __name__ == "__main__":
+    main()
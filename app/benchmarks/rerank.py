@@ -0,0 +1,71 @@
+# app/benchmarks/rerank.py
+"""
+Recall@k and latency of hybrid retrieval with and without the cross-encoder reranker.
+
+    python -m app.benchmarks.rerank --eval .jsonl --k 5 --candidates 50 --out rerank_bench.json
+
+Each question is retrieved once (top `candidates` fused results); the reranker then scores the
+same candidates twice: cold (model call) and warm (pair-score cache).
+"""
+from __future__ import annotations
+import argparse
+from typing import Any, Dict, List
+from app.benchmarks.common import latency_summary, load_jsonl, recall_at_k, timed, write_report
+from app.core.config import get_settings
+from app.retrieval.hybrid_retriever import HybridRetriever
+from app.retrieval.reranker import CrossEncoderReranker
+
+
+def run(samples: List[Dict[str, Any]], k: int, candidates: int, budget_ms: float = 0.0) -> Dict[str, Any]:
+    settings = get_settings()
+    retriever = HybridRetriever()
+    reranker = CrossEncoderReranker(settings.rerank_model, candidates=candidates,
+                                    batch_size=settings.rerank_batch_size, latency_budget_ms=budget_ms)
+    reranker.warmup()
+
+    first_lat, cold_lat, warm_lat = [], [], []
+    base_recall, rerank_recall, pool_recall = [], [], []
+    for s in samples:
+        q = s["question"]
+        fused, elapsed = timed(lambda: retriever.retrieve(q, k=candidates))
+        first_lat.append(elapsed)
+        reranked, elapsed = timed(lambda: reranker.rerank(q, fused, k))
+        cold_lat.append(elapsed)
+        _, elapsed = timed(lambda: reranker.rerank(q, fused, k))
+        warm_lat.append(elapsed)
+        base_recall.append(recall_at_k(fused[:k], s))
+        rerank_recall.append(recall_at_k(reranked, s))
+        pool_recall.append(recall_at_k(fused, s))
+
+    def mean(values):
+        return round(sum(values) / len(values), 4) if values else 0.0
+
+    return {
+        "k": k,
+        "candidates": candidates,
+        "samples": len(samples),
+        "model": settings.rerank_model,
+        f"recall@{candidates}_candidate_pool": mean(pool_recall),
+        "first_stage": {f"recall@{k}": mean(base_recall), **latency_summary(first_lat)},
+        "reranked": {
+            f"recall@{k}": mean(rerank_recall),
+            "cold": latency_summary(cold_lat),
+            "warm_cache": latency_summary(warm_lat),
+        },
+        "reranker_stats": dict(reranker.stats),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cross-encoder reranking.")
+    parser.add_argument("--eval", required=True, help="JSONL with question + relevant_ids/contexts")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--candidates", type=int, default=50)
+    parser.add_argument("--budget-ms", type=float, default=0.0, help="Latency budget (0 = unlimited)")
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+    write_report(run(load_jsonl(args.eval), args.k, args.candidates, args.budget_ms), args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+# app/benchmarks/suite.py
+"""
+Reproducible retrieval benchmark on a synthetic corpus, with machine-readable results.
+
+    python -m app.benchmarks.suite --chunks 100k --out bench.json
+    python -m app.benchmarks.suite --chunks 10m --factory "IVF16384,PQ32" --checkpoint-every 1m --out bench.json
+    python -m app.benchmarks.suite --chunks 100k --baseline last_release.json --tolerance 0.15
+
+Phases:
+    ingest    corpus batches -> stub embeddings -> vector store + BM25, as the indexer writes them
+    build     the final save: IVF/PQ training if still pending, FAISS write, BM25 commit and write
+    load      a fresh process opens the index (memory-mapped per FAISS_MMAP) and BM25: time and RSS
+    retrieve  HybridRetriever.retrieve p50/p95/p99 and QPS at each --clients level (same process)
+    pipeline  RAGPipeline.run with a stub LLM at each --clients level: retrieval, packing, citations
+
+The index goes to --workdir (a fresh temp dir by default) and uses the current settings
+(FAISS_INDEX_FACTORY, FAISS_SHARDS, QUERY_BATCH_MAX_SIZE, ...) unless a flag overrides them.
+Embeddings are HashingEmbeddings, so numbers exclude model inference and are comparable across
+machines only in ratio. With --baseline, metrics worse than the baseline by more than --tolerance
+are listed under "regressions" and the exit code is 1.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing as mp
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import faiss
+import numpy as np
+from app.benchmarks.common import concurrent_load, latency_summary, rss_mb, write_report
+from app.benchmarks.synthetic import HashingEmbeddings, StubLLM, SyntheticCorpus
+from app.core.config import get_settings
+from app.retrieval.bm25 import BM25Index, BM25_DIRNAME
+from app.retrieval.sharded_store import open_vector_store, shard_root
+
+# (path, higher_is_better) of the numbers compared against a baseline
+TRACKED = [
+    ("ingest.chunks_per_s", True),
+    ("build.duration_s", False),
+    ("load.duration_s", False),
+    ("load.rss_delta_mb", False),
+]
+
+
+def count(text: str) -> int:
+    """'10k', '2.5m', '100000' -> int."""
+    text = text.strip().lower()
+    scale = {"k": 10**3, "m": 10**6}.get(text[-1:], 1)
+    return int(float(text[:-1] if scale > 1 else text) * scale)
+
+
+def _apply(overrides: Dict[str, Any]):
+    # Spawned children read the environment; this process already holds a cached Settings object
+    settings = get_settings()
+    for key, value in overrides.items():
+        os.environ[key.upper()] = str(value)
+        setattr(settings, key, value)
+    logging.getLogger("enterprise_rag").setLevel(settings.log_level.upper())
+
+
+def _dir_bytes(*paths: str) -> int:
+    total = 0
+    for path in paths:
+        for root, _, files in os.walk(path):
+            total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return total
+
+
+def _corpus(cfg: Dict[str, Any]) -> SyntheticCorpus:
+    return SyntheticCorpus(cfg["chunks"], vocab_size=cfg["vocab"], topics=cfg["topics"], seed=cfg["seed"])
+
+
+def ingest(cfg: Dict[str, Any]) -> Dict[str, Any]:
+    corpus = _corpus(cfg)
+    store = open_vector_store(writable_cache=True, embedding_model=HashingEmbeddings(corpus.vocab, cfg["dim"], cfg["seed"]))
+    bm25 = BM25Index()
+    timings = {"embed_s": 0.0, "index_add_s": 0.0, "bm25_add_s": 0.0}
+    rss_start = rss_mb()
+    start = time.perf_counter()
+    with store.bulk(checkpoint_every=cfg["checkpoint_every"], on_save=lambda staging: bm25.save(staging / BM25_DIRNAME)):
+        store.reset()
+        for batch in corpus.batches(cfg["batch_size"]):
+            t0 = time.perf_counter()
+            vectors = store.embed_documents([c["text"] for c in batch])
+            t1 = time.perf_counter()
+            store.add_embeddings(batch, vectors)
+            t2 = time.perf_counter()
+            bm25.add((c["id"] for c in batch), (c["text"] for c in batch), (c["meta"] for c in batch))
+            timings["embed_s"] += t1 - t0
+            timings["index_add_s"] += t2 - t1
+            timings["bm25_add_s"] += time.perf_counter() - t2
+        ingested = time.perf_counter()
+    built = time.perf_counter()
+    ingest_s = ingested - start
+    settings = get_settings()
+    return {
+        "ingest": {
+            "chunks": cfg["chunks"],
+            "duration_s": round(ingest_s, 3),
+            "chunks_per_s": round(cfg["chunks"] / ingest_s, 1) if ingest_s else None,
+            **{k: round(v, 3) for k, v in timings.items()},
+            "rss_mb": rss_mb(),
+            "rss_delta_mb": round(rss_mb() - rss_start, 1),
+        },
+        "build": {
+            "duration_s": round(built - ingested, 3),
+            "index_bytes": _dir_bytes(settings.faiss_path, shard_root(settings.faiss_path)),
+        },
+    }
+
+
+async def _pipeline_load(pipeline, queries: List[str], clients: int) -> Dict[str, Any]:
+    per_client = [queries[i::clients] for i in range(clients)]
+    latencies: List[float] = []
+
+    async def client(mine: List[str]):
+        for q in mine:
+            t0 = time.perf_counter()
+            await pipeline.run(q)
+            latencies.append(time.perf_counter() - t0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(m) for m in per_client))
+    wall = time.perf_counter() - start
+    return {"qps": round(len(latencies) / wall, 2) if wall else 0.0, **latency_summary(latencies)}
+
+
+def serve(cfg: Dict[str, Any]) -> Dict[str, Any]:
+    """Load, retrieve and pipeline phases; run in a fresh process so RSS reflects an API worker."""
+    from app.retrieval.hybrid_retriever import HybridRetriever
+    from app.rag.pipeline import RAGPipeline
+
+    corpus = _corpus(cfg)
+    embeddings = HashingEmbeddings(corpus.vocab, cfg["dim"], cfg["seed"])
+    clients, per_client = cfg["clients"], cfg["requests"]
+    queries = corpus.queries(2 * sum(clients) * per_client + 1)
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    retriever = HybridRetriever(open_vector_store(embedding_model=embeddings))
+    load_s = time.perf_counter() - start
+    rss_loaded = rss_mb()
+    retriever.retrieve(queries[-1], cfg["k"])  # warm-up: first page-in of index and postings
+
+    out: Dict[str, Any] = {
+        "load": {"duration_s": round(load_s, 3), "rss_before_mb": rss_before, "rss_after_mb": rss_loaded,
+                 "rss_delta_mb": round(rss_loaded - rss_before, 1)},
+        "retrieve": {},
+        "pipeline": {},
+    }
+    offset = 0
+    for n in clients:
+        m = n * per_client
+        out["retrieve"][str(n)] = concurrent_load(lambda q: retriever.retrieve(q, cfg["k"]), queries[offset:offset + m], n)
+        offset += m
+
+    pipeline = RAGPipeline(retriever=retriever, llm=StubLLM(cfg["llm_delay_ms"]))
+
+    async def pipeline_levels():
+        nonlocal offset
+        for n in clients:
+            m = n * per_client
+            out["pipeline"][str(n)] = await _pipeline_load(pipeline, queries[offset:offset + m], n)
+            offset += m
+
+    asyncio.run(pipeline_levels())
+    out["serve_rss_mb"] = rss_mb()
+    return out
+
+
+def _serve_child(cfg: Dict[str, Any], conn):
+    try:
+        conn.send(serve(cfg))
+    except BaseException as e:
+        conn.send({"error": f"{type(e).__name__}: {e}"})
+        raise
+    finally:
+        conn.close()
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).resolve().parent, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def _lookup(report: Dict[str, Any], path: str) -> Optional[float]:
+    node: Any = report
+    for part in path.split("."):
+        if not isinstance(node, dict) or part not in node:
+            return None
+        node = node[part]
+    return node if isinstance(node, (int, float)) else None
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[Dict[str, Any]]:
+    """Tracked metrics that got worse than `baseline` by more than `tolerance` (relative)."""
+    tracked = list(TRACKED)
+    for phase in ("retrieve", "pipeline"):
+        for n in report.get(phase, {}):
+            tracked += [(f"{phase}.{n}.p99_ms", False), (f"{phase}.{n}.p50_ms", False), (f"{phase}.{n}.qps", True)]
+    out = []
+    for path, higher_is_better in tracked:
+        new, old = _lookup(report, path), _lookup(baseline, path)
+        if new is None or not old:
+            continue
+        change = (new - old) / old
+        if (-change if higher_is_better else change) > tolerance:
+            out.append({"metric": path, "baseline": old, "current": new, "change": round(change, 4)})
+    return out
+
+
+def run(cfg: Dict[str, Any]) -> Dict[str, Any]:
+    settings = get_settings()
+    report: Dict[str, Any] = {
+        "benchmark": "suite",
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "env": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+                "faiss": getattr(faiss, "__version__", None), "numpy": np.__version__},
+        "config": {**cfg, "faiss_index_factory": settings.faiss_index_factory, "faiss_shards": settings.faiss_shards,
+                   "faiss_shard_by": settings.faiss_shard_by, "faiss_mmap": settings.faiss_mmap,
+                   "fusion_strategy": settings.fusion_strategy, "query_batch_max_size": settings.query_batch_max_size,
+                   "rerank_enabled": settings.rerank_enabled},
+    }
+    report.update(ingest(cfg))
+    ctx = mp.get_context("spawn")
+    parent, child = ctx.Pipe(duplex=False)
+    proc = ctx.Process(target=_serve_child, args=(cfg, child))
+    proc.start()
+    child.close()
+    served = parent.recv() if parent.poll(None) else {"error": "serve process exited without a result"}
+    proc.join()
+    if "error" in served:
+        raise RuntimeError(f"serve phase failed: {served['error']}")
+    report.update(served)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic-corpus benchmark of ingest, load and retrieval.")
+    parser.add_argument("--chunks", type=count, default=count("100k"), help="Corpus size, e.g. 10k, 1m, 10m")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--vocab", type=count, default=50000)
+    parser.add_argument("--topics", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=1024, help="Chunks per ingest batch")
+    parser.add_argument("--checkpoint-every", type=count, default=0, help="Intermediate saves; bounds ingest memory for 10M-scale runs")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=50, help="Queries issued per client and level")
+    parser.add_argument("--k", type=int, default=8)
+    parser.add_argument("--llm-delay-ms", type=float, default=0.0)
+    parser.add_argument("--factory", default=None, help="Override FAISS_INDEX_FACTORY")
+    parser.add_argument("--shards", type=int, default=None, help="Override FAISS_SHARDS")
+    parser.add_argument("--workdir", default=None, help="Index location; a temp dir (removed afterwards) by default")
+    parser.add_argument("--keep", action="store_true", help="Keep the temp index directory")
+    parser.add_argument("--baseline", default=None, help="Earlier report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Relative slowdown that counts as a regression")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="rag-bench-")
+    overrides: Dict[str, Any] = {
+        "faiss_path": str(Path(workdir) / "faiss_index"),
+        "embedding_cache_dir": "",
+        "answer_cache_size": 0,  # every benchmark query would miss; skip the extra embedding
+        "log_level": args.log_level,
+    }
+    if args.factory:
+        overrides["faiss_index_factory"] = args.factory
+    if args.shards:
+        overrides["faiss_shards"] = args.shards
+    _apply(overrides)
+
+    cfg = {"chunks": args.chunks, "dim": args.dim, "vocab": args.vocab, "topics": args.topics, "seed": args.seed,
+           "batch_size": args.batch_size, "checkpoint_every": args.checkpoint_every, "clients": args.clients,
+           "requests": args.requests, "k": args.k, "llm_delay_ms": args.llm_delay_ms}
+    try:
+        report = run(cfg)
+    finally:
+        if args.workdir is None and not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        report["baseline"] = {"path": args.baseline, "commit": baseline.get("commit"), "tolerance": args.tolerance}
+        report["regressions"] = compare(report, baseline, args.tolerance)
+    write_report(report, args.out)
+    if report.get("regressions"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
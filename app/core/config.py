@@ -7,12 +7,85 @@ class Settings(BaseSettings):
     collection_name: str = Field(default="enterprise_kg")
     embedding_model: str = Field(default="sentence-transformers/all-MiniLM-L6-v2")
     ollama_base_url: str = Field(default="http://localhost:11434")
+    ollama_base_urls: str = ""       # comma-separated pool of Ollama nodes; empty = ollama_base_url only
     ollama_model: str = Field(default="llama3.1:70b")
-    max_chunk_tokens: int = 800
-    chunk_overlap: int = 120
+    ollama_timeout_s: float = 90.0
+    ollama_connect_timeout_s: float = 5.0
+    ollama_max_connections: int = 16
+    ollama_max_keepalive: int = 8
+    ollama_keepalive_expiry_s: float = 30.0
+    ollama_max_concurrency: int = 4  # parallel generations the Ollama server sustains (OLLAMA_NUM_PARALLEL)
+    ollama_coalesce: bool = True     # share one generation between identical in-flight prompts
+    llm_balancing: str = "least_outstanding"  # least_outstanding | ewma
+    llm_hedge: bool = True           # duplicate a request to a second node once it exceeds the pool's p95
+    llm_hedge_min_samples: int = 20  # latency samples needed before hedging starts
+    llm_hedge_min_delay_ms: float = 1000.0
+    llm_circuit_failures: int = 3    # consecutive failures that take a node out of rotation
+    llm_circuit_cooldown_s: float = 30.0
+    llm_health_interval_s: float = 10.0
+    max_chunk_tokens: int = 200      # tokens (was applied as characters: 800 chars ~ 200 tokens)
+    chunk_overlap: int = 30
+    tokenizer_model: str = ""        # HF tokenizer for token counts; empty = embedding_model's
+    context_token_budget: int = 1200 # max tokens of retrieved evidence in the prompt
+    context_max_chunks: int = 6
+    context_dedupe_threshold: float = 0.8  # word-shingle Jaccard above which chunks count as duplicates
+    context_trim_sentences: bool = True    # trim oversized chunks to query-relevant sentences
     top_k: int = 8
-    hybrid_alpha: float = 0.5
+    hybrid_alpha: float = 0.5        # weight of the vector list in fusion (BM25 gets 1 - alpha)
+    fusion_strategy: str = "rrf"     # rrf | weighted | zscore
+    rrf_k: int = 60
+    hybrid_fetch_k: int = 20         # candidates fetched from each retriever before fusion
+    rerank_enabled: bool = False     # cross-encoder second stage over the fused candidates
+    rerank_model: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+    rerank_candidates: int = 50      # fused candidates passed to the reranker
+    rerank_batch_size: int = 32
+    rerank_cache_size: int = 20000   # cached (query, chunk) pair scores
+    rerank_latency_budget_ms: float = 300.0  # beyond this, keep first-stage order; 0 = no budget
+    retrieval_concurrency: int = 8   # queries searched at once; the rest wait in the queue
+    retrieval_max_queue: int = 64    # waiting queries beyond this are rejected with 503
+    retrieval_queue_timeout_s: float = 2.0
+    retrieval_workers: int = 0       # 0 = 2 * retrieval_concurrency
+    query_batch_max_size: int = 32   # concurrent query embeddings/searches per batch; 1 disables batching
+    query_batch_max_wait_ms: float = 2.0
+    batch_max_questions: int = 10000 # per /query/batch request
+    batch_retrieval_size: int = 32   # questions embedded and searched together in a batch
+    batch_generate_concurrency: int = 0  # generations in flight per batch; 0 = 2 * ollama_max_concurrency
+    answer_cache_size: int = 1024    # 0 disables the answer cache
+    answer_cache_ttl_s: float = 3600.0
+    answer_cache_similarity: float = 0.92  # cosine threshold for semantic (paraphrase) hits
     faiss_path: str = "./faiss_index"
+    faiss_index_factory: str = "Flat"  # FAISS factory string for new indexes, e.g. "IVF1024,Flat", "HNSW32", "IVF1024,PQ32"
+    faiss_nprobe: int = 16           # IVF lists probed per query
+    faiss_ef_search: int = 64        # HNSW search breadth
+    faiss_train_min: int = 0         # vectors buffered before training IVF/PQ; 0 = 39 per centroid
+    faiss_train_max: int = 100000    # training sample cap
+    faiss_shards: int = 1            # >1 partitions the index into independently saved shards
+    faiss_shard_by: str = "hash"     # hash (by chunk id) | source (all chunks of a file in one shard)
+    faiss_shard_workers: int = 0     # threads for parallel shard search; 0 = one per shard
+    faiss_mmap: bool = True          # memory-map the index read-only in API workers (shared page cache)
+    ingest_workers: int = 0          # 0 = os.cpu_count()
+    ingest_queue_size: int = 8       # file results buffered between ingest stages
+    embed_batch_size: int = 64
+    pdf_backend: str = "auto"        # auto (pypdfium2 if installed, else pdfplumber) | pypdfium2 | pdfplumber
+    pdf_workers: int = 0             # processes splitting one large PDF's pages; 0 = os.cpu_count(), 1 = serial; the indexer caps it at cpu_count // (files extracting at once)
+    pdf_parallel_min_pages: int = 32  # PDFs with fewer pages to extract are parsed serially
+    page_cache_path: str = "./page_cache/pages.sqlite"  # extracted PDF page text; empty disables
+    embedding_cache_dir: str = "./embedding_cache"  # empty disables the on-disk embedding cache
+    embedding_cache_dtype: str = "float16"
+    query_embedding_cache_size: int = 4096
+    faiss_checkpoint_every: int = 0  # chunks between intermediate index saves during ingest; 0 = save once at the end
+    fastvlm_checkpoint: str = ""     # FastVLM model dir for image captions; empty skips images
+    caption_prompt: str = "Describe tables, charts, and key numeric values from this image."
+    caption_batch_size: int = 8      # images per caption server request
+    caption_timeout_s: float = 60.0  # per image in a batch before the server is restarted
+    caption_cache_path: str = "./caption_cache/captions.sqlite"  # captions by image hash; empty disables
+    eval_llm_model: str = "llama3.1"  # RAGAS judge model (Ollama)
+    eval_embedding_model: str = ""   # empty = embedding_model
+    eval_workers: int = 4            # samples scored in parallel
+    eval_cache_path: str = "./eval_cache/ragas.sqlite"  # per-sample metric scores; empty disables
+    metrics_enabled: bool = True     # per-stage latency histograms at /metrics
+    trace_sample_rate: float = 0.0   # fraction of requests logged with a per-stage breakdown; X-Request-ID forces one
+    log_level: str = "INFO"          # DEBUG adds per-chunk retrieval and prompt preview lines
     openai_api_key: str = Field(default="")
 
     model_config = { "env_file": ".env", "case_sensitive": False }  # v2 style config
@@ -1,9 +1,10 @@
 import logging
 import sys
+from app.core.config import get_settings
 
 def setup_logging():
     logger = logging.getLogger("enterprise_rag")
-    logger.setLevel(logging.INFO)
+    logger.setLevel(get_settings().log_level.upper())
 
     if not logger.handlers:
         handler = logging.StreamHandler(sys.stdout)
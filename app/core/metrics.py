@@ -0,0 +1,236 @@
+# app/core/metrics.py
+"""
+Per-stage latency histograms and request-scoped traces for the query path.
+
+    with stage("bm25"):
+        hits = index.search(...)
+
+records the block's duration in the `rag_stage_seconds{stage="bm25"}` histogram. `render()` emits
+all histograms in the Prometheus text format (served at /metrics), so no client library is needed.
+
+A request is traced when it sends an X-Request-ID header or is sampled (`trace_sample_rate`). Its
+Trace lives in a context variable; every stage it passes through is also appended to the trace,
+and TraceMiddleware logs one `trace` line with the per-stage breakdown when the response is done.
+Thread pools do not inherit context variables, so work handed to an executor goes through
+`bind(fn)`.
+
+With `metrics_enabled` off, `stage` returns a shared no-op context manager, `bind` returns `fn`
+unchanged and the middleware passes requests straight through.
+"""
+from __future__ import annotations
+import contextvars
+import functools
+import random
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from app.core.config import get_settings
+from app.core.logging import setup_logging
+
+log = setup_logging()
+
+# Seconds; spans sub-millisecond BM25 lookups up to multi-minute generations
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+REQUEST_ID_HEADER = "x-request-id"
+
+
+class Histogram:
+    """Cumulative-bucket histogram with label values, thread-safe."""
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (last one is +Inf), sum]
+        self._series: Dict[Tuple[str, ...], List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    def count(self, *labels: str) -> int:
+        with self._lock:
+            series = self._series.get(labels)
+            return sum(series[0]) if series else 0
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = sorted((labels, list(s[0]), s[1]) for labels, s in self._series.items())
+        for labels, counts, total in snapshot:
+            base = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(self.labelnames, labels))
+            sep = "," if base else ""
+            cumulative = 0
+            for le, c in zip(self.buckets + (float("inf"),), counts):
+                cumulative += c
+                bound = "+Inf" if le == float("inf") else repr(le)
+                lines.append(f'{self.name}_bucket{{{base}{sep}le="{bound}"}} {cumulative}')
+            suffix = f"{{{base}}}" if base else ""
+            lines.append(f"{self.name}_sum{suffix} {total}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+STAGE_SECONDS = Histogram("rag_stage_seconds", "Duration of one query-path stage.", ("stage",))
+REQUEST_SECONDS = Histogram("rag_request_seconds", "HTTP request duration, body streaming included.", ("route", "status"))
+REGISTRY: List[Histogram] = [STAGE_SECONDS, REQUEST_SECONDS]
+
+
+class Trace:
+    __slots__ = ("id", "spans")
+
+    def __init__(self, trace_id: str):
+        self.id = trace_id
+        self.spans: List[Tuple[str, float]] = []
+
+    def summary(self) -> str:
+        """`name_ms=...` per stage in first-seen order; repeated stages are summed."""
+        totals: Dict[str, float] = {}
+        for name, seconds in self.spans:
+            totals[name] = totals.get(name, 0.0) + seconds
+        return " | ".join(f"{name}_ms={round(s * 1000, 1)}" for name, s in totals.items())
+
+
+_current: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("rag_trace", default=None)
+_NOOP = nullcontext()
+_config: Dict[str, Any] = {}
+
+
+def configure(enabled: Optional[bool] = None, sample_rate: Optional[float] = None):
+    """Override the settings (tests, benchmarks); unset values keep their current value."""
+    _load()
+    if enabled is not None:
+        _config["enabled"] = enabled
+    if sample_rate is not None:
+        _config["sample_rate"] = sample_rate
+
+
+def _load() -> Dict[str, Any]:
+    if not _config:
+        settings = get_settings()
+        _config.update(enabled=settings.metrics_enabled, sample_rate=settings.trace_sample_rate)
+    return _config
+
+
+def enabled() -> bool:
+    return (_config or _load())["enabled"]
+
+
+class _Stage:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def stage(name: str):
+    """Context manager timing one stage of the current request."""
+    return _Stage(name) if enabled() else _NOOP
+
+
+def observe(name: str, seconds: float):
+    """Record a stage duration measured elsewhere (e.g. time to first token)."""
+    if not enabled():
+        return
+    STAGE_SECONDS.observe(seconds, name)
+    trace = _current.get()
+    if trace is not None:
+        trace.spans.append((name, seconds))
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+def bind(fn: Callable) -> Callable:
+    """`fn` running in a copy of the caller's context, so executor threads record into its trace."""
+    if _current.get() is None:
+        return fn
+    return functools.partial(contextvars.copy_context().run, fn)
+
+
+def start_trace(request_id: Optional[str] = None) -> Optional[Trace]:
+    """A Trace for a request that sent an id or falls in the sample; None otherwise."""
+    if not enabled():
+        return None
+    if request_id:
+        return Trace(request_id[:128])
+    rate = _config["sample_rate"]
+    if rate > 0 and (rate >= 1 or random.random() < rate):
+        return Trace(uuid.uuid4().hex[:16])
+    return None
+
+
+def render() -> str:
+    lines: List[str] = []
+    for hist in REGISTRY:
+        lines.extend(hist.render())
+    return "\n".join(lines) + "\n"
+
+
+class TraceMiddleware:
+    """
+    ASGI middleware: request duration histogram by route and status, and the request's trace.
+    Pure ASGI rather than BaseHTTPMiddleware so streamed bodies are timed to their last byte.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not enabled():
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        request_id = next((v.decode("latin-1") for k, v in scope.get("headers", []) if k == REQUEST_ID_HEADER.encode()), None)
+        trace = start_trace(request_id)
+        token = _current.set(trace)
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                if trace is not None:
+                    message = {**message, "headers": [*message.get("headers", []), (REQUEST_ID_HEADER.encode(), trace.id.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _current.reset(token)
+            elapsed = time.perf_counter() - start
+            # Route template, not the raw path, keeps the label set bounded
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            REQUEST_SECONDS.observe(elapsed, route, str(status[0]))
+            if trace is not None:
+                log.info(
+                    f"trace | id={trace.id} | route={route} | status={status[0]}"
+                    f" | total_ms={round(elapsed * 1000, 1)} | {trace.summary()}"
+                )
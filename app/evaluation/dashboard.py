@@ -1,15 +1,29 @@
 # app/evaluation/dashboard.py
 import streamlit as st, json
-from app.evaluation.ragas_runner import evaluate_samples
+from app.evaluation.ragas_runner import aggregate, get_engine
 from dotenv import load_dotenv
 load_dotenv()
 st.title("RAG Evaluation Dashboard (RAGAS)")
 uploaded = st.file_uploader("Upload eval samples (JSONL)", type=["jsonl"])
 
 if uploaded:
-    samples = [json.loads(line) for line in uploaded.readlines()]
-    with st.spinner("Evaluating..."):
-        scores = evaluate_samples(samples)
-    st.json(scores)
+    samples = [json.loads(line) for line in uploaded.readlines() if line.strip()]
+    engine = get_engine()  # one warm engine per Streamlit server
+    st.caption(f"{len(samples)} samples | {engine.workers} workers | judge {engine.llm_model}")
+    progress = st.progress(0.0)
+    summary = st.empty()
+    table = st.empty()
+
+    # Scores arrive per sample as workers finish; cached samples show up immediately
+    rows = []
+    for row in engine.iter_scores(samples):
+        rows.append(row)
+        cached = sum(r["cached"] for r in rows)
+        progress.progress(len(rows) / len(samples), text=f"{len(rows)}/{len(samples)} scored ({cached} from cache)")
+        summary.json(aggregate(rows))
+        table.dataframe(
+            [{"sample": r["index"], **r["scores"], "cached": r["cached"]} for r in sorted(rows, key=lambda r: r["index"])],
+            use_container_width=True,
+        )
 
 #python -m streamlit run .\app\evaluation\dashboard.py
@@ -1,31 +1,207 @@
 # app/evaluation/ragas_runner.py
-from typing import List, Dict, Any
-from ragas import evaluate
-from ragas.metrics import faithfulness, answer_similarity, context_precision
-from datasets import Dataset
-from langchain_community.chat_models import ChatOllama
-from langchain.embeddings import HuggingFaceEmbeddings
+"""
+RAGAS evaluation engine: warm models, a per-sample score cache and parallel workers.
+
+Every sample is scored on its own (a one-row `ragas.evaluate`) on a pool of `eval_workers`
+threads, and `EvalEngine.iter_scores` yields each sample's scores as soon as it finishes. Scores
+are cached in SQLite under (sample hash, metric, model), so re-running an evaluation after editing
+one sample only scores that sample. The LLM, embeddings and metric objects are built once per
+engine; `get_engine()` keeps one engine per process (and per Streamlit server).
+"""
+from __future__ import annotations
+import copy
+import hashlib
+import json
+import math
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+from app.core.config import get_settings
+from app.core.logging import setup_logging
+
+log = setup_logging()
+
+METRICS = ("faithfulness", "answer_similarity", "context_precision")
+# (sample, metric names) -> {metric: score}; the default wraps ragas, tests pass their own
+Scorer = Callable[[Dict[str, Any], List[str]], Dict[str, Any]]
+
+
+def sample_hash(sample: Dict[str, Any]) -> str:
+    return hashlib.sha1(json.dumps(sample, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+
+def _clean(value: Any) -> Optional[float]:
+    """Float score, or None for a failed metric (ragas reports those as NaN)."""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(value) else value
+
+
+class ScoreCache:
+    """(sample hash, metric, model) -> score in SQLite, shared by the worker threads."""
+
+    def __init__(self, path: str | Path):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS scores (sample TEXT NOT NULL, metric TEXT NOT NULL, model TEXT NOT NULL,"
+                " score REAL NOT NULL, PRIMARY KEY (sample, metric, model)) WITHOUT ROWID"
+            )
+
+    def get(self, sample: str, model: str) -> Dict[str, float]:
+        with self._lock:
+            rows = self._conn.execute("SELECT metric, score FROM scores WHERE sample = ? AND model = ?", (sample, model)).fetchall()
+        return dict(rows)
+
+    def put(self, sample: str, model: str, scores: Dict[str, float]):
+        if not scores:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO scores (sample, metric, model, score) VALUES (?, ?, ?, ?)",
+                [(sample, metric, model, score) for metric, score in scores.items()],
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class EvalEngine:
+    def __init__(self, metrics: Sequence[str] = METRICS, llm_model: str | None = None, embedding_model: str | None = None,
+                 workers: int | None = None, cache_path: str | None = None, scorer: Scorer | None = None):
+        settings = get_settings()
+        self.metrics = list(metrics)
+        self.llm_model = llm_model or settings.eval_llm_model
+        self.embedding_model = embedding_model or settings.eval_embedding_model or settings.embedding_model
+        self.workers = max(1, workers or settings.eval_workers)
+        path = settings.eval_cache_path if cache_path is None else cache_path
+        self.cache = ScoreCache(path) if path else None
+        # Judge LLM and embedder both shape the scores, so both are part of the cache key
+        self.model_key = f"{self.llm_model}|{self.embedding_model}"
+        self._scorer = scorer
+        self._load_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ragas")
+
+    def _get_scorer(self) -> Scorer:
+        if self._scorer is not None:
+            return self._scorer
+        with self._load_lock:
+            if self._scorer is None:
+                self._scorer = self._ragas_scorer()
+        return self._scorer
+
+    def _ragas_scorer(self) -> Scorer:
+        from datasets import Dataset
+        from langchain_community.chat_models import ChatOllama
+        from langchain_huggingface import HuggingFaceEmbeddings
+        from ragas import evaluate
+        from ragas import metrics as ragas_metrics
+        from ragas.embeddings import LangchainEmbeddingsWrapper
+        from ragas.llms import LangchainLLMWrapper
+
+        start = time.perf_counter()
+        llm = LangchainLLMWrapper(ChatOllama(model=self.llm_model, base_url=get_settings().ollama_base_url))
+        embeddings = LangchainEmbeddingsWrapper(HuggingFaceEmbeddings(model_name=self.embedding_model))
+        # Private metric objects with their models attached up front: `evaluate` only assigns (and
+        # afterwards clears) models on metrics that have none, which races between worker threads
+        metrics: Dict[str, Any] = {}
+        for name in self.metrics:
+            metric = copy.deepcopy(getattr(ragas_metrics, name))
+            if hasattr(metric, "llm"):
+                metric.llm = llm
+            if hasattr(metric, "embeddings"):
+                metric.embeddings = embeddings
+            metrics[name] = metric
+        log.info(f"eval_models_loaded | llm={self.llm_model} | embeddings={self.embedding_model} | duration_ms={round((time.perf_counter() - start) * 1000, 1)}")
+
+        def score(sample: Dict[str, Any], names: List[str]) -> Dict[str, Any]:
+            result = evaluate(
+                Dataset.from_list([sample]),
+                metrics=[metrics[n] for n in names],
+                llm=llm,
+                embeddings=embeddings,
+                raise_exceptions=False,
+                show_progress=False,
+            )
+            return dict(result.scores[0])
+
+        return score
+
+    def _score_one(self, sample: Dict[str, Any], key: str, missing: List[str]) -> Dict[str, Optional[float]]:
+        start = time.perf_counter()
+        try:
+            raw = self._get_scorer()(sample, missing)
+        except Exception as e:
+            log.error(f"eval_sample_error | sample={key[:12]} | error={str(e)[:200]}")
+            raw = {}
+        scores = {m: _clean(raw.get(m)) for m in missing}
+        if self.cache is not None:
+            # Failed metrics are not cached, so the next run retries them
+            self.cache.put(key, self.model_key, {m: v for m, v in scores.items() if v is not None})
+        log.info(f"eval_sample | sample={key[:12]} | metrics={len(missing)} | duration_ms={round((time.perf_counter() - start) * 1000, 1)}")
+        return scores
+
+    def iter_scores(self, samples: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """
+        Yield {"index", "scores", "cached"} per sample as it finishes: fully cached samples first,
+        then the rest in completion order. Identical samples are scored once.
+        """
+        futures: Dict[str, Future] = {}
+        waiting: Dict[Future, List[tuple]] = {}
+        for i, sample in enumerate(samples):
+            key = sample_hash(sample)
+            cached = self.cache.get(key, self.model_key) if self.cache is not None else {}
+            missing = [m for m in self.metrics if m not in cached]
+            if not missing:
+                yield {"index": i, "scores": {m: cached[m] for m in self.metrics}, "cached": True}
+                continue
+            if key not in futures:
+                futures[key] = self._pool.submit(self._score_one, sample, key, missing)
+            waiting.setdefault(futures[key], []).append((i, cached))
+        try:
+            for future in as_completed(waiting):
+                fresh = future.result()
+                for i, cached in waiting[future]:
+                    merged = {**cached, **fresh}
+                    yield {"index": i, "scores": {m: merged.get(m) for m in self.metrics}, "cached": False}
+        finally:
+            # Abandoned run (e.g. a Streamlit rerun): drop samples that have not started
+            for future in waiting:
+                future.cancel()
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        if self.cache is not None:
+            self.cache.close()
+
+
+def aggregate(rows: Iterable[Dict[str, Any]]) -> Dict[str, float]:
+    """Mean of each metric over the samples where it succeeded."""
+    values: Dict[str, List[float]] = {}
+    for row in rows:
+        for metric, score in row["scores"].items():
+            bucket = values.setdefault(metric, [])
+            if score is not None:
+                bucket.append(score)
+    return {metric: sum(v) / len(v) if v else 0.0 for metric, v in values.items()}
+
+
+@lru_cache
+def get_engine() -> EvalEngine:
+    return EvalEngine()
+
 
 def evaluate_samples(samples: List[Dict[str, Any]]) -> Dict[str, float]:
-    dataset = Dataset.from_list(samples)
-
-    # Local LLM and embeddings
-    llm = ChatOllama(model="llama3.1")
-    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-
-    results = evaluate(
-        dataset,
-        metrics=[faithfulness, answer_similarity, context_precision],
-        llm=llm,
-        embeddings=embeddings
-    )
-    score_list = results.scores  # List of dicts
-    aggregated = {}
-    for metric_name in score_list[0].keys():
-        values = [sample[metric_name] for sample in score_list if sample[metric_name] is not None]
-        aggregated[metric_name] = sum(values) / len(values) if values else 0.0
-
-    return aggregated
+    return aggregate(get_engine().iter_scores(samples))
 
 
 #python -m streamlit run .\app\evaluation\dashboard.py
@@ -0,0 +1,178 @@
+# app/ingestion/captioner.py
+"""
+Image captioning for ingestion.
+
+A Captioner turns a batch of image paths into captions (None where one failed).
+SubprocessCaptioner keeps one caption server alive (app.scripts.caption_server by default), so
+the vision model loads once per ingest run instead of once per image. CaptionService sits in
+front of a Captioner: it dedupes images by content hash, answers repeats from CaptionCache and
+sends the rest in batches.
+"""
+from __future__ import annotations
+import json
+import queue
+import sqlite3
+import subprocess
+import sys
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Protocol, Sequence
+from app.core.config import get_settings
+from app.core.logging import setup_logging
+
+log = setup_logging()
+
+_EOF = object()
+
+
+class Captioner(Protocol):
+    def caption_batch(self, paths: List[str]) -> List[Optional[str]]: ...
+
+    def close(self) -> None: ...
+
+
+class CaptionCache:
+    """(image hash, model) -> caption in SQLite."""
+
+    def __init__(self, path: str | Path):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS captions (image TEXT NOT NULL, model TEXT NOT NULL, caption TEXT NOT NULL,"
+                " PRIMARY KEY (image, model)) WITHOUT ROWID"
+            )
+
+    def get_many(self, images: Sequence[str], model: str) -> Dict[str, str]:
+        out: Dict[str, str] = {}
+        with self._lock:
+            for image in images:
+                row = self._conn.execute("SELECT caption FROM captions WHERE image = ? AND model = ?", (image, model)).fetchone()
+                if row:
+                    out[image] = row[0]
+        return out
+
+    def put_many(self, captions: Dict[str, str], model: str):
+        if not captions:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO captions (image, model, caption) VALUES (?, ?, ?)",
+                [(image, model, caption) for image, caption in captions.items()],
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class SubprocessCaptioner:
+    """
+    Long-lived caption server speaking JSON lines: it prints {"ready": true} once its model is
+    loaded, then answers each {"images": [paths]} line with one {"captions": [...]} line.
+    A server that dies or misses its deadline is killed and restarted on the next batch.
+    """
+
+    def __init__(self, command: List[str], timeout_s: float = 60.0, load_timeout_s: float = 600.0):
+        self.command = command
+        self.timeout_s = timeout_s  # per image in a batch
+        self.load_timeout_s = load_timeout_s
+        self._proc: Optional[subprocess.Popen] = None
+        self._lines: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+
+    def _read(self, timeout: float) -> Dict:
+        line = self._lines.get(timeout=timeout)
+        if line is _EOF:
+            raise RuntimeError(f"caption server exited with code {self._proc.wait()}")
+        return json.loads(line)
+
+    def _start(self):
+        self._lines = queue.Queue()
+        self._proc = subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, bufsize=1)
+
+        def _pump(out, lines):
+            # Blocking reads stay on this thread, so requests can time out
+            for line in out:
+                lines.put(line)
+            lines.put(_EOF)
+
+        threading.Thread(target=_pump, args=(self._proc.stdout, self._lines), name="caption-reader", daemon=True).start()
+        if not self._read(self.load_timeout_s).get("ready"):
+            raise RuntimeError("caption server did not report ready")
+        log.info(f"caption_server_started | pid={self._proc.pid}")
+
+    def caption_batch(self, paths: List[str]) -> List[Optional[str]]:
+        with self._lock:
+            try:
+                if self._proc is None or self._proc.poll() is not None:
+                    self._start()
+                self._proc.stdin.write(json.dumps({"images": paths}) + "\n")
+                self._proc.stdin.flush()
+                captions = self._read(self.timeout_s * len(paths))["captions"]
+                return [(c or "").strip() or None for c in captions]
+            except Exception as e:
+                log.error(f"caption_error | images={len(paths)} | error={str(e) or type(e).__name__}")
+                self._kill()
+                return [None] * len(paths)
+
+    def _kill(self):
+        if self._proc is not None and self._proc.poll() is None:
+            self._proc.kill()
+            self._proc.wait()
+        self._proc = None
+
+    def close(self):
+        with self._lock:
+            if self._proc is not None and self._proc.poll() is None:
+                try:
+                    self._proc.stdin.close()  # EOF tells the server to exit
+                    self._proc.wait(timeout=10)
+                except Exception:
+                    pass
+            self._kill()
+
+
+class CaptionService:
+    def __init__(self, captioner: Captioner, model_key: str, cache_path: str = "", batch_size: int = 8):
+        self.captioner = captioner
+        self.model_key = model_key
+        self.cache = CaptionCache(cache_path) if cache_path else None
+        self.batch_size = max(1, batch_size)
+
+    def caption(self, images: List[Dict[str, str]]) -> List[Optional[str]]:
+        """Captions for [{"sha1", "file"}], in order; identical images are captioned once."""
+        by_hash = {img["sha1"]: img["file"] for img in images}
+        known = self.cache.get_many(list(by_hash), self.model_key) if self.cache else {}
+        todo = [h for h in by_hash if h not in known]
+        for start in range(0, len(todo), self.batch_size):
+            batch = todo[start:start + self.batch_size]
+            fresh = {h: c for h, c in zip(batch, self.captioner.caption_batch([by_hash[h] for h in batch])) if c}
+            if self.cache:
+                self.cache.put_many(fresh, self.model_key)
+            known.update(fresh)
+        if images:
+            log.info(f"captioned | images={len(images)} | cached={len(by_hash) - len(todo)} | new={len(todo)}")
+        return [known.get(img["sha1"]) for img in images]
+
+    def close(self):
+        self.captioner.close()
+        if self.cache:
+            self.cache.close()
+
+
+def open_captioner() -> Optional[CaptionService]:
+    """The FastVLM caption service, or None when no checkpoint is configured (images are skipped)."""
+    settings = get_settings()
+    if not settings.fastvlm_checkpoint:
+        return None
+    command = [sys.executable, "-m", "app.scripts.caption_server",
+               "--model-path", settings.fastvlm_checkpoint, "--prompt", settings.caption_prompt]
+    return CaptionService(
+        SubprocessCaptioner(command, timeout_s=settings.caption_timeout_s),
+        # The prompt shapes the captions as much as the model does
+        model_key=f"{settings.fastvlm_checkpoint}|{settings.caption_prompt}",
+        cache_path=settings.caption_cache_path,
+        batch_size=settings.caption_batch_size,
+    )
@@ -2,12 +2,15 @@
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from typing import Dict, Any, Iterable
 from app.core.logging import setup_logging
+from app.utils.tokens import count_tokens
 
 log = setup_logging()
 def make_text_splitter(max_tokens: int, overlap: int):
-    # Recursive splitter respects sentence/paragraph boundaries when possible
+    # Recursive splitter respects sentence/paragraph boundaries when possible;
+    # sizes are measured in tokens, not characters
     return RecursiveCharacterTextSplitter(
-        chunk_size=max_tokens, chunk_overlap=overlap, separators=["\n\n", "\n", ". ", " "]
+        chunk_size=max_tokens, chunk_overlap=overlap, separators=["\n\n", "\n", ". ", " "],
+        length_function=count_tokens,
     )
 
 def chunk_text_doc(doc: Dict[str, Any], splitter) -> Iterable[Dict[str, Any]]:
@@ -1,8 +1,230 @@
 # app/ingestion/loader.py
+from __future__ import annotations
+import importlib.util
+import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
 from pathlib import Path
-from typing import Iterable, Dict, Any
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 import pdfplumber
 from PIL import Image
+from app.core.config import get_settings
+from app.core.logging import setup_logging
+from app.ingestion.manifest import file_sha1
+from app.ingestion.page_cache import PageCache
+
+log = setup_logging()
+
+IMAGE_SUFFIXES = (".png", ".jpg", ".jpeg")
+
+# Bump when the post-processing in _clean changes, so cached page text is re-extracted
+EXTRACTOR_VERSION = 1
+
+
+class PlumberBackend:
+    """pdfplumber: layout-aware text, pure Python and slow on long documents."""
+
+    name = "pdfplumber"
+
+    @staticmethod
+    def version() -> str:
+        return pdfplumber.__version__
+
+    @staticmethod
+    def page_count(path: str) -> int:
+        with pdfplumber.open(path) as pdf:
+            return len(pdf.pages)
+
+    @staticmethod
+    def extract(path: str, first: int, last: int) -> List[str]:
+        """Text of pages first..last (1-based, inclusive)."""
+        out = []
+        with pdfplumber.open(path, pages=list(range(first, last + 1))) as pdf:
+            for page in pdf.pages:
+                out.append(page.extract_text() or "")
+                page.close()  # drop the parsed layout objects, so memory stays flat on long documents
+        return out
+
+
+class PdfiumBackend:
+    """pypdfium2: native PDFium text extraction, several times faster than pdfplumber."""
+
+    name = "pypdfium2"
+
+    @staticmethod
+    def version() -> str:
+        import pypdfium2
+        return f"{pypdfium2.PYPDFIUM_INFO}+{pypdfium2.PDFIUM_INFO}"
+
+    @staticmethod
+    def page_count(path: str) -> int:
+        import pypdfium2
+        pdf = pypdfium2.PdfDocument(path)
+        try:
+            return len(pdf)
+        finally:
+            pdf.close()
+
+    @staticmethod
+    def extract(path: str, first: int, last: int) -> List[str]:
+        import pypdfium2
+        out = []
+        pdf = pypdfium2.PdfDocument(path)
+        try:
+            for i in range(first - 1, last):
+                page = pdf[i]
+                textpage = page.get_textpage()
+                out.append(textpage.get_text_range())
+                textpage.close()
+                page.close()
+        finally:
+            pdf.close()
+        return out
+
+
+PDF_BACKENDS = {b.name: b for b in (PlumberBackend, PdfiumBackend)}
+
+
+def get_pdf_backend(name: str = "auto"):
+    if name == "auto":
+        name = PdfiumBackend.name if importlib.util.find_spec("pypdfium2") else PlumberBackend.name
+    if name not in PDF_BACKENDS:
+        raise ValueError(f"unknown pdf backend: {name} (expected auto or one of {sorted(PDF_BACKENDS)})")
+    return PDF_BACKENDS[name]
+
+
+def extractor_key(backend) -> str:
+    return f"{backend.name}-{backend.version()}-v{EXTRACTOR_VERSION}"
+
+
+def _clean(text: str) -> str:
+    # PDFium ends lines with \r\n; make both backends hand the splitter plain newlines
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+
+def page_workers_for(ingest_workers: int, queued: Optional[int] = None) -> int:
+    """
+    Page processes an ingest worker may start for its next file: the cores split between the files
+    that can be extracting at once, lowered further by `pdf_workers` if set. That is
+    `ingest_workers` while the queue is long, but only `queued` (the files left, this one included)
+    near its end, so a lone large PDF gets every core rather than one.
+    """
+    cores = os.cpu_count() or 1
+    active = max(1, min(ingest_workers, queued or ingest_workers))
+    share = max(1, cores // active)
+    return min(share, get_settings().pdf_workers or share)
+
+
+def _extract_range(backend_name: str, path: str, first: int, last: int) -> Tuple[int, List[str]]:
+    # Runs in a page worker process
+    return first, PDF_BACKENDS[backend_name].extract(path, first, last)
+
+
+_PAGE_POOL: Optional[Tuple[int, ProcessPoolExecutor]] = None
+
+
+def _page_pool(workers: int) -> ProcessPoolExecutor:
+    # Spawned like the ingest pool and kept for the process lifetime, so start-up is paid once, not per
+    # PDF; only replaced when a file is granted a different number of page workers
+    global _PAGE_POOL
+    if _PAGE_POOL is None or _PAGE_POOL[0] != workers:
+        if _PAGE_POOL is not None:
+            _PAGE_POOL[1].shutdown(wait=False, cancel_futures=True)
+        _PAGE_POOL = (workers, ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")))
+    return _PAGE_POOL[1]
+
+
+@lru_cache(maxsize=None)
+def _page_cache(path: str) -> PageCache:
+    return PageCache(path)
+
+
+def _ranges(pages: List[int], span: int) -> List[Tuple[int, int]]:
+    """Contiguous runs of `pages` (sorted), cut to at most `span` pages each."""
+    out: List[Tuple[int, int]] = []
+    for p in pages:
+        if out and out[-1][1] == p - 1 and out[-1][1] - out[-1][0] + 1 < span:
+            out[-1] = (out[-1][0], p)
+        else:
+            out.append((p, p))
+    return out
+
+
+def _extract_missing(backend, path: str, missing: List[int], workers: int, min_pages: int) -> Iterator[Tuple[int, List[str]]]:
+    """(first page, texts) per range, serially for short documents, else spread over the page pool."""
+    if workers <= 1 or len(missing) < min_pages:
+        for first, last in _ranges(missing, len(missing)):
+            yield first, backend.extract(path, first, last)
+        return
+    # A few ranges per worker evens out pages that are much slower than others
+    span = max(4, math.ceil(len(missing) / (workers * 4)))
+    pool = _page_pool(workers)
+    futures = [pool.submit(_extract_range, backend.name, path, first, last) for first, last in _ranges(missing, span)]
+    try:
+        for fut in as_completed(futures):
+            yield fut.result()
+    finally:
+        for fut in futures:
+            fut.cancel()
+
+
+def load_pdf_pages(path: str | Path, sha1: Optional[str] = None, backend: Optional[str] = None,
+                   workers: Optional[int] = None, min_pages: Optional[int] = None,
+                   cache_path: Optional[str] = None) -> Iterator[Tuple[int, str]]:
+    """
+    (page number, text) for every page of a PDF, in order.
+
+    Pages already in the page cache for this file content and extractor are not parsed again;
+    the rest are extracted serially, or split into page ranges across `workers` processes when at
+    least `min_pages` are missing. `sha1` saves re-hashing a file the caller already hashed.
+    """
+    settings = get_settings()
+    path = str(path)
+    impl = get_pdf_backend(backend or settings.pdf_backend)
+    workers = workers if workers is not None else (settings.pdf_workers or os.cpu_count() or 1)
+    min_pages = min_pages if min_pages is not None else settings.pdf_parallel_min_pages
+    cache_path = settings.page_cache_path if cache_path is None else cache_path
+    cache = _page_cache(cache_path) if cache_path else None
+    key = extractor_key(impl)
+
+    count, pages = None, {}
+    if cache:
+        sha1 = sha1 or file_sha1(Path(path))
+        count, pages = cache.get(sha1, key)
+    if count is None:
+        count = impl.page_count(path)
+        if cache:
+            cache.put_count(sha1, key, count)
+
+    missing = [p for p in range(1, count + 1) if p not in pages]
+    if missing:
+        t0 = time.perf_counter()
+        for first, texts in _extract_missing(impl, path, missing, workers, min_pages):
+            batch = [(first + i, _clean(t)) for i, t in enumerate(texts)]
+            pages.update(batch)
+            if cache:
+                # Saved per range, so an interrupted run keeps the pages it already paid for
+                cache.put(sha1, key, batch)
+        log.info(f"pdf_extracted | file={path} | backend={impl.name} | pages={count} | extracted={len(missing)} | ms={(time.perf_counter() - t0) * 1000:.1f}")
+    for p in range(1, count + 1):
+        yield p, pages[p]
+
+
+def load_document(path: str | Path, sha1: Optional[str] = None, pdf_workers: Optional[int] = None) -> Iterable[Dict[str, Any]]:
+    path = Path(path)
+    if path.suffix.lower() == ".pdf":
+        for page, text in load_pdf_pages(path, sha1=sha1, workers=pdf_workers):
+            yield {"type": "text", "content": text, "meta": {"file": str(path), "page": page}}
+    elif path.suffix.lower() in IMAGE_SUFFIXES:
+        img = Image.open(path).convert("RGB")
+        yield {"type": "image", "content": img, "meta": {"file": str(path)}}
+    else:
+        text = path.read_text(encoding="utf-8")
+        yield {"type": "text", "content": text, "meta": {"file": str(path)}}
+
 
 def load_documents(paths: list[str]) -> Iterable[Dict[str, Any]]:
     """
@@ -10,15 +232,4 @@ def load_documents(paths: list[str]) -> Iterable[Dict[str, Any]]:
     Supports: PDF pages (text), images (placeholder), and plain text files.
     """
     for p in paths:
-        path = Path(p)
-        if path.suffix.lower() == ".pdf":
-            with pdfplumber.open(str(path)) as pdf:
-                for i, page in enumerate(pdf.pages):
-                    text = page.extract_text() or ""
-                    yield {"type": "text", "content": text, "meta": {"file": str(path), "page": i+1}}
-        elif path.suffix.lower() in [".png", ".jpg", ".jpeg"]:
-            img = Image.open(path).convert("RGB")
-            yield {"type": "image", "content": img, "meta": {"file": str(path)}}
-        else:
-            text = path.read_text(encoding="utf-8")
-            yield {"type": "text", "content": text, "meta": {"file": str(path)}}
+        yield from load_document(p)
@@ -0,0 +1,104 @@
+# app/ingestion/manifest.py
+from __future__ import annotations
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from app.core.logging import setup_logging
+
+log = setup_logging()
+
+MANIFEST_VERSION = 1
+
+
+def file_sha1(path: Path, block_size: int = 1 << 20) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class IndexManifest:
+    """
+    Persisted record of what has been indexed: file -> content hash, size, mtime and chunk ids.
+    Lets index_documents skip unchanged files, replace the chunks of changed ones and purge deleted ones.
+    """
+
+    def __init__(self, path: str | Path, files: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.path = Path(path)
+        self.files: Dict[str, Dict[str, Any]] = files or {}
+
+    @classmethod
+    def load(cls, path: str | Path) -> "IndexManifest":
+        path = Path(path)
+        if not path.exists():
+            return cls(path)
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except Exception as e:
+            log.error(f"manifest_load_error | path={path} | error={str(e)}")
+            return cls(path)
+        if data.get("version") != MANIFEST_VERSION:
+            log.warning(f"manifest_version_mismatch | path={path} | version={data.get('version')}")
+            return cls(path)
+        return cls(path, data.get("files", {}))
+
+    def save(self, path: str | Path | None = None):
+        target = Path(path) if path else self.path
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_name(target.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "files": self.files}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, target)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self.files.get(key)
+
+    def chunk_ids(self, key: str) -> List[str]:
+        entry = self.files.get(key) or {}
+        return list(entry.get("chunk_ids", []))
+
+    def all_chunk_ids(self) -> List[str]:
+        return [cid for entry in self.files.values() for cid in entry.get("chunk_ids", [])]
+
+    @staticmethod
+    def stat_unchanged(entry: Dict[str, Any], stat: os.stat_result) -> bool:
+        # Cheap check first; only files whose size/mtime moved get re-hashed
+        return entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns
+
+    def touch(self, key: str, stat: os.stat_result):
+        entry = self.files[key]
+        entry["size"] = stat.st_size
+        entry["mtime_ns"] = stat.st_mtime_ns
+
+    def record(self, key: str, sha1: str, stat: os.stat_result, chunk_ids: List[str]):
+        self.files[key] = {
+            "sha1": sha1,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "chunk_ids": list(chunk_ids),
+        }
+
+    def mark_pending(self, key: str, chunk_id: str):
+        # Chunk written before its file finished: keep it purgeable and force a re-hash next run
+        entry = self.files.setdefault(key, {"sha1": None, "size": None, "mtime_ns": None, "chunk_ids": []})
+        entry["sha1"] = None
+        entry["size"] = None
+        entry["chunk_ids"].append(chunk_id)
+
+    def invalidate(self, key: str):
+        # Keep the entry (and its chunk ids) but force a re-hash, so the next run processes the file again
+        entry = self.files.get(key)
+        if entry:
+            entry["sha1"] = None
+            entry["size"] = None
+
+    def remove(self, key: str):
+        self.files.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self.files)
@@ -0,0 +1,53 @@
+# app/ingestion/page_cache.py
+from __future__ import annotations
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+
+class PageCache:
+    """
+    Extracted PDF page text in SQLite, keyed by (file hash, extractor, page).
+
+    `extractor` names the backend and its version, so upgrading or switching the parser misses
+    instead of serving stale text. Several ingest processes share the file; WAL lets them read
+    while one writes.
+    """
+
+    def __init__(self, path: str | Path):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), timeout=30.0, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS pages (file TEXT NOT NULL, extractor TEXT NOT NULL, page INTEGER NOT NULL,"
+                " text TEXT NOT NULL, PRIMARY KEY (file, extractor, page)) WITHOUT ROWID"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS files (file TEXT NOT NULL, extractor TEXT NOT NULL, pages INTEGER NOT NULL,"
+                " PRIMARY KEY (file, extractor)) WITHOUT ROWID"
+            )
+
+    def get(self, file: str, extractor: str) -> Tuple[Optional[int], Dict[int, str]]:
+        """(page count if known, {page: text}) for what is cached; pages are 1-based."""
+        with self._lock:
+            row = self._conn.execute("SELECT pages FROM files WHERE file = ? AND extractor = ?", (file, extractor)).fetchone()
+            pages = self._conn.execute("SELECT page, text FROM pages WHERE file = ? AND extractor = ?", (file, extractor)).fetchall()
+        return (row[0] if row else None), dict(pages)
+
+    def put_count(self, file: str, extractor: str, pages: int):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO files (file, extractor, pages) VALUES (?, ?, ?)", (file, extractor, pages))
+
+    def put(self, file: str, extractor: str, pages: Iterable[Tuple[int, str]]):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO pages (file, extractor, page, text) VALUES (?, ?, ?, ?)",
+                [(file, extractor, page, text) for page, text in pages],
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,252 @@
+# app/ingestion/streaming.py
+from __future__ import annotations
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from app.core.logging import setup_logging
+
+log = setup_logging()
+
+_DONE = object()
+
+
+class StageStats:
+    def __init__(self, name: str):
+        self.name = name
+        self.counts: Dict[str, int] = {}
+        self.busy_s = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, busy_s: float = 0.0, **counts: int):
+        with self._lock:
+            self.busy_s += busy_s
+            for unit, n in counts.items():
+                self.counts[unit] = self.counts.get(unit, 0) + n
+
+
+class IngestStats:
+    """Per-stage throughput of a streaming ingest run (items, busy time, items/s over wall time)."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+        self.extract = StageStats("extract")
+        self.caption = StageStats("caption")
+        self.embed = StageStats("embed")
+        self.write = StageStats("write")
+
+    @property
+    def wall_s(self) -> float:
+        return (self.finished or time.perf_counter()) - self.started
+
+    def report(self) -> Dict[str, Any]:
+        wall = max(self.wall_s, 1e-9)
+        out: Dict[str, Any] = {"wall_s": round(wall, 3)}
+        for stage in (self.extract, self.caption, self.embed, self.write):
+            if stage is self.caption and not stage.counts:
+                continue
+            out[stage.name] = {
+                "busy_s": round(stage.busy_s, 3),
+                **stage.counts,
+                **{f"{unit}_per_s": round(n / wall, 2) for unit, n in stage.counts.items()},
+            }
+        return out
+
+    def log_report(self):
+        for name, rep in self.report().items():
+            if isinstance(rep, dict):
+                fields = " | ".join(f"{k}={v}" for k, v in rep.items())
+                log.info(f"ingest_throughput | stage={name} | {fields}")
+
+
+def run_streaming_ingest(
+    tasks: Iterable[Dict[str, Any]],
+    extract: Callable[[Dict[str, Any]], Dict[str, Any]],
+    embed: Callable[[List[str]], List[List[float]]],
+    write: Callable[[List[Dict[str, Any]], List[List[float]]], None],
+    on_file_done: Callable[[Dict[str, Any]], None],
+    workers: int = 0,
+    embed_batch_size: int = 64,
+    queue_size: int = 8,
+    initializer: Optional[Callable] = None,
+    initargs: tuple = (),
+    caption: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+    caption_batch_size: int = 8,
+) -> IngestStats:
+    """
+    Bounded streaming pipeline: extract+chunk in a process pool -> batched embedding thread -> single writer.
+
+    `extract(task)` runs in a worker process and returns a result dict with "chunks_to_embed"
+    (list of {"id","text","meta"}), "pages" and "chunks" counts plus whatever the caller needs in
+    `on_file_done(result)`, which the writer calls once every chunk of that file has been written.
+    At most `queue_size` file results are buffered between stages, so memory stays flat.
+
+    Results listing "images" take a detour through `caption(results)` on its own thread, which
+    fills in their chunks; up to `caption_batch_size` images are captioned together while text
+    files keep flowing to the embedder.
+    """
+    stats = IngestStats()
+    workers = workers or os.cpu_count() or 1
+    chunk_q: "queue.Queue" = queue.Queue(maxsize=queue_size)
+    caption_q: "queue.Queue" = queue.Queue(maxsize=queue_size)
+    write_q: "queue.Queue" = queue.Queue(maxsize=queue_size)
+    errors: List[BaseException] = []
+    stop = threading.Event()
+
+    def _put(q: "queue.Queue", item):
+        # Blocking put that still notices when another stage failed
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.2)
+                return
+            except queue.Full:
+                continue
+
+    def _caption_loop():
+        pending: List[Dict[str, Any]] = []
+
+        def _flush():
+            t0 = time.perf_counter()
+            caption(pending)
+            stats.caption.add(time.perf_counter() - t0, images=sum(len(r["images"]) for r in pending))
+            for result in pending:
+                _put(chunk_q, result)
+            pending.clear()
+
+        try:
+            while not stop.is_set():
+                try:
+                    # A short wait for more images, then caption whatever has arrived
+                    item = caption_q.get(timeout=0.05 if pending else 0.2)
+                except queue.Empty:
+                    if pending:
+                        _flush()
+                    continue
+                if item is _DONE:
+                    break
+                pending.append(item)
+                if sum(len(r["images"]) for r in pending) >= caption_batch_size:
+                    _flush()
+            if pending and not stop.is_set():
+                _flush()
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+
+    def _embed_loop():
+        # (chunk, owning file result); a file is released to the writer with the batch holding its last chunk
+        pending: List[tuple] = []
+
+        def _flush(n: int):
+            batch = pending[:n]
+            del pending[:n]
+            texts = [c["text"] for c, _ in batch]
+            t0 = time.perf_counter()
+            vectors = embed(texts)
+            stats.embed.add(time.perf_counter() - t0, embeddings=len(texts))
+            done = []
+            for _, result in batch:
+                result["_remaining"] -= 1
+                if result["_remaining"] == 0:
+                    done.append(result)
+            _put(write_q, ([c for c, _ in batch], vectors, done))
+
+        try:
+            while not stop.is_set():
+                try:
+                    item = chunk_q.get(timeout=0.2)
+                except queue.Empty:
+                    continue
+                if item is _DONE:
+                    break
+                todo = item.get("chunks_to_embed") or []
+                if not todo:
+                    _put(write_q, ([], [], [item]))
+                    continue
+                item["_remaining"] = len(todo)
+                pending.extend((c, item) for c in todo)
+                while len(pending) >= embed_batch_size:
+                    _flush(embed_batch_size)
+            while pending and not stop.is_set():
+                _flush(embed_batch_size)
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            _put(write_q, _DONE)
+
+    def _write_loop():
+        try:
+            while not stop.is_set():
+                try:
+                    item = write_q.get(timeout=0.2)
+                except queue.Empty:
+                    continue
+                if item is _DONE:
+                    break
+                batch, vectors, done = item
+                t0 = time.perf_counter()
+                if batch:
+                    write(batch, vectors)
+                for result in done:
+                    on_file_done(result)
+                stats.write.add(time.perf_counter() - t0, chunks=len(batch), files=len(done))
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+
+    embedder = threading.Thread(target=_embed_loop, name="ingest-embed", daemon=True)
+    writer = threading.Thread(target=_write_loop, name="ingest-write", daemon=True)
+    captioner = threading.Thread(target=_caption_loop, name="ingest-caption", daemon=True) if caption else None
+    embedder.start()
+    writer.start()
+    if captioner:
+        captioner.start()
+
+    # Spawned workers avoid forking a process that already holds the embedding model and threads
+    ctx = multiprocessing.get_context("spawn")
+    max_inflight = workers * 2
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                                 initializer=initializer, initargs=initargs) as pool:
+            inflight = set()
+            task_iter = iter(tasks)
+            exhausted = False
+            while not stop.is_set():
+                while not exhausted and len(inflight) < max_inflight:
+                    task = next(task_iter, None)
+                    if task is None:
+                        exhausted = True
+                        break
+                    inflight.add(pool.submit(extract, task))
+                if not inflight:
+                    break
+                finished, inflight = wait(inflight, timeout=0.5, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    try:
+                        result = fut.result()
+                    except Exception as e:
+                        log.error(f"extract_error | error={str(e)}")
+                        continue
+                    stats.extract.add(result.get("extract_s", 0.0),
+                                      files=1, pages=result.get("pages", 0), chunks=result.get("chunks", 0))
+                    _put(caption_q if captioner and result.get("images") else chunk_q, result)
+            if stop.is_set():
+                for fut in inflight:
+                    fut.cancel()
+    finally:
+        if captioner:
+            _put(caption_q, _DONE)
+            captioner.join()
+        _put(chunk_q, _DONE)
+        embedder.join()
+        writer.join()
+        stats.finished = time.perf_counter()
+
+    if errors:
+        raise errors[0]
+    return stats
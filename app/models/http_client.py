@@ -0,0 +1,42 @@
+# app/models/http_client.py
+from __future__ import annotations
+from typing import Optional
+import httpx
+from app.core.config import get_settings
+from app.core.logging import setup_logging
+
+log = setup_logging()
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _build() -> httpx.AsyncClient:
+    s = get_settings()
+    limits = httpx.Limits(
+        max_connections=s.ollama_max_connections,
+        max_keepalive_connections=s.ollama_max_keepalive,
+        keepalive_expiry=s.ollama_keepalive_expiry_s,
+    )
+    timeout = httpx.Timeout(s.ollama_timeout_s, connect=s.ollama_connect_timeout_s)
+    log.info(f"http_client_open | max_connections={s.ollama_max_connections} | max_keepalive={s.ollama_max_keepalive}")
+    return httpx.AsyncClient(limits=limits, timeout=timeout)
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Process-wide pooled client for upstream model servers, created on first use."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build()
+    return _client
+
+
+async def open_http_client() -> httpx.AsyncClient:
+    return get_http_client()
+
+
+async def close_http_client():
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+        log.info("http_client_closed")
+    _client = None
@@ -1,10 +1,16 @@
 # app/models/llm_ollama.py
 
 from __future__ import annotations
+import hashlib
 import json
+import logging
 import httpx
-from typing import Optional
+from contextlib import aclosing
+from typing import AsyncIterator, List, Optional
 from app.core.config import get_settings
+from app.models.http_client import get_http_client
+from app.models.router import LLMRouter
+from app.utils.singleflight import SingleFlight
 from app.core.logging import setup_logging
 
 log = setup_logging()
@@ -14,46 +20,90 @@ def _join_url(base: str, path: str) -> str:
     path = path.lstrip("/")
     return f"{base}/{path}"
 
+def ollama_urls(settings) -> List[str]:
+    """`ollama_base_urls` (comma-separated) when set, else the single `ollama_base_url`."""
+    urls = [u.strip() for u in settings.ollama_base_urls.split(",") if u.strip()]
+    return urls or [settings.ollama_base_url]
+
 class OllamaLLM:
-    def __init__(self, client: Optional[httpx.AsyncClient] = None):
+    """
+    Ollama /api/generate client.
+
+    Uses the shared pooled httpx client (opened/closed by the API lifespan) unless one is injected.
+    Requests are spread over `ollama_base_urls` by an LLMRouter (balancing, failover, hedging,
+    circuit breaking). At most `ollama_max_concurrency` generations per node, hedged duplicates
+    included, are sent upstream at once; identical concurrent non-streaming prompts are coalesced
+    into a single upstream generation.
+    """
+
+    def __init__(self, client: Optional[httpx.AsyncClient] = None, urls: Optional[List[str]] = None):
         self.settings = get_settings()
-        self._client = client or httpx.AsyncClient(timeout=90.0)
+        self._own_client = client
+        urls = urls or ollama_urls(self.settings)
+        self.router = LLMRouter(
+            urls,
+            client_fn=lambda: self._client,
+            strategy=self.settings.llm_balancing,
+            hedge=self.settings.llm_hedge,
+            hedge_min_samples=self.settings.llm_hedge_min_samples,
+            hedge_min_delay_ms=self.settings.llm_hedge_min_delay_ms,
+            failure_threshold=self.settings.llm_circuit_failures,
+            cooldown_s=self.settings.llm_circuit_cooldown_s,
+            health_interval_s=self.settings.llm_health_interval_s,
+            max_concurrency=self.settings.ollama_max_concurrency,
+        )
+        self._flights = SingleFlight()
 
-    async def generate(self, prompt: str, stream: bool = False) -> str:
-        url = _join_url(self.settings.ollama_base_url, "/api/generate")
-        payload = {
+    async def start(self):
+        self.router.start()
+
+    async def aclose(self):
+        await self.router.stop()
+
+    @property
+    def _client(self) -> httpx.AsyncClient:
+        return self._own_client or get_http_client()
+
+    def _payload(self, prompt: str, stream: bool) -> dict:
+        return {
             "model": self.settings.ollama_model,
             "prompt": prompt,
+            "stream": stream,
         }
-        if not stream:
-            payload["stream"] = False
 
-        try:
-            log.info(f"ollama_prompt_preview: length={len(prompt)}, preview={prompt[:300]}")
-            log.info(f"ollama_request: url={url}, model={payload['model']}, stream={stream}")
-            resp = await self._client.post(url, json=payload)
-
-            if resp.status_code == 404:
-                log.error(f"ollama_404: url={url}, model={payload['model']}, detail={resp.text}")
-                resp.raise_for_status()
-            resp.raise_for_status()
+    async def generate(self, prompt: str, stream: bool = False) -> str:
+        if stream:
+            return "".join([token async for token in self.stream(prompt)])
+        if not self.settings.ollama_coalesce:
+            return await self._generate(prompt)
+        key = hashlib.sha1(f"{self.settings.ollama_model}\x00{prompt}".encode("utf-8")).hexdigest()
+        return await self._flights.do(key, lambda: self._generate(prompt))
 
-        except httpx.HTTPStatusError as e:
-            raise RuntimeError(f"Ollama HTTP error {e.response.status_code} at {url}: {e.response.text}") from e
-        except httpx.HTTPError as e:
-            raise RuntimeError(f"Ollama connection error at {url}: {e}") from e
+    async def _generate(self, prompt: str) -> str:
+        payload = self._payload(prompt, stream=False)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug(f"ollama_prompt_preview | length={len(prompt)} | preview={prompt[:300]}")
+        log.info(f"ollama_request: path=/api/generate, model={payload['model']}, stream=False")
+        data = await self.router.post_json("/api/generate", payload)
+        return data.get("response", "")
 
-        if stream:
-            full = []
-            async for line in resp.aiter_lines():
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        """Yield response tokens as Ollama produces them (NDJSON over a streamed response body)."""
+        payload = self._payload(prompt, stream=True)
+        log.info(f"ollama_request: path=/api/generate, model={payload['model']}, stream=True")
+        async with aclosing(self.router.stream_lines("/api/generate", payload)) as lines:
+            async for line in lines:
                 if not line:
                     continue
                 try:
                     obj = json.loads(line)
-                    full.append(obj.get("response", ""))
                 except json.JSONDecodeError:
                     log.error(f"ollama_stream_chunk_decode_error: {line}")
-            return "".join(full)
-
-        data = resp.json()
-        return data.get("response", "")
\ No newline at end of file
+                    continue
+                if obj.get("error"):
+                    raise RuntimeError(f"Ollama stream error: {obj['error']}")
+                token = obj.get("response", "")
+                if token:
+                    yield token
+                if obj.get("done"):
+                    break
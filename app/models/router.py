@@ -0,0 +1,354 @@
+# app/models/router.py
+from __future__ import annotations
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional
+import httpx
+from app.core.logging import setup_logging
+
+log = setup_logging()
+
+BALANCING_STRATEGIES = ("least_outstanding", "ewma")
+
+
+class NoHealthyEndpoint(RuntimeError):
+    pass
+
+
+class UpstreamError(RuntimeError):
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _percentile(values: Iterable[float], p: float) -> Optional[float]:
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))]
+
+
+class Endpoint:
+    """
+    One upstream node: load, latency history, concurrency slots and circuit-breaker state.
+
+    `latencies_ms` / `ewma_ms` hold full non-streaming request times, which drive balancing and the
+    hedge delay. Streams record time to first line in `ttft_ms` instead: it is orders of magnitude
+    shorter than a whole generation and would drag the hedge threshold down.
+    """
+
+    def __init__(self, url: str, ewma_alpha: float = 0.2, window: int = 200, max_concurrency: int = 0):
+        self.url = url.rstrip("/")
+        self.ewma_alpha = ewma_alpha
+        self.outstanding = 0
+        self.ewma_ms: Optional[float] = None
+        self.latencies_ms: deque = deque(maxlen=window)
+        self.ttft_ms: deque = deque(maxlen=window)
+        self.slots = asyncio.Semaphore(max_concurrency) if max_concurrency > 0 else None
+        self.consecutive_failures = 0
+        self.state = "closed"  # closed | open | half_open
+        self.opened_at = 0.0
+        self.healthy = True
+        self.stats = {"requests": 0, "failures": 0, "hedges": 0}
+
+    def available(self, now: float, cooldown_s: float) -> bool:
+        if not self.healthy:
+            return False
+        if self.state == "open":
+            if now - self.opened_at < cooldown_s:
+                return False
+            self.state = "half_open"
+            log.info(f"llm_circuit_half_open | url={self.url}")
+        # Half-open admits a single probe request at a time
+        return not (self.state == "half_open" and self.outstanding > 0)
+
+    def has_free_slot(self) -> bool:
+        return self.slots is None or not self.slots.locked()
+
+    @asynccontextmanager
+    async def slot(self):
+        """Holds one of the node's `max_concurrency` upstream slots (no limit when unset)."""
+        if self.slots is None:
+            yield
+            return
+        async with self.slots:
+            yield
+
+    def record_ttft(self, ttft_ms: float):
+        self.ttft_ms.append(ttft_ms)
+        self.record_success(None)
+
+    def record_success(self, latency_ms: Optional[float]):
+        if latency_ms is not None:
+            self.latencies_ms.append(latency_ms)
+            self.ewma_ms = latency_ms if self.ewma_ms is None else (
+                self.ewma_alpha * latency_ms + (1 - self.ewma_alpha) * self.ewma_ms)
+        self.consecutive_failures = 0
+        if self.state != "closed":
+            log.info(f"llm_circuit_closed | url={self.url}")
+        self.state = "closed"
+
+    def record_failure(self, threshold: int):
+        self.stats["failures"] += 1
+        self.consecutive_failures += 1
+        if self.state == "half_open" or (self.state == "closed" and self.consecutive_failures >= threshold):
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            log.warning(f"llm_circuit_open | url={self.url} | consecutive_failures={self.consecutive_failures}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "circuit": self.state,
+            "outstanding": self.outstanding,
+            "ewma_ms": round(self.ewma_ms, 1) if self.ewma_ms is not None else None,
+            "p95_ms": _percentile(self.latencies_ms, 95),
+            "ttft_p95_ms": _percentile(self.ttft_ms, 95),
+            **self.stats,
+        }
+
+
+class LLMRouter:
+    """
+    Spreads requests over several model-server endpoints.
+
+    - Balancing: `least_outstanding` (fewest in-flight, EWMA latency as tie-break) or `ewma`
+      (lowest EWMA latency scaled by in-flight load).
+    - Failover: a failed request is retried on the next best endpoint not yet tried.
+    - Circuit breaking: `failure_threshold` consecutive failures open a node for `cooldown_s`,
+      after which a single probe request decides whether it closes again.
+    - Hedging: a non-streaming request still running after the pool's recent p95 latency is
+      duplicated to a second node with a free slot; the first success wins and the other is cancelled.
+    - Concurrency: at most `max_concurrency` requests per node (0 = unlimited) are sent upstream at
+      once, hedged duplicates and streams included; the rest wait for a slot on their node.
+    - Health checks: a background task polls `health_path` on every node.
+    """
+
+    def __init__(self, urls: List[str], client_fn: Callable[[], httpx.AsyncClient],
+                 strategy: str = "least_outstanding", hedge: bool = True, hedge_percentile: float = 95.0,
+                 hedge_min_samples: int = 20, hedge_min_delay_ms: float = 0.0,
+                 failure_threshold: int = 3, cooldown_s: float = 30.0,
+                 health_interval_s: float = 10.0, health_path: str = "/api/tags", health_timeout_s: float = 2.0,
+                 max_concurrency: int = 0):
+        if not urls:
+            raise ValueError("LLMRouter needs at least one endpoint URL")
+        if strategy not in BALANCING_STRATEGIES:
+            raise ValueError(f"Unknown balancing strategy '{strategy}', expected one of {BALANCING_STRATEGIES}")
+        self.endpoints = [Endpoint(u, max_concurrency=max_concurrency) for u in urls]
+        self.client_fn = client_fn
+        self.strategy = strategy
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_min_delay_ms = hedge_min_delay_ms
+        self.failure_threshold = failure_threshold
+        self.cooldown_s = cooldown_s
+        self.health_interval_s = health_interval_s
+        self.health_path = health_path
+        self.health_timeout_s = health_timeout_s
+        self._health_task: Optional[asyncio.Task] = None
+
+    # ---- selection -------------------------------------------------------------------------
+
+    def _load_key(self, ep: Endpoint):
+        ewma = ep.ewma_ms if ep.ewma_ms is not None else 0.0
+        if self.strategy == "ewma":
+            return (ewma * (ep.outstanding + 1), ep.outstanding)
+        return (ep.outstanding, ewma)
+
+    def pick(self, exclude: Iterable[Endpoint] = (), free_only: bool = False) -> Endpoint:
+        now = time.monotonic()
+        excluded = set(map(id, exclude))
+        candidates = [ep for ep in self.endpoints if id(ep) not in excluded and ep.available(now, self.cooldown_s)
+                      and (not free_only or ep.has_free_slot())]
+        if not candidates:
+            raise NoHealthyEndpoint("No healthy LLM endpoint available")
+        return min(candidates, key=self._load_key)
+
+    def hedge_delay_s(self) -> Optional[float]:
+        if not self.hedge or len(self.endpoints) < 2:
+            return None
+        samples = [v for ep in self.endpoints for v in ep.latencies_ms]
+        if len(samples) < max(1, self.hedge_min_samples):
+            return None
+        return max(_percentile(samples, self.hedge_percentile), self.hedge_min_delay_ms) / 1000.0
+
+    # ---- requests --------------------------------------------------------------------------
+
+    def _send(self, ep: Endpoint, path: str, payload: Dict[str, Any]) -> asyncio.Future:
+        # Count the request against the node before yielding to the loop, so concurrent callers
+        # picking right after this one already see the extra load
+        ep.outstanding += 1
+        ep.stats["requests"] += 1
+        task = asyncio.ensure_future(self._post_once(ep, path, payload))
+
+        def _done(_):
+            ep.outstanding -= 1
+        task.add_done_callback(_done)
+        return task
+
+    async def _post_once(self, ep: Endpoint, path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            async with ep.slot():
+                # Latency is upstream service time; waiting for a slot is our own queue
+                start = time.perf_counter()
+                resp = await self.client_fn().post(f"{ep.url}{path}", json=payload)
+                if resp.status_code >= 400:
+                    raise UpstreamError(f"HTTP {resp.status_code} from {ep.url}: {resp.text[:300]}", resp.status_code)
+                data = resp.json()
+        except asyncio.CancelledError:
+            # Losing side of a hedge: neither a success nor the node's fault
+            raise
+        except UpstreamError as e:
+            ep.record_failure(self.failure_threshold)
+            log.warning(f"llm_endpoint_error | url={ep.url} | error={str(e)[:200]}")
+            raise
+        except (httpx.HTTPError, ValueError) as e:
+            ep.record_failure(self.failure_threshold)
+            log.warning(f"llm_endpoint_error | url={ep.url} | error={str(e)[:200]}")
+            raise UpstreamError(f"{type(e).__name__} from {ep.url}: {e}") from e
+        ep.record_success((time.perf_counter() - start) * 1000)
+        return data
+
+    async def _hedged(self, primary: Endpoint, path: str, payload: Dict[str, Any], tried: List[Endpoint]) -> Dict[str, Any]:
+        first = self._send(primary, path, payload)
+        delay = self.hedge_delay_s()
+        if delay is None:
+            return await first
+        try:
+            done, _ = await asyncio.wait({first}, timeout=delay)
+        except asyncio.CancelledError:
+            # asyncio.wait leaves its tasks running; an abandoned caller must not keep the request
+            # (and the node's outstanding count) alive
+            first.cancel()
+            raise
+        if done:
+            return first.result()
+        try:
+            # A duplicate queued behind a busy node would only add load, never win the race
+            backup = self.pick(exclude=tried, free_only=True)
+        except NoHealthyEndpoint:
+            return await first
+        tried.append(backup)
+        backup.stats["hedges"] += 1
+        log.info(f"llm_hedge | primary={primary.url} | backup={backup.url} | after_ms={round(delay * 1000, 1)}")
+        pending = {first, self._send(backup, path, payload)}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def post_json(self, path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """POST to the best endpoint, with hedging and failover across the pool."""
+        tried: List[Endpoint] = []
+        last_error: Optional[BaseException] = None
+        while True:
+            try:
+                ep = self.pick(exclude=tried)
+            except NoHealthyEndpoint:
+                if last_error is not None:
+                    raise last_error
+                raise
+            tried.append(ep)
+            try:
+                return await self._hedged(ep, path, payload, tried)
+            except UpstreamError as e:
+                last_error = e
+
+    async def stream_lines(self, path: str, payload: Dict[str, Any]) -> AsyncIterator[str]:
+        """
+        Streamed POST yielding response lines. Fails over to another endpoint only until the first
+        line has been yielded; after that errors propagate (tokens cannot be taken back).
+        """
+        tried: List[Endpoint] = []
+        last_error: Optional[BaseException] = None
+        while True:
+            try:
+                ep = self.pick(exclude=tried)
+            except NoHealthyEndpoint:
+                if last_error is not None:
+                    raise last_error
+                raise
+            tried.append(ep)
+            ep.outstanding += 1
+            ep.stats["requests"] += 1
+            started = False
+            try:
+                async with ep.slot():
+                    start = time.perf_counter()
+                    async with self.client_fn().stream("POST", f"{ep.url}{path}", json=payload) as resp:
+                        if resp.status_code >= 400:
+                            detail = (await resp.aread()).decode("utf-8", "replace")
+                            raise UpstreamError(f"HTTP {resp.status_code} from {ep.url}: {detail[:300]}", resp.status_code)
+                        async for line in resp.aiter_lines():
+                            if not started:
+                                started = True
+                                # Kept apart from unary latencies, which set the hedge delay and EWMA
+                                ep.record_ttft((time.perf_counter() - start) * 1000)
+                            yield line
+                if not started:
+                    ep.record_success(None)
+                return
+            except (httpx.HTTPError, UpstreamError) as e:
+                ep.record_failure(self.failure_threshold)
+                log.warning(f"llm_endpoint_error | url={ep.url} | stream=True | error={str(e)[:200]}")
+                if started:
+                    raise UpstreamError(f"Stream from {ep.url} broke: {e}") from e
+                last_error = e if isinstance(e, UpstreamError) else UpstreamError(f"{type(e).__name__} from {ep.url}: {e}")
+            finally:
+                ep.outstanding -= 1
+
+    # ---- health ----------------------------------------------------------------------------
+
+    async def check_health(self):
+        async def probe(ep: Endpoint):
+            try:
+                resp = await self.client_fn().get(f"{ep.url}{self.health_path}", timeout=self.health_timeout_s)
+                healthy = resp.status_code < 500
+            except httpx.HTTPError:
+                healthy = False
+            if healthy != ep.healthy:
+                log.warning(f"llm_endpoint_health | url={ep.url} | healthy={healthy}")
+            ep.healthy = healthy
+
+        await asyncio.gather(*(probe(ep) for ep in self.endpoints))
+
+    async def _health_loop(self):
+        while True:
+            try:
+                await self.check_health()
+            except Exception as e:
+                log.error(f"llm_health_loop_error | error={str(e)}")
+            await asyncio.sleep(self.health_interval_s)
+
+    def start(self):
+        if self._health_task is None and self.health_interval_s > 0 and len(self.endpoints) > 1:
+            self._health_task = asyncio.get_running_loop().create_task(self._health_loop())
+
+    async def stop(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        delay = self.hedge_delay_s()
+        return {
+            "strategy": self.strategy,
+            "hedge_delay_ms": round(delay * 1000, 1) if delay is not None else None,
+            "endpoints": [ep.snapshot() for ep in self.endpoints],
+        }
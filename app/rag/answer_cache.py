@@ -0,0 +1,139 @@
+# app/rag/answer_cache.py
+from __future__ import annotations
+import copy
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
+from app.core.logging import setup_logging
+
+log = setup_logging()
+
+
+def normalize_question(question: str) -> str:
+    """Case/whitespace/trailing-punctuation insensitive key for exact matches."""
+    return re.sub(r"[\s?!.]+$", "", " ".join(question.lower().split()))
+
+
+class AnswerCache:
+    """
+    Two-tier cache of final RAG answers.
+
+    Lookups try the normalized question first, then the nearest cached question by cosine
+    similarity of query embeddings (`threshold` and above). Entries expire after `ttl_s` and the
+    least recently used one is evicted beyond `max_entries`. The whole cache is dropped whenever
+    `version_fn()` changes, i.e. after `index_documents` saves a new index.
+    """
+
+    def __init__(self, embed_fn: Optional[Callable[[str], List[float]]], version_fn: Callable[[], Optional[str]],
+                 max_entries: int = 1024, ttl_s: float = 3600.0, threshold: float = 0.92):
+        self.embed_fn = embed_fn
+        self.version_fn = version_fn
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.threshold = threshold
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._version = version_fn()
+        self._lock = threading.Lock()
+        # Row-normalized embeddings of cached questions, rebuilt lazily after changes
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_keys: List[str] = []
+        self.stats = {"lookups": 0, "exact_hits": 0, "semantic_hits": 0, "misses": 0,
+                      "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _embed(self, question: str) -> Optional[np.ndarray]:
+        if self.embed_fn is None:
+            return None
+        vec = np.asarray(self.embed_fn(question), dtype=np.float32)
+        norm = float(np.linalg.norm(vec))
+        return vec / norm if norm > 0 else None
+
+    def _check_version(self):
+        version = self.version_fn()
+        if version != self._version:
+            if self._entries:
+                self.stats["invalidations"] += 1
+                log.info(f"answer_cache_invalidated | entries={len(self._entries)} | version={version}")
+            self._entries.clear()
+            self._matrix = None
+            self._version = version
+
+    def _drop(self, key: str):
+        self._entries.pop(key, None)
+        self._matrix = None
+
+    def _fresh(self, key: str, entry: Dict[str, Any], now: float) -> bool:
+        if now - entry["created"] <= self.ttl_s:
+            return True
+        self.stats["expirations"] += 1
+        self._drop(key)
+        return False
+
+    def _nearest(self, vec: np.ndarray) -> Tuple[Optional[str], float]:
+        if self._matrix is None:
+            keys = [k for k, e in self._entries.items() if e["vector"] is not None]
+            self._matrix_keys = keys
+            self._matrix = np.stack([self._entries[k]["vector"] for k in keys]) if keys else None
+        if self._matrix is None:
+            return None, 0.0
+        sims = self._matrix @ vec
+        i = int(np.argmax(sims))
+        return self._matrix_keys[i], float(sims[i])
+
+    def get(self, question: str) -> Optional[Dict[str, Any]]:
+        """Cached result for `question` (a copy, tagged with `cache`), or None."""
+        key = normalize_question(question)
+        now = time.time()
+        with self._lock:
+            self._check_version()
+            self.stats["lookups"] += 1
+            entry = self._entries.get(key)
+            if entry is not None and self._fresh(key, entry, now):
+                self._entries.move_to_end(key)
+                self.stats["exact_hits"] += 1
+                return {**copy.deepcopy(entry["result"]), "cache": "exact"}
+        vec = self._embed(question)
+        with self._lock:
+            if vec is not None and self._entries:
+                match, sim = self._nearest(vec)
+                entry = self._entries.get(match) if match else None
+                if entry is not None and sim >= self.threshold and self._fresh(match, entry, now):
+                    self._entries.move_to_end(match)
+                    self.stats["semantic_hits"] += 1
+                    log.info(f"answer_cache_semantic_hit | similarity={round(sim, 4)}")
+                    return {**copy.deepcopy(entry["result"]), "cache": "semantic"}
+            self.stats["misses"] += 1
+        return None
+
+    def put(self, question: str, result: Dict[str, Any]):
+        key = normalize_question(question)
+        vec = self._embed(question)
+        with self._lock:
+            self._check_version()
+            self._entries[key] = {"result": copy.deepcopy(result), "vector": vec, "created": time.time()}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+            self._matrix = None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self.stats["exact_hits"] + self.stats["semantic_hits"]
+            lookups = self.stats["lookups"]
+            return {
+                **self.stats,
+                "entries": len(self._entries),
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "index_version": self._version,
+            }
@@ -0,0 +1,122 @@
+# app/rag/context_budget.py
+from __future__ import annotations
+import re
+from typing import Any, Callable, Dict, List, Optional, Set
+from app.retrieval.bm25 import tokenize
+from app.utils.tokens import count_tokens
+from app.core.logging import setup_logging
+
+log = setup_logging()
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it of on or that the this to was what"
+    " when where which who why will with you your".split()
+)
+# Per-chunk overhead of format_context: "[i] ", "(source_id=...)" and the newline
+_LINE_OVERHEAD = 8
+
+
+def _shingles(text: str, n: int = 3) -> Set[tuple]:
+    words = tokenize(text)
+    if len(words) < n:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + n]) for i in range(len(words) - n + 1)}
+
+
+def _jaccard(a: Set[tuple], b: Set[tuple]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def split_sentences(text: str) -> List[str]:
+    return [s.strip() for s in _SENTENCE_END.split(text) if s.strip()]
+
+
+class ContextBudget:
+    """
+    Turns ranked retrieval results into the evidence block for the prompt.
+
+    1. Near-duplicates (word 3-gram Jaccard >= `dedupe_threshold`) are dropped, keeping the
+       better-ranked copy.
+    2. Chunks are packed greedily in rank order until `budget_tokens` is spent or `max_chunks`
+       are taken; a chunk that does not fit is skipped so a smaller, lower-ranked one still can.
+    3. With `trim`, a chunk that does not fit is first cut down to its query-relevant sentences
+       (by query term overlap, kept in original order).
+    """
+
+    def __init__(self, budget_tokens: int = 1200, max_chunks: int = 6, dedupe_threshold: float = 0.8,
+                 trim: bool = True, counter: Optional[Callable[[str], int]] = None):
+        self.budget_tokens = budget_tokens
+        self.max_chunks = max_chunks
+        self.dedupe_threshold = dedupe_threshold
+        self.trim = trim
+        self.count = counter or count_tokens
+
+    def _cost(self, chunk: Dict[str, Any]) -> int:
+        meta = chunk.get("meta") or {}
+        source = f"{meta.get('file', meta.get('id', ''))}#p{meta.get('page', '')}"
+        return self.count(chunk.get("text", "")) + self.count(source) + _LINE_OVERHEAD
+
+    def dedupe(self, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        kept: List[Dict[str, Any]] = []
+        kept_shingles: List[Set[tuple]] = []
+        for ch in chunks:
+            sh = _shingles(ch.get("text", ""))
+            if any(_jaccard(sh, other) >= self.dedupe_threshold for other in kept_shingles):
+                continue
+            kept.append(ch)
+            kept_shingles.append(sh)
+        return kept
+
+    def trim_to_query(self, question: str, chunk: Dict[str, Any], budget: int) -> Optional[Dict[str, Any]]:
+        """The chunk cut to its most query-relevant sentences within `budget` tokens, or None."""
+        sentences = split_sentences(chunk.get("text", ""))
+        if len(sentences) < 2:
+            return None
+        terms = set(tokenize(question)) - _STOPWORDS
+        scored = sorted(
+            range(len(sentences)),
+            key=lambda i: (-len(terms & set(tokenize(sentences[i]))), i),
+        )
+        overhead = self._cost({**chunk, "text": ""})
+        chosen: List[int] = []
+        used = overhead
+        for i in scored:
+            if terms and not (terms & set(tokenize(sentences[i]))):
+                break
+            cost = self.count(sentences[i]) + 1
+            if used + cost > budget:
+                continue
+            chosen.append(i)
+            used += cost
+        if not chosen:
+            return None
+        text = " ".join(sentences[i] for i in sorted(chosen))
+        return {**chunk, "text": text, "meta": {**(chunk.get("meta") or {}), "trimmed": True}}
+
+    def pack(self, question: str, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        unique = self.dedupe(chunks)
+        packed: List[Dict[str, Any]] = []
+        used = 0
+        trimmed = 0
+        for ch in unique:
+            if len(packed) >= self.max_chunks:
+                break
+            remaining = self.budget_tokens - used
+            cost = self._cost(ch)
+            if cost > remaining and self.trim:
+                cut = self.trim_to_query(question, ch, remaining)
+                if cut is not None:
+                    ch, cost = cut, self._cost(cut)
+                    trimmed += 1
+            if cost > remaining:
+                continue
+            packed.append(ch)
+            used += cost
+        log.info(
+            f"context_packed | candidates={len(chunks)} | duplicates={len(chunks) - len(unique)}"
+            f" | packed={len(packed)} | trimmed={trimmed} | tokens={used} | budget={self.budget_tokens}"
+        )
+        return packed
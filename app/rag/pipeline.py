@@ -1,55 +1,273 @@
 # app/rag/pipeline.py
 from __future__ import annotations
-from typing import Dict, Any, List
+from typing import Dict, Any, List, AsyncIterator, Optional, Tuple
 from app.retrieval.hybrid_retriever import HybridRetriever
+from app.retrieval.async_retriever import AsyncRetriever, RetrievalOverloaded
+from app.rag.answer_cache import AnswerCache
+from app.rag.context_budget import ContextBudget
+from app.core.config import get_settings
 from app.models.llm_ollama import OllamaLLM
 from app.models.prompts import RAG_PROMPT
 from app.rag.citations import format_context, attach_citations
 from app.rag.guardrails import confidence_score, hallucination_flag
 from app.core.logging import setup_logging
+from app.core.metrics import observe, stage
+import asyncio
+import logging
+import time
+from contextlib import aclosing
 import traceback
 
 log = setup_logging()
 
+
+def _ms_since(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 1)
+
+
+def _sources(retrieved: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [{"source": (ch.get("meta") or {}).get("file", (ch.get("meta") or {}).get("id", "unknown")),
+             "page": (ch.get("meta") or {}).get("page"), "score": ch.get("score")} for ch in retrieved]
+
 class RAGPipeline:
     def __init__(self, retriever: HybridRetriever | None = None, llm: OllamaLLM | None = None):
         self.retriever = retriever or HybridRetriever()
+        # Retrieval is CPU-bound; run it off the event loop with bounded concurrency
+        self.async_retriever = AsyncRetriever(self.retriever)
         self.llm = llm or OllamaLLM()
+        settings = get_settings()
+        self.context_budget = ContextBudget(
+            budget_tokens=settings.context_token_budget,
+            max_chunks=settings.context_max_chunks,
+            dedupe_threshold=settings.context_dedupe_threshold,
+            trim=settings.context_trim_sentences,
+        )
+        self.answer_cache: AnswerCache | None = None
+        if settings.answer_cache_size > 0:
+            self.answer_cache = AnswerCache(
+                embed_fn=self.retriever.store.embedding_model.embed_query,
+                # The version the retriever serves, not the one on disk: answers must match their evidence
+                version_fn=lambda: self.retriever.version,
+                max_entries=settings.answer_cache_size,
+                ttl_s=settings.answer_cache_ttl_s,
+                threshold=settings.answer_cache_similarity,
+            )
 
-    async def run(self, question: str) -> Dict[str, Any]:
-        print("inside retrieval")
-        retrieved: List[Dict[str, Any]] = self._safe_retrieve(question)[:3]
-        print("retrieved chunks:", len(retrieved))
-        print("----------------------------")
+    async def _sync_index(self):
+        # A cheap VERSION read per request; the reload itself runs off the event loop
+        if self.retriever.stale():
+            await asyncio.to_thread(self.retriever.refresh)
 
-        for i, ch in enumerate(retrieved):
-            text_len = len(ch.get("text", ""))
-            log.info(f"retrieved_chunk: index={i}, length={text_len}, score={ch.get('score')}, source={ch.get('meta', {}).get('file', ch.get('meta', {}).get('id', 'unknown'))}")
+    def _cache_for(self, filters: Optional[Dict[str, Any]]) -> AnswerCache | None:
+        # Cached answers are keyed by question alone; a filtered query may need different evidence
+        return self.answer_cache if not filters else None
 
-        context_block: str = format_context(retrieved)
-        print("Formatted context block:", context_block[:300])
+    async def run(self, question: str, filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        await self._sync_index()
+        cache = self._cache_for(filters)
+        if cache is not None:
+            with stage("answer_cache"):
+                cached = await asyncio.to_thread(cache.get, question)
+            if cached is not None:
+                log.info(f"answer_cache_hit | tier={cached['cache']}")
+                return cached
 
-        prompt: str = RAG_PROMPT.format(question=question, context=context_block)
-        log.info(f"prompt_preview: length={len(prompt)}, preview={prompt[:120]}")
-        print("Prompt preview:", prompt[:120])
+        result = await self._run(question, filters)
+        # Only cache grounded answers; failures and empty retrievals should be retried
+        if cache is not None and result["retrieved"] and not result.get("error"):
+            await asyncio.to_thread(cache.put, question, result)
+        return result
+
+    async def _run(self, question: str, filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        retrieved, prompt = await self._prepare(question, filters)
+        return await self._generate(retrieved, prompt)
 
+    async def _generate(self, retrieved: List[Dict[str, Any]], prompt: str) -> Dict[str, Any]:
         try:
-            answer_raw: str = await self.llm.generate(prompt)
-            print("LLM raw answer:", answer_raw[:300])
+            with stage("llm_total"):
+                answer_raw: str = await self.llm.generate(prompt)
         except Exception as e:
-            log.error("llm_generate_error", extra={"error": str(e)})
+            log.error(f"llm_generate_error | error={str(e)}")
             traceback.print_exc()
-            return {
-                "answer": "LLM failed to generate response.",
-                "confidence": 0.0,
-                "hallucination_flag": True,
-                "retrieved": retrieved,
-            }
+            return self._llm_failure(retrieved)
+
+        return self._finalize(answer_raw, retrieved)
+
+    async def run_stream(self, question: str, filters: Optional[Dict[str, Any]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Streaming variant of `run`. Yields events:
+          {"event": "context", ...} once retrieval is done (sources only),
+          {"event": "token", "text": ...} per generated token,
+          {"event": "done", ...} with the cited answer, confidence, flags and timings.
+        Retrieval overload is raised before the first event so callers can still reply 503.
+        """
+        start = time.perf_counter()
+        await self._sync_index()
+        cache = self._cache_for(filters)
+        if cache is not None:
+            with stage("answer_cache"):
+                cached = await asyncio.to_thread(cache.get, question)
+            if cached is not None:
+                log.info(f"answer_cache_hit | tier={cached['cache']}")
+                yield {"event": "context", "sources": _sources(cached["retrieved"])}
+                yield {"event": "token", "text": cached["answer"]}
+                yield {"event": "done", **cached, "ttft_ms": _ms_since(start), "total_ms": _ms_since(start)}
+                return
+
+        retrieved, prompt = await self._prepare(question, filters)
+        yield {"event": "context", "sources": _sources(retrieved)}
+
+        parts: List[str] = []
+        ttft_ms = None
+        llm_start = time.perf_counter()
+        try:
+            # Closed explicitly when the client goes away, so the upstream stream and its slot are freed now
+            async with aclosing(self.llm.stream(prompt)) as tokens:
+                async for token in tokens:
+                    if ttft_ms is None:
+                        ttft_ms = _ms_since(start)
+                        observe("llm_ttft", time.perf_counter() - llm_start)
+                        log.info(f"llm_first_token | ttft_ms={ttft_ms} | llm_ttft_ms={_ms_since(llm_start)}")
+                    parts.append(token)
+                    yield {"event": "token", "text": token}
+        except Exception as e:
+            log.error(f"llm_stream_error | error={str(e)} | tokens={len(parts)}")
+            yield {"event": "done", **self._llm_failure(retrieved), "ttft_ms": ttft_ms, "total_ms": _ms_since(start)}
+            return
+
+        observe("llm_total", time.perf_counter() - llm_start)
+        result = self._finalize("".join(parts), retrieved)
+        total_ms = _ms_since(start)
+        log.info(f"llm_stream_done | tokens={len(parts)} | ttft_ms={ttft_ms} | total_ms={total_ms}")
+        if cache is not None and result["retrieved"]:
+            await asyncio.to_thread(cache.put, question, result)
+        yield {"event": "done", **result, "ttft_ms": ttft_ms, "total_ms": total_ms}
+
+    async def run_many(self, questions: List[str], filters: Optional[Dict[str, Any]] = None) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+        """
+        Answer a batch of questions, yielding (index, result) in completion order.
+
+        Identical questions are answered once and yielded for every index that asked them.
+        Retrieval runs `batch_retrieval_size` questions at a time (one embedding pass, one FAISS
+        search); generations run at most `batch_generate_concurrency` at a time, and retrieval of
+        the next group overlaps them.
+        """
+        settings = get_settings()
+        positions: Dict[str, List[int]] = {}
+        for i, q in enumerate(questions):
+            positions.setdefault(q, []).append(i)
+        unique = list(positions)
+        await self._sync_index()
+        cache = self._cache_for(filters)
+        step = max(1, settings.batch_retrieval_size)
+        concurrency = settings.batch_generate_concurrency or 2 * settings.ollama_max_concurrency
+        slots = asyncio.Semaphore(concurrency)
+        done: asyncio.Queue = asyncio.Queue()
+        tasks: set = set()
+        log.info(f"batch_start | questions={len(questions)} | unique={len(unique)} | concurrency={concurrency}")
+
+        async def answer(question: str, retrieved: List[Dict[str, Any]]):
+            try:
+                async with slots:
+                    with stage("prompt_build"):
+                        retrieved, prompt = self._build_prompt(question, retrieved)
+                    result = await self._generate(retrieved, prompt)
+                if cache is not None and result["retrieved"] and not result.get("error"):
+                    await asyncio.to_thread(cache.put, question, result)
+            except Exception as e:
+                # One bad question must not stall or abort the rest of the batch
+                log.error(f"batch_item_error | error={str(e)}")
+                result = {"answer": "", "confidence": 0.0, "hallucination_flag": True, "retrieved": [], "error": "internal_error"}
+            await done.put((question, result))
+
+        async def produce():
+            try:
+                for start in range(0, len(unique), step):
+                    group = unique[start:start + step]
+                    if cache is not None:
+                        with stage("answer_cache"):
+                            hits = await asyncio.to_thread(lambda: [cache.get(q) for q in group])
+                        for q, hit in zip(group, hits):
+                            if hit is not None:
+                                await done.put((q, hit))
+                        group = [q for q, hit in zip(group, hits) if hit is None]
+                    for q, retrieved in zip(group, await self._retrieve_group(group, filters)):
+                        task = asyncio.create_task(answer(q, retrieved))
+                        tasks.add(task)
+                        task.add_done_callback(tasks.discard)
+                    # Keep retrieval at most one group ahead of generation
+                    while len(tasks) > concurrency:
+                        await asyncio.wait(set(tasks), return_when=asyncio.FIRST_COMPLETED)
+            except Exception as e:
+                await done.put((None, e))
+
+        producer = asyncio.create_task(produce())
+        try:
+            for _ in range(len(unique)):
+                question, result = await done.get()
+                if question is None:
+                    raise result
+                for i in positions[question]:
+                    yield i, result
+        finally:
+            # The caller went away (client disconnect) or failed: stop scheduling, and cancel pending
+            # generations; a coalesced Ollama request is cancelled once no other caller still waits on it
+            producer.cancel()
+            for task in list(tasks):
+                task.cancel()
+
+    async def _retrieve_group(self, questions: List[str], filters: Optional[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        if not questions:
+            return []
+        while True:
+            try:
+                batches = await self.async_retriever.retrieve_many(questions, filters=filters)
+                return [self._normalize(results or []) for results in batches]
+            except RetrievalOverloaded as e:
+                # A batch job waits for capacity instead of failing; interactive queries keep priority
+                log.warning(f"batch_retrieval_backoff | queries={len(questions)} | retry_after_s={e.retry_after_s}")
+                await asyncio.sleep(e.retry_after_s)
+            except Exception as e:
+                log.error(f"retrieval_error | queries={len(questions)} | error={str(e)}")
+                traceback.print_exc()
+                return [[] for _ in questions]
+
+    async def _prepare(self, question: str, filters: Optional[Dict[str, Any]] = None) -> Tuple[List[Dict[str, Any]], str]:
+        candidates = await self._safe_retrieve(question, filters)
+        with stage("prompt_build"):
+            return self._build_prompt(question, candidates)
+
+    def _build_prompt(self, question: str, candidates: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], str]:
+        # Token-budgeted, deduplicated evidence instead of a fixed number of whole chunks
+        retrieved: List[Dict[str, Any]] = self.context_budget.pack(question, candidates)
+        context_block: str = format_context(retrieved)
+        prompt: str = RAG_PROMPT.format(question=question, context=context_block)
+
+        # Per-chunk lines and prompt text are only formatted when DEBUG logging is on
+        if log.isEnabledFor(logging.DEBUG):
+            for i, ch in enumerate(retrieved):
+                meta = ch.get("meta", {})
+                log.debug(f"retrieved_chunk | index={i} | length={len(ch.get('text', ''))} | score={ch.get('score')} | source={meta.get('file', meta.get('id', 'unknown'))}")
+            log.debug(f"prompt_preview | length={len(prompt)} | preview={prompt[:120]}")
+        log.info(f"prompt_ready | chunks={len(retrieved)} | length={len(prompt)}")
+        return retrieved, prompt
+
+    @staticmethod
+    def _llm_failure(retrieved: List[Dict[str, Any]]) -> Dict[str, Any]:
+        return {
+            "answer": "LLM failed to generate response.",
+            "confidence": 0.0,
+            "hallucination_flag": True,
+            "retrieved": retrieved,
+            "error": "llm_generate_error",
+        }
 
+    def _finalize(self, answer_raw: str, retrieved: List[Dict[str, Any]]) -> Dict[str, Any]:
         try:
-            answer_cited: str = attach_citations(answer_raw or "", retrieved)
+            with stage("citations"):
+                answer_cited: str = attach_citations(answer_raw or "", retrieved)
         except Exception as e:
-            log.error("citation_error", extra={"error": str(e)})
+            log.error(f"citation_error | error={str(e)}")
             traceback.print_exc()
             answer_cited = answer_raw
 
@@ -63,17 +281,21 @@ class RAGPipeline:
             "retrieved": retrieved[:5],
         }
 
-    def _safe_retrieve(self, question: str) -> List[Dict[str, Any]]:
+    async def _safe_retrieve(self, question: str, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
         try:
-            results = self.retriever.retrieve(question) or []
-            log.info(f"retrieval_debug: {len(results)} results")
+            results = await self.async_retriever.retrieve(question, filters=filters) or []
+        except RetrievalOverloaded:
+            # Backpressure must reach the API layer, not degrade into an ungrounded answer
+            raise
         except Exception as e:
-            log.error("retrieval_error", extra={"error": str(e)})
+            log.error(f"retrieval_error | error={str(e)}")
             traceback.print_exc()
             return []
+        return self._normalize(results)
 
+    @staticmethod
+    def _normalize(results: List[Any]) -> List[Dict[str, Any]]:
         normalized: List[Dict[str, Any]] = []
-        print("retrieved chunks:", len(results))
         for r in results:
             text = r.get("text") if isinstance(r, dict) else None
             if not isinstance(text, str):
@@ -85,5 +307,6 @@ class RAGPipeline:
                 score = 0.0
             meta = r.get("meta") if isinstance(r.get("meta"), dict) else {}
             normalized.append({"text": text, "score": score, "meta": meta})
-        log.info(f"normalized_chunks: count={len(normalized)}")
+        if len(normalized) != len(results):
+            log.warning(f"retrieval_malformed | dropped={len(results) - len(normalized)}")
         return normalized
\ No newline at end of file
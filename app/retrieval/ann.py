@@ -0,0 +1,129 @@
+# app/retrieval/ann.py
+"""FAISS index-factory helpers: building id-mapped ANN indexes, training needs and search tunables."""
+from __future__ import annotations
+from typing import Optional
+import faiss
+import numpy as np
+from app.core.logging import setup_logging
+
+log = setup_logging()
+
+
+def build_index(factory: str, dim: int) -> faiss.Index:
+    """
+    An L2 index from a FAISS factory string ("Flat", "IVF4096,Flat", "IVF4096,PQ32", "HNSW32",
+    "IVF4096,SQ8", "HNSW32,SQfp16", ...), wrapped in IDMap2 so vectors carry stable int64 ids.
+    """
+    factory = factory.strip() or "Flat"
+    if not factory.startswith("IDMap"):
+        factory = f"IDMap2,{factory}"
+    return faiss.index_factory(dim, factory, faiss.METRIC_L2)
+
+
+def is_id_mapped(index: faiss.Index) -> bool:
+    return isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2))
+
+
+def base_index(index: faiss.Index) -> faiss.Index:
+    return faiss.downcast_index(index.index) if is_id_mapped(index) else index
+
+
+def min_train_points(index: faiss.Index) -> int:
+    """Vectors FAISS wants for a sound training run (39 per k-means centroid), 0 if untrained index is not needed."""
+    if index.is_trained:
+        return 0
+    need = 0
+    try:
+        need = faiss.extract_index_ivf(index).nlist * 39
+    except RuntimeError:
+        pass
+    inner = base_index(index)
+    pq = getattr(inner, "pq", None)
+    if pq is not None:
+        need = max(need, (1 << pq.nbits) * 39)
+    return max(need, 1)
+
+
+def train(index: faiss.Index, vectors: np.ndarray, max_points: int, seed: int = 1234) -> int:
+    """Train on at most `max_points` randomly sampled vectors; returns the sample size."""
+    if len(vectors) > max_points:
+        rng = np.random.default_rng(seed)
+        vectors = vectors[rng.choice(len(vectors), size=max_points, replace=False)]
+    index.train(np.ascontiguousarray(vectors, dtype=np.float32))
+    return len(vectors)
+
+
+def supports_remove(index: faiss.Index) -> bool:
+    # HNSW graphs cannot drop nodes; deletions there are tombstoned in the id map instead
+    return not isinstance(base_index(index), (faiss.IndexHNSW,))
+
+
+def apply_search_params(index: faiss.Index, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+    """Set runtime tunables that apply to this index type (nprobe for IVF, efSearch for HNSW)."""
+    params = faiss.ParameterSpace()
+    applied = []
+    for name, value in (("nprobe", nprobe), ("efSearch", ef_search)):
+        if not value:
+            continue
+        try:
+            params.set_index_parameter(index, name, value)
+            applied.append(f"{name}={value}")
+        except RuntimeError:
+            continue
+    if applied:
+        log.info(f"faiss_search_params | {' | '.join(applied)}")
+
+
+def stored_ids(index: faiss.Index) -> np.ndarray:
+    """int64 ids held by an IDMap/IDMap2 index (including ones only tombstoned in the caller's map)."""
+    return faiss.vector_to_array(index.id_map).astype(np.int64)
+
+
+def read_index(path: str, mmap: bool = False) -> faiss.Index:
+    """
+    Load a saved index. With `mmap` the vector codes are memory-mapped read-only instead of copied
+    to the heap, so load time and RSS stay flat and all processes share one page cache copy.
+    """
+    if mmap:
+        flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+        try:
+            return faiss.read_index(path, flags)
+        except RuntimeError as e:
+            log.warning(f"faiss_mmap_unsupported | path={path} | error={str(e)[:200]}")
+    return faiss.read_index(path)
+
+
+def _params(index: faiss.Index, sel: faiss.IDSelector, nprobe: Optional[int], ef_search: Optional[int]):
+    # Per-call parameters replace the index's own tunables, so carry nprobe/efSearch over
+    inner = base_index(index)
+    if isinstance(inner, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=sel, nprobe=min(inner.nlist, nprobe or inner.nprobe))
+    if isinstance(inner, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=sel, efSearch=ef_search or inner.hnsw.efSearch)
+    return faiss.SearchParameters(sel=sel)
+
+
+def filtered_search(index: faiss.Index, vectors: np.ndarray, k: int, allowed: np.ndarray,
+                    nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+    """
+    `index.search` restricted to the ids in `allowed` (pre-filter: FAISS skips everything else
+    while scanning). An approximate index can come back short when few allowed vectors sit in
+    the probed lists / visited graph; those rows are retried exhaustively (every IVF list, or an
+    HNSW beam widened to the filter's selectivity), so a query gets min(k, len(allowed)) hits.
+    """
+    allowed = np.ascontiguousarray(allowed, dtype=np.int64)
+    sel = faiss.IDSelectorBatch(allowed)
+    distances, labels = index.search(vectors, k, params=_params(index, sel, nprobe, ef_search))
+    want = min(k, len(allowed))
+    short = np.flatnonzero((labels >= 0).sum(axis=1) < want)
+    inner = base_index(index)
+    if len(short) and isinstance(inner, (faiss.IndexIVF, faiss.IndexHNSW)):
+        if isinstance(inner, faiss.IndexIVF):
+            params = faiss.SearchParametersIVF(sel=sel, nprobe=inner.nlist)
+        else:
+            widened = int(k * index.ntotal / max(len(allowed), 1))
+            params = faiss.SearchParametersHNSW(sel=sel, efSearch=min(index.ntotal, max(ef_search or 16, widened)))
+        d2, l2 = index.search(np.ascontiguousarray(vectors[short]), k, params=params)
+        distances[short], labels[short] = d2, l2
+        log.info(f"faiss_filter_retry | rows={len(short)} | allowed={len(allowed)}")
+    return distances, labels
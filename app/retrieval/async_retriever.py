@@ -0,0 +1,128 @@
+# app/retrieval/async_retriever.py
+from __future__ import annotations
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+from app.retrieval.hybrid_retriever import HybridRetriever
+from app.core.config import get_settings
+from app.core.logging import setup_logging
+from app.core.metrics import bind, observe
+
+log = setup_logging()
+
+
+class RetrievalOverloaded(RuntimeError):
+    """Raised when the retrieval queue is full or a request waited too long for a slot."""
+
+    def __init__(self, message: str, retry_after_s: float = 1.0):
+        super().__init__(message)
+        self.retry_after_s = retry_after_s
+
+
+class AsyncRetriever:
+    """
+    Event-loop friendly front for HybridRetriever.
+
+    Query embedding, FAISS search and BM25 scoring run on a bounded thread pool, with the vector
+    and lexical halves of a query in parallel. At most `max_concurrency` queries execute at once;
+    up to `max_queue` more may wait, each for at most `queue_timeout_s`. Anything beyond that is
+    rejected immediately with RetrievalOverloaded instead of growing an unbounded backlog.
+    """
+
+    def __init__(self, retriever: HybridRetriever | None = None, max_concurrency: int | None = None,
+                 max_queue: int | None = None, queue_timeout_s: float | None = None, workers: int | None = None):
+        settings = get_settings()
+        self.retriever = retriever or HybridRetriever()
+        self.max_concurrency = max_concurrency or settings.retrieval_concurrency
+        self.max_queue = settings.retrieval_max_queue if max_queue is None else max_queue
+        self.queue_timeout_s = settings.retrieval_queue_timeout_s if queue_timeout_s is None else queue_timeout_s
+        # Two threads per in-flight query: vector and lexical search
+        workers = workers or settings.retrieval_workers or self.max_concurrency * 2
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="retrieval")
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        self._waiting = 0
+        self._active = 0
+        self.stats = {"accepted": 0, "rejected_queue_full": 0, "rejected_timeout": 0}
+
+    @property
+    def queue_depth(self) -> int:
+        return self._waiting
+
+    def _overloaded(self, reason: str) -> RetrievalOverloaded:
+        self.stats[f"rejected_{reason}"] += 1
+        log.warning(f"retrieval_overloaded | reason={reason} | waiting={self._waiting} | max_queue={self.max_queue}")
+        return RetrievalOverloaded(f"Retrieval saturated ({reason})", retry_after_s=max(1.0, self.queue_timeout_s))
+
+    async def _acquire(self):
+        # Admission is decided synchronously (no await before the counters move), so a burst of
+        # coroutines scheduled in the same loop tick cannot all slip past the check
+        if self._active + self._waiting >= self.max_concurrency + self.max_queue:
+            raise self._overloaded("queue_full")
+        self._waiting += 1
+        acquired = False
+        try:
+            async with asyncio.timeout(self.queue_timeout_s):
+                await self._slots.acquire()
+                acquired = True
+        except BaseException as exc:
+            # A timeout or cancel can land just after the acquire went through; give the slot back
+            # here since the caller never reaches its release
+            if acquired:
+                self._slots.release()
+            if isinstance(exc, TimeoutError):
+                raise self._overloaded("timeout") from None
+            raise
+        finally:
+            self._waiting -= 1
+        self._active += 1
+        self.stats["accepted"] += 1
+
+    def _release(self):
+        self._active -= 1
+        self._slots.release()
+
+    async def retrieve(self, query: str, k: int | None = None, strategy: str | None = None,
+                       filters: Optional[Dict[str, Any]] = None) -> List[Dict]:
+        start = time.perf_counter()
+        await self._acquire()
+        queued_ms = (time.perf_counter() - start) * 1000
+        observe("retrieval_queue", queued_ms / 1000)
+        try:
+            k, fetch_k = self.retriever.fetch_sizes(k)
+            loop = asyncio.get_running_loop()
+            mask = None
+            if filters:
+                mask = await loop.run_in_executor(self._executor, bind(self.retriever.prefilter), filters)
+            vec, bm25 = await asyncio.gather(
+                loop.run_in_executor(self._executor, bind(self.retriever.vector_search), query, fetch_k, mask),
+                loop.run_in_executor(self._executor, bind(self.retriever.lexical_search), query, fetch_k, mask),
+            )
+            # Fusion and rerank are the retriever's own, so both paths rank identically
+            fused = await loop.run_in_executor(self._executor, bind(self.retriever._rank), query, vec, bm25, k, strategy)
+        finally:
+            self._release()
+        observe("retrieval", time.perf_counter() - start)
+        log.info(
+            f"async_retrieval | top_k={k} | vector={len(vec)} | bm25={len(bm25)} | fused={len(fused)}"
+            f" | queued_ms={round(queued_ms, 1)} | duration_ms={round((time.perf_counter() - start) * 1000, 1)}"
+        )
+        return fused
+
+    async def retrieve_many(self, queries: List[str], k: int | None = None, strategy: str | None = None,
+                            filters: Optional[Dict[str, Any]] = None) -> List[List[Dict]]:
+        """A batch of queries through one admission slot and one `HybridRetriever.retrieve_many` call."""
+        start = time.perf_counter()
+        await self._acquire()
+        observe("retrieval_queue", time.perf_counter() - start)
+        try:
+            loop = asyncio.get_running_loop()
+            results = await loop.run_in_executor(self._executor, bind(self.retriever.retrieve_many), queries, k, strategy, filters)
+        finally:
+            self._release()
+        observe("retrieval_batch", time.perf_counter() - start)
+        log.info(f"async_retrieval_batch | queries={len(queries)} | duration_ms={round((time.perf_counter() - start) * 1000, 1)}")
+        return results
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -1,39 +1,322 @@
-from typing import List, Dict
-from rank_bm25 import BM25Okapi
+from typing import List, Dict, Iterable, Optional, Tuple
+from collections import Counter
+from itertools import repeat
+from pathlib import Path
+import json
 import re
-import logging
+import threading
+import numpy as np
+from app.core.logging import setup_logging
+from app.retrieval.ids import chunk_int_ids
 
-log = logging.getLogger("app")
+log = setup_logging()
+
+# Directory (inside the FAISS index bundle) holding the persisted lexical index
+BM25_DIRNAME = "bm25"
+_ARRAYS = ("indptr", "post_docs", "post_tfs", "doc_len", "idf", "norm")
+# Per-document metadata columns (see app.retrieval.filters); absent in bundles saved before filters
+_FACET_ARRAYS = ("doc_file", "doc_page", "labels", "file_indptr", "file_docs")
 
 def tokenize(text: str) -> List[str]:
     # Simple tokenizer for BM25: lowercase alphanumerics
     return re.findall(r"[a-z0-9]+", text.lower())
 
+def _bytes_array(values: List[str]) -> np.ndarray:
+    if not values:
+        return np.zeros(0, dtype="S1")
+    return np.array([v.encode("utf-8") for v in values], dtype=bytes)
+
+class BM25Index:
+    """
+    Inverted BM25 index backed by flat NumPy arrays (CSC-style postings grouped by term).
+
+    Per-term IDF and per-document length norms are precomputed at commit time, so a query only
+    touches the postings of its own terms: cost is proportional to matched postings, not corpus size.
+    Adds and deletes are buffered and folded into the arrays by `commit()`, in the order they were made.
+    `save()`/`load()` persist it as .npy files that load memory-mapped, with the vocabulary and
+    doc ids as sorted/positional string arrays, so opening an index does no per-document work.
+
+    Alongside the postings it keeps per-document metadata columns over the same positions: source
+    file (code into the `files` table, with file -> positions postings), page and FAISS label.
+    These are the pre-filter index for metadata-filtered retrieval.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.vocab: Dict[str, int] = {}
+        self.doc_ids: List[str] = []
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.post_docs = np.zeros(0, dtype=np.int32)
+        self.post_tfs = np.zeros(0, dtype=np.float32)
+        self.doc_len = np.zeros(0, dtype=np.float32)
+        self.idf = np.zeros(0, dtype=np.float32)
+        self.norm = np.zeros(0, dtype=np.float32)
+        self.files: List[str] = []
+        self.doc_file = np.zeros(0, dtype=np.int32)
+        self.doc_page = np.zeros(0, dtype=np.int32)
+        self.labels = np.zeros(0, dtype=np.int64)
+        self.file_indptr = np.zeros(1, dtype=np.int64)
+        self.file_docs = np.zeros(0, dtype=np.int32)
+        self.has_facets = True
+        self._pending: List[Tuple[str, Counter, str, int]] = []
+        self._deleted: set = set()
+        self._lock = threading.Lock()
+        # Set when loaded from disk: sorted term array (term id = rank) instead of the vocab dict
+        self._terms: Optional[np.ndarray] = None
+
+    @classmethod
+    def build(cls, ids: Iterable[str], texts: Iterable[str], metas: Optional[Iterable[Dict]] = None, **kwargs) -> "BM25Index":
+        index = cls(**kwargs)
+        index.add(ids, texts, metas)
+        index.commit()
+        return index
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self._pending or self._deleted)
+
+    def clear(self):
+        self.__init__(k1=self.k1, b=self.b)
+
+    def add(self, ids: Iterable[str], texts: Iterable[str], metas: Optional[Iterable[Dict]] = None):
+        self._materialize()
+        metas = metas if metas is not None else repeat(None)
+        for doc_id, text, meta in zip(ids, texts, metas):
+            meta = meta or {}
+            page = meta.get("page")
+            self._pending.append((doc_id, Counter(tokenize(text)), str(meta.get("file") or ""),
+                                  int(page) if isinstance(page, (int, float)) else -1))
+
+    def delete(self, ids: Iterable[str]):
+        self._materialize()
+        ids = set(ids)
+        # Applies to what is committed or buffered so far; a later add of the same id survives
+        self._pending = [p for p in self._pending if p[0] not in ids]
+        self._deleted.update(ids)
+
+    def commit(self):
+        with self._lock:
+            if self.dirty:
+                self._commit()
+
+    def _commit(self):
+        n_old = len(self.doc_ids)
+        alive = np.ones(n_old, dtype=bool)
+        if self._deleted:
+            alive = np.fromiter((d not in self._deleted for d in self.doc_ids), dtype=bool, count=n_old)
+        pending = self._pending
+
+        # Existing postings as (term, doc, tf) triples, minus deleted docs, renumbered densely
+        old_terms = np.repeat(np.arange(len(self.indptr) - 1, dtype=np.int64), np.diff(self.indptr))
+        keep = alive[self.post_docs] if n_old else np.zeros(0, dtype=bool)
+        remap = np.cumsum(alive) - 1
+        terms_parts = [old_terms[keep]]
+        docs_parts = [remap[self.post_docs[keep]].astype(np.int32)]
+        tfs_parts = [self.post_tfs[keep]]
+        doc_ids = [d for d, a in zip(self.doc_ids, alive) if a]
+        lens = [self.doc_len[alive]]
+
+        base = len(doc_ids)
+        new_terms: List[int] = []
+        new_docs: List[int] = []
+        new_tfs: List[float] = []
+        new_lens: List[float] = []
+        for offset, (doc_id, counts, _, _) in enumerate(pending):
+            doc_ids.append(doc_id)
+            new_lens.append(float(sum(counts.values())))
+            for term, tf in counts.items():
+                tid = self.vocab.setdefault(term, len(self.vocab))
+                new_terms.append(tid)
+                new_docs.append(base + offset)
+                new_tfs.append(tf)
+        terms_parts.append(np.asarray(new_terms, dtype=np.int64))
+        docs_parts.append(np.asarray(new_docs, dtype=np.int32))
+        tfs_parts.append(np.asarray(new_tfs, dtype=np.float32))
+        lens.append(np.asarray(new_lens, dtype=np.float32))
+
+        terms = np.concatenate(terms_parts)
+        docs = np.concatenate(docs_parts)
+        tfs = np.concatenate(tfs_parts)
+        # Renumber terms by sorted spelling so the saved vocab is a searchable sorted array
+        n_terms = len(self.vocab)
+        sorted_terms = sorted(self.vocab)
+        rank = np.empty(n_terms, dtype=np.int64)
+        rank[np.fromiter((self.vocab[t] for t in sorted_terms), dtype=np.int64, count=n_terms)] = np.arange(n_terms)
+        terms = rank[terms]
+        self.vocab = {t: i for i, t in enumerate(sorted_terms)}
+        order = np.lexsort((docs, terms))
+        self.indptr = np.concatenate([[0], np.cumsum(np.bincount(terms, minlength=n_terms))]).astype(np.int64)
+        self.post_docs = docs[order]
+        self.post_tfs = tfs[order]
+        self.doc_ids = doc_ids
+        self.doc_len = np.concatenate(lens)
+        self._commit_facets(alive, pending)
+        self._pending = []
+        self._deleted = set()
+        self._refresh_stats()
+        log.info(f"bm25_commit | docs={len(self.doc_ids)} | terms={n_terms} | postings={len(self.post_docs)}")
+
+    def _commit_facets(self, alive: np.ndarray, pending: List[Tuple[str, Counter, str, int]]):
+        if not self.has_facets:
+            return
+        codes = {f: i for i, f in enumerate(self.files)}
+        new_files = [codes.setdefault(f, len(codes)) for _, _, f, _ in pending]
+        files = sorted(codes, key=codes.get)
+        doc_file = np.concatenate([self.doc_file[alive], np.asarray(new_files, dtype=np.int32)])
+        # Drop files that no longer have documents and renumber codes by sorted path
+        used, doc_file = np.unique(doc_file, return_inverse=True)
+        self.files = [files[i] for i in used]
+        self.doc_file = doc_file.astype(np.int32).reshape(-1)
+        self.doc_page = np.concatenate([self.doc_page[alive], np.asarray([p for *_, p in pending], dtype=np.int32)])
+        self.labels = np.concatenate([self.labels[alive], chunk_int_ids(d for d, *_ in pending)])
+        self.file_indptr = np.concatenate([[0], np.cumsum(np.bincount(self.doc_file, minlength=len(self.files)))]).astype(np.int64)
+        self.file_docs = np.argsort(self.doc_file, kind="stable").astype(np.int32)
+
+    def _refresh_stats(self):
+        n_docs = max(len(self.doc_ids), 1)
+        df = np.diff(self.indptr).astype(np.float32)
+        # Lucene-style IDF: always positive, so very common terms never subtract score
+        self.idf = np.log1p((n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+        avgdl = float(self.doc_len.mean()) if len(self.doc_len) else 1.0
+        self.norm = (self.k1 * (1 - self.b + self.b * self.doc_len / max(avgdl, 1e-9))).astype(np.float32)
+
+    def _materialize(self):
+        # A loaded index is read-only arrays; turn it back into mutable state before adds/deletes
+        if self._terms is None:
+            return
+        self.vocab = {t.decode("utf-8"): i for i, t in enumerate(self._terms)}
+        self.doc_ids = [d.decode("utf-8") for d in self.doc_ids]
+        for name in _ARRAYS + _FACET_ARRAYS:
+            setattr(self, name, np.array(getattr(self, name)))
+        self.files = [f.decode("utf-8") for f in self.files]
+        self._terms = None
+
+    def _term_id(self, term: str) -> Optional[int]:
+        if self._terms is None:
+            return self.vocab.get(term)
+        key = term.encode("utf-8")
+        i = int(np.searchsorted(self._terms, key))
+        return i if i < len(self._terms) and self._terms[i] == key else None
+
+    def file_name(self, code: int) -> str:
+        f = self.files[code]
+        return f.decode("utf-8") if isinstance(f, bytes) else f
+
+    def doc_id(self, pos: int) -> str:
+        d = self.doc_ids[pos]
+        return d.decode("utf-8") if isinstance(d, bytes) else d
+
+    def save(self, path: str | Path):
+        self.commit()
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        for name in _ARRAYS:
+            np.save(path / f"{name}.npy", np.asarray(getattr(self, name)))
+        if self.has_facets:
+            for name in _FACET_ARRAYS:
+                np.save(path / f"{name}.npy", np.asarray(getattr(self, name)))
+            np.save(path / "files.npy", self.files if self._terms is not None else _bytes_array(self.files))
+        # utf-8 byte strings: fixed-width but ~4x smaller than numpy unicode arrays
+        terms = self._terms if self._terms is not None else _bytes_array(sorted(self.vocab, key=self.vocab.get))
+        doc_ids = self.doc_ids if self._terms is not None else _bytes_array(self.doc_ids)
+        np.save(path / "terms.npy", terms)
+        np.save(path / "doc_ids.npy", doc_ids)
+        (path / "meta.json").write_text(json.dumps({"k1": self.k1, "b": self.b, "docs": len(self.doc_ids)}), encoding="utf-8")
+        log.info(f"bm25_saved | path={path} | docs={len(self.doc_ids)}")
+
+    @classmethod
+    def exists(cls, path: str | Path) -> bool:
+        return (Path(path) / "meta.json").exists()
+
+    @classmethod
+    def load(cls, path: str | Path, mmap: bool = True) -> "BM25Index":
+        path = Path(path)
+        meta = json.loads((path / "meta.json").read_text(encoding="utf-8"))
+        index = cls(k1=meta["k1"], b=meta["b"])
+        mode = "r" if mmap else None
+        for name in _ARRAYS:
+            setattr(index, name, np.load(path / f"{name}.npy", mmap_mode=mode))
+        index._terms = np.load(path / "terms.npy", mmap_mode=mode)
+        index.doc_ids = np.load(path / "doc_ids.npy", mmap_mode=mode)
+        index.vocab = {}
+        index.has_facets = (path / "files.npy").exists()
+        if index.has_facets:
+            for name in _FACET_ARRAYS:
+                setattr(index, name, np.load(path / f"{name}.npy", mmap_mode=mode))
+            index.files = np.load(path / "files.npy", mmap_mode=mode)
+        else:
+            log.warning(f"bm25_no_facets | path={path} | note=metadata filters need a re-index")
+        log.info(f"bm25_loaded | path={path} | docs={len(index.doc_ids)} | terms={len(index._terms)}")
+        return index
+
+    def search(self, query: str, k: int, mask: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """
+        Top-k (doc position, score) pairs; positions index into `doc_ids`. `mask` (bool per
+        position) restricts scoring to allowed documents before the top-k selection.
+        """
+        if self.dirty:
+            self.commit()
+        term_ids = (self._term_id(t) for t in tokenize(query))
+        counts = Counter(t for t in term_ids if t is not None)
+        if not counts or k <= 0:
+            return []
+        docs_parts, weight_parts = [], []
+        for tid, qtf in counts.items():
+            lo, hi = self.indptr[tid], self.indptr[tid + 1]
+            if lo == hi:
+                continue
+            docs = self.post_docs[lo:hi]
+            tf = self.post_tfs[lo:hi]
+            docs_parts.append(docs)
+            weight_parts.append(qtf * self.idf[tid] * tf * (self.k1 + 1) / (tf + self.norm[docs]))
+        if not docs_parts:
+            return []
+        if len(docs_parts) == 1:
+            cand, scores = docs_parts[0], weight_parts[0]
+        else:
+            cand, inv = np.unique(np.concatenate(docs_parts), return_inverse=True)
+            scores = np.bincount(inv, weights=np.concatenate(weight_parts))
+        if mask is not None:
+            allowed = mask[cand]
+            cand, scores = cand[allowed], scores[allowed]
+            if not len(cand):
+                return []
+        # Partial selection over matched docs only, then order just the k winners
+        if len(scores) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(cand[i]), float(scores[i])) for i in top]
+
 class BM25Retriever:
-    def __init__(self, corpus: List[Dict], max_docs: int = 1000, normalize: bool = False):
+    def __init__(self, corpus: List[Dict], max_docs: Optional[int] = None, normalize: bool = False):
         """
         Args:
             corpus: List of documents with 'text' and optional 'meta'
-            max_docs: Limit number of docs to index for performance
+            max_docs: Optional cap on docs to index (default: index everything)
             normalize: Whether to normalize scores to [0,1]
         """
-        self.corpus = corpus[:max_docs]
+        self.corpus = corpus[:max_docs] if max_docs else corpus
         self.normalize = normalize
-        self.tokens = [tokenize(d["text"]) for d in self.corpus]
-        self.bm25 = BM25Okapi(self.tokens)
-        log.info("bm25_init", doc_count=len(self.corpus))
+        self.index = BM25Index.build(
+            ((d.get("meta") or {}).get("id") or str(i) for i, d in enumerate(self.corpus)),
+            (d["text"] for d in self.corpus),
+        )
+        log.info(f"bm25_init | doc_count={len(self.corpus)}")
 
     def search(self, query: str, k: int) -> List[Dict]:
-        q_tokens = tokenize(query)
-        scores = self.bm25.get_scores(q_tokens)
-        ranked = sorted(enumerate(scores), key=lambda x: x[1], reverse=True)[:k]
-
-        if self.normalize and scores:
-            max_score = max(scores)
-            scores = [s / max_score if max_score > 0 else 0.0 for s in scores]
+        ranked = self.index.search(query, k)
+        max_score = ranked[0][1] if ranked else 0.0
 
         out = []
         for idx, score in ranked:
+            if self.normalize:
+                score = score / max_score if max_score > 0 else 0.0
             doc = self.corpus[idx]
             out.append({
                 "text": doc["text"],
@@ -41,5 +324,5 @@ class BM25Retriever:
                 "meta": doc.get("meta", {}),
                 "length": len(doc["text"])
             })
-        log.info("bm25_search", query=query, top_k=k, returned=len(out))
-        return out
\ No newline at end of file
+        log.info(f"bm25_search | top_k={k} | returned={len(out)}")
+        return out
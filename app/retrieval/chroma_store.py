@@ -2,8 +2,8 @@
 from __future__ import annotations
 from typing import List, Dict, Any
 from langchain_chroma import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
 from app.core.config import get_settings
+from app.retrieval.embedding_cache import make_embeddings
 from app.core.logging import setup_logging
 import time
 
@@ -13,22 +13,22 @@ def health_check(self) -> bool:
     try:
         data = self.langchain.get(include=["documents"])
         doc_count = len(data.get("documents", []) or [])
-        log.info("chroma_health_check", status="connected", doc_count=doc_count)
+        log.info(f"chroma_health_check | status=connected | doc_count={doc_count}")
         return True
     except Exception as e:
-        log.error("chroma_health_check_failed", error=str(e))
+        log.error(f"chroma_health_check_failed | error={str(e)}")
         return False
 
 class ChromaStore:
     def __init__(self):
         self.settings = get_settings()
-        self.embeddings = HuggingFaceEmbeddings(model_name=self.settings.embedding_model)
+        self.embeddings = make_embeddings()
         self.langchain = Chroma(
             collection_name=self.settings.collection_name,
             embedding_function=self.embeddings,
             persist_directory=self.settings.chroma_path,
         )
-        log.info("chroma_init", model=self.settings.embedding_model, path=self.settings.chroma_path)
+        log.info(f"chroma_init | model={self.settings.embedding_model} | path={self.settings.chroma_path}")
 
     def health_check(self) -> bool:
         """Ping Chroma by fetching document count."""
@@ -37,10 +37,10 @@ class ChromaStore:
             data = self.langchain.get(include=["documents"])
             docs = data.get("documents", []) or []
             duration = round(time.time() - start, 2)
-            log.info("chroma_health", status="ok", doc_count=len(docs), duration=duration)
+            log.info(f"chroma_health | status=ok | doc_count={len(docs)} | duration={duration}")
             return True
         except Exception as e:
-            log.error("chroma_health", status="error", error=str(e))
+            log.error(f"chroma_health | status=error | error={str(e)}")
             return False
 
     def upsert(self, docs: List[Dict[str, Any]]):
@@ -63,13 +63,13 @@ class ChromaStore:
         self.langchain.add_texts(texts=texts, metadatas=metadatas, ids=ids)
         self.langchain.persist()
         duration = round(time.time() - start, 2)
-        log.info("chroma_upsert", count=len(ids), duration=duration, collection=self.settings.collection_name)
+        log.info(f"chroma_upsert | count={len(ids)} | duration={duration} | collection={self.settings.collection_name}")
 
     def similarity_search(self, query: str, k: int) -> List[Dict[str, Any]]:
         start = time.time()
         res = self.langchain.similarity_search_with_score(query, k=k)
         duration = round(time.time() - start, 2)
-        log.info("chroma_similarity_search", query=query, top_k=k, result_count=len(res), duration=duration)
+        log.info(f"chroma_similarity_search | query_length={len(query)} | top_k={k} | result_count={len(res)} | duration={duration}")
 
         out = []
         for doc, score in res:
@@ -82,7 +82,7 @@ class ChromaStore:
         docs = data.get("documents", []) or []
         metas = data.get("metadatas", []) or []
         duration = round(time.time() - start, 2)
-        log.info("chroma_get_all", doc_count=len(docs), duration=duration)
+        log.info(f"chroma_get_all | doc_count={len(docs)} | duration={duration}")
 
         out = []
         for t, m in zip(docs, metas):
@@ -0,0 +1,123 @@
+# app/retrieval/chunk_store.py
+from __future__ import annotations
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+CHUNKS_FILE = "chunks.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    id    TEXT PRIMARY KEY,
+    label INTEGER NOT NULL UNIQUE,
+    text  TEXT NOT NULL,
+    meta  TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+# SQLite's default limit on bound parameters is 999 on older builds
+_MAX_PARAMS = 900
+
+
+def _chunk(row: Tuple[str, int, str, str]) -> Dict[str, Any]:
+    return {"id": row[0], "label": row[1], "text": row[2], "meta": json.loads(row[3])}
+
+
+def _batches(values: List[Any]) -> Iterator[List[Any]]:
+    for i in range(0, len(values), _MAX_PARAMS):
+        yield values[i:i + _MAX_PARAMS]
+
+
+class ChunkStore:
+    """
+    Chunk text and metadata in a SQLite table keyed by chunk id, with the FAISS label alongside.
+
+    Read-only stores open the file `immutable` (committed index directories are never modified in
+    place), so every worker process shares the OS page cache and only touches the rows it looks up.
+    Connections are per thread; retrieval runs on executor threads.
+    """
+
+    def __init__(self, path: str | Path, readonly: bool = True):
+        self.path = Path(path)
+        self.readonly = readonly
+        self._local = threading.local()
+        self._opened: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        if not readonly:
+            with self._conn() as conn:
+                conn.executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if self.readonly:
+                conn = sqlite3.connect(f"file:{self.path}?mode=ro&immutable=1", uri=True, check_same_thread=False)
+            else:
+                conn = sqlite3.connect(str(self.path), check_same_thread=False)
+                conn.execute("PRAGMA journal_mode=OFF")
+                conn.execute("PRAGMA synchronous=OFF")
+            self._local.conn = conn
+            with self._lock:
+                self._opened.append(conn)
+        return conn
+
+    def close(self):
+        with self._lock:
+            opened, self._opened = self._opened, []
+        for conn in opened:
+            conn.close()
+        self._local = threading.local()
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def ids(self) -> Iterator[str]:
+        for (i,) in self._conn().execute("SELECT id FROM chunks"):
+            yield i
+
+    def labels(self) -> Iterator[int]:
+        for (label,) in self._conn().execute("SELECT label FROM chunks"):
+            yield label
+
+    def get(self, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        out: Dict[str, Dict[str, Any]] = {}
+        for batch in _batches(list(ids)):
+            marks = ",".join("?" * len(batch))
+            for row in self._conn().execute(f"SELECT id, label, text, meta FROM chunks WHERE id IN ({marks})", batch):
+                out[row[0]] = _chunk(row)
+        return out
+
+    def get_by_labels(self, labels: List[int]) -> Dict[int, Dict[str, Any]]:
+        out: Dict[int, Dict[str, Any]] = {}
+        for batch in _batches(list(labels)):
+            marks = ",".join("?" * len(batch))
+            for row in self._conn().execute(f"SELECT id, label, text, meta FROM chunks WHERE label IN ({marks})", batch):
+                out[row[1]] = _chunk(row)
+        return out
+
+    def all(self) -> Iterator[Dict[str, Any]]:
+        for row in self._conn().execute("SELECT id, label, text, meta FROM chunks"):
+            yield _chunk(row)
+
+    def put_many(self, chunks: Iterable[Dict[str, Any]]):
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO chunks (id, label, text, meta) VALUES (?, ?, ?, ?)",
+                ((c["id"], c["label"], c["text"], json.dumps(c.get("meta") or {}, ensure_ascii=False, default=str))
+                 for c in chunks),
+            )
+
+    def delete_many(self, ids: Iterable[str]):
+        conn = self._conn()
+        with conn:
+            for batch in _batches(list(ids)):
+                conn.execute(f"DELETE FROM chunks WHERE id IN ({','.join('?' * len(batch))})", batch)
+
+    def copy_to(self, path: str | Path) -> "ChunkStore":
+        """A writable copy of this store at `path` (SQLite online backup, page by page)."""
+        target = ChunkStore(path, readonly=False)
+        self._conn().backup(target._conn())
+        return target
+
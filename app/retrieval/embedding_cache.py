@@ -0,0 +1,205 @@
+# app/retrieval/embedding_cache.py
+from __future__ import annotations
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_huggingface import HuggingFaceEmbeddings
+from app.core.config import get_settings
+from app.core.logging import setup_logging
+
+log = setup_logging()
+
+KEY_BYTES = 16
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.split())
+
+
+def embedding_key(model_name: str, kind: str, text: str) -> bytes:
+    h = hashlib.blake2b(digest_size=KEY_BYTES)
+    h.update(f"{model_name}\x00{kind}\x00{normalize_text(text)}".encode("utf-8"))
+    return h.digest()
+
+
+class EmbeddingCache:
+    """
+    Append-only on-disk vector cache for one embedding model.
+
+    vectors.bin holds fixed-width rows (float16/float32) read through a memory map, keys.bin holds the
+    matching 16-byte keys in the same order. Rows are appended vectors-first, so a torn write only
+    ever leaves trailing bytes, which are ignored on load. One writer (the indexer) at a time.
+    """
+
+    def __init__(self, root: str | Path, model_name: str, dtype: str = "float16", readonly: bool = False):
+        self.dir = Path(root) / re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+        self.model_name = model_name
+        self.readonly = readonly
+        self.dtype = np.dtype(dtype)
+        self.dim: Optional[int] = None
+        self._rows: Dict[bytes, int] = {}
+        self._mm: Optional[np.memmap] = None
+        self._lock = threading.Lock()
+        self._load()
+
+    @property
+    def _vectors_path(self) -> Path:
+        return self.dir / "vectors.bin"
+
+    @property
+    def _keys_path(self) -> Path:
+        return self.dir / "keys.bin"
+
+    def _load(self):
+        meta_path = self.dir / "meta.json"
+        if not meta_path.exists():
+            return
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        self.dim = int(meta["dim"])
+        self.dtype = np.dtype(meta["dtype"])
+        row_bytes = self.dim * self.dtype.itemsize
+        keys = self._keys_path.read_bytes() if self._keys_path.exists() else b""
+        n_vec = self._vectors_path.stat().st_size // row_bytes if self._vectors_path.exists() else 0
+        n = min(len(keys) // KEY_BYTES, n_vec)
+        self._rows = {keys[i * KEY_BYTES:(i + 1) * KEY_BYTES]: i for i in range(n)}
+        if not self.readonly and (len(keys) != n * KEY_BYTES or n_vec != n):
+            # Drop a torn tail left by an interrupted append
+            with open(self._keys_path, "r+b") as f:
+                f.truncate(n * KEY_BYTES)
+            with open(self._vectors_path, "r+b") as f:
+                f.truncate(n * row_bytes)
+        self._remap(n)
+        log.info(f"embedding_cache_loaded | path={self.dir} | rows={n} | dim={self.dim} | dtype={self.dtype.name}")
+
+    def _remap(self, n: int):
+        self._mm = np.memmap(self._vectors_path, dtype=self.dtype, mode="r", shape=(n, self.dim)) if n else None
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def get_many(self, keys: Sequence[bytes]) -> Dict[bytes, np.ndarray]:
+        with self._lock:
+            found = {k: self._rows[k] for k in keys if k in self._rows}
+            if not found:
+                return {}
+            if self._mm is None or self._mm.shape[0] < len(self._rows):
+                self._remap(len(self._rows))
+            mm = self._mm
+        return {k: np.asarray(mm[row], dtype=np.float32) for k, row in found.items()}
+
+    def put_many(self, keys: Sequence[bytes], vectors: np.ndarray):
+        if self.readonly or not len(keys):
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            fresh = [i for i, k in enumerate(keys) if k not in self._rows]
+            if not fresh:
+                return
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+                self.dir.mkdir(parents=True, exist_ok=True)
+                (self.dir / "meta.json").write_text(json.dumps(
+                    {"model": self.model_name, "dim": self.dim, "dtype": self.dtype.name}), encoding="utf-8")
+            rows = vectors[fresh].astype(self.dtype)
+            with open(self._vectors_path, "ab") as f:
+                f.write(rows.tobytes())
+            with open(self._keys_path, "ab") as f:
+                f.write(b"".join(keys[i] for i in fresh))
+            start = len(self._rows)
+            for j, i in enumerate(fresh):
+                self._rows[keys[i]] = start + j
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    LangChain Embeddings wrapper that dedupes texts within a call, serves repeats from the
+    persistent EmbeddingCache (and an in-memory LRU for queries) and only forwards misses to
+    the underlying model, in batches of `batch_size`.
+    """
+
+    def __init__(self, base: Embeddings, model_name: str, cache: Optional[EmbeddingCache] = None,
+                 batch_size: int = 64, query_cache_size: int = 4096):
+        self.base = base
+        self.model_name = model_name
+        self.cache = cache
+        self.batch_size = batch_size
+        self.query_cache_size = query_cache_size
+        self._queries: "OrderedDict[bytes, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"requested": 0, "computed": 0}
+
+    def _embed(self, texts: List[str], kind: str) -> List[List[float]]:
+        keys = [embedding_key(self.model_name, kind, t) for t in texts]
+        unique: Dict[bytes, str] = {}
+        for k, t in zip(keys, texts):
+            unique.setdefault(k, t)
+
+        vectors: Dict[bytes, np.ndarray] = self.cache.get_many(list(unique)) if self.cache is not None else {}
+        misses = [k for k in unique if k not in vectors]
+        for start in range(0, len(misses), self.batch_size):
+            batch = misses[start:start + self.batch_size]
+            batch_texts = [unique[k] for k in batch]
+            if kind == "query" and len(batch_texts) == 1:
+                computed = np.asarray([self.base.embed_query(batch_texts[0])], dtype=np.float32)
+            else:
+                computed = np.asarray(self.base.embed_documents(batch_texts), dtype=np.float32)
+            if self.cache is not None:
+                self.cache.put_many(batch, computed)
+            vectors.update(zip(batch, computed))
+
+        with self._lock:
+            self.stats["requested"] += len(texts)
+            self.stats["computed"] += len(misses)
+        return [vectors[k].tolist() for k in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(list(texts), "doc")
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_queries([text])[0]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed several queries in one model call (used by the query micro-batcher)."""
+        keys = [embedding_key(self.model_name, "query", t) for t in texts]
+        found: Dict[bytes, List[float]] = {}
+        with self._lock:
+            for k in keys:
+                hit = self._queries.get(k)
+                if hit is not None:
+                    self._queries.move_to_end(k)
+                    found[k] = hit
+            self.stats["requested"] += sum(k in found for k in keys)
+        missing = [(k, t) for k, t in zip(keys, texts) if k not in found]
+        if missing:
+            computed = self._embed([t for _, t in missing], "query")
+            with self._lock:
+                for (k, _), vec in zip(missing, computed):
+                    found[k] = vec
+                    self._queries[k] = vec
+                while len(self._queries) > self.query_cache_size:
+                    self._queries.popitem(last=False)
+        return [found[k] for k in keys]
+
+def make_embeddings(writable_cache: bool = False) -> Embeddings:
+    """
+    Embedding model from settings, wrapped with batching, dedup and (for the indexer) the on-disk cache.
+
+    Read-only processes get no disk cache: it only ever holds document keys, so their query lookups
+    could never hit, and loading its key file would cost every API worker time and memory that
+    grow with the corpus. Their queries use the in-memory LRU only.
+    """
+    settings = get_settings()
+    base = HuggingFaceEmbeddings(model_name=settings.embedding_model)
+    cache = None
+    if settings.embedding_cache_dir and writable_cache:
+        cache = EmbeddingCache(settings.embedding_cache_dir, settings.embedding_model,
+                               dtype=settings.embedding_cache_dtype)
+    return CachedEmbeddings(base, settings.embedding_model, cache=cache,
+                            batch_size=settings.embed_batch_size,
+                            query_cache_size=settings.query_embedding_cache_size)
@@ -1,65 +1,478 @@
+import json
 import os
-from typing import List, Dict, Any
-from langchain_community.vectorstores import FAISS
-from langchain.docstore.document import Document
-from langchain_huggingface import HuggingFaceEmbeddings
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List, Dict, Any, Callable, Iterable, Optional
+import faiss
+import numpy as np
 from app.core.config import get_settings
 from app.core.logging import setup_logging
+from app.retrieval.embedding_cache import make_embeddings
+from app.retrieval.ann import (apply_search_params, build_index, filtered_search, is_id_mapped, min_train_points,
+                               read_index, stored_ids, supports_remove, train)
+from app.retrieval.chunk_store import CHUNKS_FILE, ChunkStore
+from app.retrieval.ids import chunk_int_ids
+from app.utils.fs import atomic_write_dir, carry_over, recover_dir
 
 log = setup_logging()
 
+# Rewritten on every save; readers (e.g. the answer cache) compare it to detect a re-index
+INDEX_VERSION_FILE = "VERSION"
+INDEX_FILE = "index.faiss"
+STORE_META_FILE = "store.json"
+# LangChain's pickled docstore, written by earlier versions; converted on load, never written
+LEGACY_DOCSTORE_FILE = "index.pkl"
+
+
+def read_index_version(persist_path: str | os.PathLike) -> Optional[str]:
+    try:
+        return (Path(persist_path) / INDEX_VERSION_FILE).read_text(encoding="utf-8").strip() or None
+    except OSError:
+        return None
+
+
 class FAISSStore:
-    def __init__(self):
+    """
+    Chunk store: vectors in a FAISS index, chunk text and metadata in a SQLite ChunkStore.
+
+    On disk an index directory holds `index.faiss` (memory-mapped read-only by API workers, so the
+    vectors live once in the shared page cache), `chunks.sqlite` (rows fetched by FAISS label only
+    for the hits of a query) and `store.json`. Startup cost and RSS therefore do not grow with the
+    corpus, unlike unpickling a LangChain docstore into every worker.
+
+    New indexes are built from `faiss_index_factory` and wrapped in IDMap2, with vector ids derived
+    from chunk ids (app.retrieval.ids), so deletes are by id and survive any index type. Indexes
+    that need training (IVF, PQ) buffer their first vectors until `min_train_points` are available
+    (or the next save) and train on a sample of them. Writes are kept in memory (`_pending`,
+    `_deleted`) and applied to a copy of the chunk table in the staging directory on save.
+    Directories saved by earlier versions (index.faiss + pickled index.pkl) are converted in memory
+    on load and written in the new layout by the next save.
+    """
+
+    def __init__(self, writable_cache: bool = False, persist_path: Optional[str] = None, embedding_model=None):
         self.settings = get_settings()
-        self.embedding_model = HuggingFaceEmbeddings(model_name=self.settings.embedding_model)
-        self.persist_path = self.settings.faiss_path or "./faiss_index"
-        self.index = None
+        # Only the indexer opens the on-disk embedding cache; API workers keep query vectors in memory
+        self.embedding_model = embedding_model or make_embeddings(writable_cache=writable_cache)
+        self.persist_path = persist_path or self.settings.faiss_path or "./faiss_index"
+        # The indexer mutates the index, so only read-only processes map it
+        self._mmap = self.settings.faiss_mmap and not writable_cache
+        self.index: Optional[faiss.Index] = None
+        self.chunks: Optional[ChunkStore] = None
+        self._mapped = False
+        self._reset_state()
+        # Bulk (transaction) state: writes stay in memory until commit/checkpoint
+        self._bulk_depth = 0
+        self._dirty = 0
+        self._checkpoint_every = 0
+        self._on_save: Optional[Callable[[Path], None]] = None
+        self._was_reset = False
 
-        if os.path.exists(self.persist_path):
+        if writable_cache:
+            # Readers never recover: an interrupted save and a live one look the same from outside
+            recover_dir(self.persist_path)
+        if os.path.exists(os.path.join(self.persist_path, INDEX_FILE)):
             try:
-                self.index = FAISS.load_local(
-                    self.persist_path,
-                    self.embedding_model,
-                    allow_dangerous_deserialization=True
+                start = time.perf_counter()
+                self._load()
+                log.info(
+                    f"faiss_loaded | vectors={self.index.ntotal} | index={type(self.index).__name__}"
+                    f" | mmap={self._mapped} | duration_ms={round((time.perf_counter() - start) * 1000, 1)}"
                 )
-                doc_count = len(self.index.docstore._dict)
-                log.info(f"faiss_loaded | doc_count={doc_count}")
-                print(f"✅ FAISSStore initialized at {self.persist_path}")
             except Exception as e:
                 log.error(f"faiss_load_error | error={str(e)}")
+                self.index = None
         else:
             log.warning(f"faiss_missing | path={self.persist_path}")
 
+    def _reset_state(self):
+        self._ids: Optional[set] = None
+        # Unsaved writes: chunks added (by id, plus label -> id) and persisted chunk ids deleted
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._pending_labels: Dict[int, str] = {}
+        self._deleted: set = set()
+        # Deleted vectors an HNSW index still holds; filtered at search time until compaction
+        self._tombstones = 0
+        # Vectors waiting for an untrained (IVF/PQ) index to collect enough training points
+        self._train_ids: List[str] = []
+        self._train_vecs: List[np.ndarray] = []
+
+    # ---- loading -----------------------------------------------------------------------------
+
+    def _load(self):
+        root = Path(self.persist_path)
+        if not (root / CHUNKS_FILE).exists() and (root / LEGACY_DOCSTORE_FILE).exists():
+            self._load_legacy()
+        else:
+            self.index = read_index(str(root / INDEX_FILE), mmap=self._mmap)
+            self._mapped = self._mmap
+            self.chunks = ChunkStore(root / CHUNKS_FILE, readonly=True)
+            meta_path = root / STORE_META_FILE
+            if meta_path.exists():
+                self._tombstones = int(json.loads(meta_path.read_text(encoding="utf-8")).get("tombstones", 0))
+        self._tune()
+
+    def _load_legacy(self):
+        from langchain_community.vectorstores import FAISS
+        legacy = FAISS.load_local(self.persist_path, self.embedding_model, allow_dangerous_deserialization=True)
+        index, mapping = legacy.index, legacy.index_to_docstore_id
+        if is_id_mapped(index):
+            self.index = index
+            labels = dict(mapping)
+            self._tombstones = max(0, index.ntotal - len(mapping))
+        else:
+            # Positional IndexFlatL2: re-key the vectors by chunk id
+            ids = [mapping[i] for i in range(index.ntotal)]
+            vectors = index.reconstruct_n(0, index.ntotal) if index.ntotal else None
+            self.index = build_index("Flat", index.d)
+            if vectors is not None:
+                self.index.add_with_ids(vectors, chunk_int_ids(ids))
+            labels = dict(zip(chunk_int_ids(ids).tolist(), ids))
+        for label, chunk_id in labels.items():
+            doc = legacy.docstore.search(chunk_id)
+            if hasattr(doc, "page_content"):
+                self._stage(chunk_id, label, doc.page_content, doc.metadata)
+        log.warning(f"faiss_legacy_format | chunks={len(self._pending)} | note=re-save with the indexer to drop the pickled docstore")
+
+    def _ensure_writable(self):
+        if self._mapped:
+            self.index = read_index(os.path.join(self.persist_path, INDEX_FILE))
+            self._mapped = False
+            self._tune()
+
+    def _tune(self):
+        apply_search_params(self.index, self.settings.faiss_nprobe, self.settings.faiss_ef_search)
+
+    # ---- chunk bookkeeping -------------------------------------------------------------------
+
+    def _known_ids(self) -> set:
+        if self._ids is None:
+            persisted = set(self.chunks.ids()) if self.chunks is not None else set()
+            self._ids = (persisted - self._deleted) | set(self._pending)
+        return self._ids
+
+    def _stage(self, chunk_id: str, label: int, text: str, meta: Dict[str, Any]):
+        self._pending[chunk_id] = {"id": chunk_id, "label": label, "text": text, "meta": meta}
+        self._pending_labels[label] = chunk_id
+
+    def _lookup_labels(self, labels: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+        found: Dict[int, Dict[str, Any]] = {}
+        missing = []
+        for label in labels:
+            chunk_id = self._pending_labels.get(label)
+            if chunk_id is not None:
+                found[label] = self._pending[chunk_id]
+            else:
+                missing.append(label)
+        if missing and self.chunks is not None:
+            for label, row in self.chunks.get_by_labels(missing).items():
+                if row["id"] not in self._deleted:
+                    found[label] = row
+        return found
+
+    @property
+    def tombstones(self) -> int:
+        """Vectors still in the index whose chunk was deleted (HNSW cannot remove them in place)."""
+        return self._tombstones
+
+    # ---- writes ------------------------------------------------------------------------------
+
+    def _new_index(self, dim: int):
+        self.index = build_index(self.settings.faiss_index_factory, dim)
+        self._tune()
+        log.info(f"faiss_index_created | factory={self.settings.faiss_index_factory} | dim={dim} | trained={self.index.is_trained}")
+
     def upsert(self, docs: List[Dict[str, Any]]):
         if not docs:
             return
-        documents = [
-            Document(page_content=d["text"], metadata=d["meta"])
-            for d in docs if d.get("text")
-        ]
-        if not documents:
+        docs = [d for d in docs if d.get("text")]
+        # Chunk ids double as docstore ids so changed/deleted files can be removed later
+        docs = [{**d, "id": d.get("id") or d["meta"].get("id") or str(uuid.uuid4())} for d in docs]
+        known = self._known_ids()
+        docs = [d for d in docs if d["id"] not in known]
+        if not docs:
+            return
+        vectors = self.embed_documents([d["text"] for d in docs])
+        self.add_embeddings(docs, vectors)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embedding_model.embed_documents(texts)
+
+    def add_embeddings(self, docs: List[Dict[str, Any]], vectors: List[List[float]]) -> List[str]:
+        """Add chunks whose vectors were computed upstream (e.g. by the streaming ingest embed stage).
+        Returns the ids actually added."""
+        # Idempotent per chunk id, so replaying a batch after a checkpoint never duplicates vectors
+        known = self._known_ids()
+        pairs = [(d, v) for d, v in zip(docs, vectors) if d["id"] not in known]
+        if not pairs:
+            return []
+        ids = [d["id"] for d, _ in pairs]
+        if self.index is None:
+            self._new_index(len(pairs[0][1]))
+        self._ensure_writable()
+
+        labels = chunk_int_ids(ids)
+        matrix = np.asarray([v for _, v in pairs], dtype=np.float32)
+        for (d, _), label in zip(pairs, labels.tolist()):
+            self._stage(d["id"], label, d["text"], d["meta"])
+        if self.index.is_trained:
+            self.index.add_with_ids(matrix, labels)
+        else:
+            self._train_ids.extend(ids)
+            self._train_vecs.append(matrix)
+            self._maybe_train()
+        known.update(ids)
+
+        log.info(f"faiss_add_embeddings | count={len(ids)} | path={self.persist_path}")
+        self._written(len(ids))
+        return ids
+
+    def _maybe_train(self, force: bool = False):
+        if not self._train_ids:
+            return
+        need = self.settings.faiss_train_min or min_train_points(self.index)
+        if len(self._train_ids) < need and not force:
             return
+        vectors = np.concatenate(self._train_vecs)
+        ids = self._train_ids
+        self._train_ids, self._train_vecs = [], []
+        start = time.perf_counter()
+        try:
+            sample = train(self.index, vectors, self.settings.faiss_train_max)
+            if len(vectors) < need:
+                log.warning(f"faiss_train_undersampled | points={len(vectors)} | recommended={need}")
+        except RuntimeError as e:
+            # Too few vectors for this factory (e.g. fewer than nlist): fall back to exact search
+            log.warning(f"faiss_train_fallback | factory={self.settings.faiss_index_factory} | points={len(vectors)} | error={str(e)[:200]}")
+            self.index = build_index("Flat", vectors.shape[1])
+            sample = 0
+        self.index.add_with_ids(vectors, chunk_int_ids(ids))
+        self._tune()
+        log.info(f"faiss_trained | sample={sample} | added={len(ids)} | duration_ms={round((time.perf_counter() - start) * 1000, 1)}")
+
+    def reset(self):
+        # Nothing is removed from disk until the next save swaps in the new (empty) index
+        self.index = None
+        self._mapped = False
+        self._reset_state()
+        self._ids = set()
+        self._was_reset = True
+        log.info(f"faiss_reset | path={self.persist_path}")
+        self._written(1)
+
+    def delete(self, ids: List[str]) -> int:
+        if self.index is None or not ids:
+            return 0
+        known = self._known_ids()
+        present = [i for i in ids if i in known]
+        if not present:
+            return 0
+        self._ensure_writable()
+        gone = set(present)
+        for chunk_id in present:
+            staged = self._pending.pop(chunk_id, None)
+            if staged is not None:
+                self._pending_labels.pop(staged["label"], None)
+            else:
+                self._deleted.add(chunk_id)
+        buffered = gone & set(self._train_ids)
+        if buffered:
+            keep = [i for i, cid in enumerate(self._train_ids) if cid not in buffered]
+            vectors = np.concatenate(self._train_vecs)[keep] if keep else None
+            self._train_ids = [self._train_ids[i] for i in keep]
+            self._train_vecs = [vectors] if vectors is not None else []
+        indexed = chunk_int_ids([i for i in present if i not in buffered])
+        if len(indexed):
+            if supports_remove(self.index):
+                self.index.remove_ids(indexed)
+            else:
+                self._tombstones += len(indexed)
+        known.difference_update(present)
+        # Tombstoned vectors are filtered out at search time; rebuild once they are a large share
+        if self._tombstones > max(1000, 0.2 * self.index.ntotal):
+            self._compact()
+        log.info(f"faiss_delete | count={len(present)} | path={self.persist_path}")
+        self._written(len(present))
+        return len(present)
 
-        if self.index:
-            self.index.add_documents(documents)
+    def _compact(self):
+        index = self.index
+        live = set(self._pending_labels)
+        if self.chunks is not None:
+            deleted = set(chunk_int_ids(self._deleted).tolist()) if self._deleted else set()
+            live.update(label for label in self.chunks.labels() if label not in deleted)
+        held = stored_ids(index)
+        labels = held[np.isin(held, np.fromiter(live, dtype=np.int64, count=len(live)))]
+        labels = np.unique(labels)
+        fresh = build_index(self.settings.faiss_index_factory, index.d)
+        if len(labels):
+            vectors = np.vstack([index.reconstruct(int(i)) for i in labels])
+            if not fresh.is_trained:
+                train(fresh, vectors, self.settings.faiss_train_max)
+            fresh.add_with_ids(vectors, labels)
+        log.info(f"faiss_compacted | before={index.ntotal} | after={fresh.ntotal}")
+        self.index = fresh
+        self._tombstones = 0
+        self._tune()
+
+    def _written(self, n: int):
+        self._dirty += n
+        if not self._bulk_depth:
+            self.save()
+        elif self._checkpoint_every and self._dirty >= self._checkpoint_every:
+            log.info(f"faiss_checkpoint | pending={self._dirty} | path={self.persist_path}")
+            self.save()
+
+    def save(self):
+        """Atomically persist the index (plus any bulk on_save extras) via a staged directory swap."""
+        if self.index is not None:
+            # Untrained buffer: train on whatever has been collected so nothing is lost
+            self._maybe_train(force=True)
+
+        def _write(staging: Path):
+            if self.index is not None:
+                faiss.write_index(self.index, str(staging / INDEX_FILE))
+                # Committed files are never modified in place: apply the changes to a fresh copy
+                if self.chunks is not None:
+                    chunks = self.chunks.copy_to(staging / CHUNKS_FILE)
+                else:
+                    chunks = ChunkStore(staging / CHUNKS_FILE, readonly=False)
+                try:
+                    chunks.delete_many(self._deleted)
+                    chunks.put_many(self._pending.values())
+                finally:
+                    chunks.close()
+                meta = {"factory": self.settings.faiss_index_factory, "index": type(self.index).__name__,
+                        "dim": self.index.d, "vectors": self.index.ntotal, "tombstones": self._tombstones}
+                (staging / STORE_META_FILE).write_text(json.dumps(meta), encoding="utf-8")
+            if self._on_save:
+                self._on_save(staging)
+            (staging / INDEX_VERSION_FILE).write_text(f"{time.time_ns()}-{uuid.uuid4().hex[:8]}", encoding="utf-8")
+            if not self._was_reset:
+                carry_over(self.persist_path, staging)
+            legacy = staging / LEGACY_DOCSTORE_FILE
+            if legacy.exists():
+                legacy.unlink()
+
+        atomic_write_dir(self.persist_path, _write)
+        if self.index is not None:
+            # The saved table now holds every pending write; read it back from the committed dir
+            if self.chunks is not None:
+                self.chunks.close()
+            self.chunks = ChunkStore(Path(self.persist_path) / CHUNKS_FILE, readonly=True)
+            self._pending, self._pending_labels, self._deleted = {}, {}, set()
+        self._dirty = 0
+        self._was_reset = False
+        log.info(f"faiss_saved | path={self.persist_path}")
+
+    @contextmanager
+    def bulk(self, checkpoint_every: int = 0, on_save: Optional[Callable[[Path], None]] = None):
+        """
+        Transaction-style bulk ingest: writes accumulate in memory and the index is saved once on
+        successful exit (and every `checkpoint_every` written chunks if > 0). `on_save(staging_dir)`
+        lets callers persist companion files (e.g. the manifest) in the same atomic swap.
+        On error nothing is written and the in-memory index is reloaded from the last good save.
+        """
+        outer = self._bulk_depth == 0
+        if outer:
+            self._checkpoint_every = checkpoint_every
+            self._on_save = on_save
+        self._bulk_depth += 1
+        try:
+            yield self
+        except BaseException:
+            if outer:
+                log.error(f"faiss_bulk_rollback | discarded={self._dirty} | path={self.persist_path}")
+                self._dirty = 0
+                self._reload()
+            raise
         else:
-            self.index = FAISS.from_documents(documents, self.embedding_model)
+            if outer and (self._dirty or on_save):
+                self.save()
+        finally:
+            self._bulk_depth -= 1
+            if outer:
+                self._checkpoint_every = 0
+                self._on_save = None
+
+    def reopen(self) -> "FAISSStore":
+        """A fresh read-only store on the same directory, e.g. after the indexer saved a new version."""
+        return FAISSStore(persist_path=self.persist_path, embedding_model=self.embedding_model)
 
-        self.index.save_local(self.persist_path)
-        log.info(f"faiss_upsert | count={len(documents)} | path={self.persist_path}")
+    def _reload(self):
+        if self.chunks is not None:
+            self.chunks.close()
+        self.index = None
+        self.chunks = None
+        self._mapped = False
+        self._reset_state()
+        self._was_reset = False
+        if os.path.exists(os.path.join(self.persist_path, INDEX_FILE)):
+            self._load()
 
-    def similarity_search(self, query: str, k: int) -> List[Dict[str, Any]]:
-        if not self.index:
+    def similarity_search(self, query: str, k: int, allowed: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        if self.index is None:
             log.error("faiss_index_missing | reason=Index not loaded")
             return []
-        results = self.index.similarity_search_with_score(query, k=k)
-        return [
-            {"text": doc.page_content, "score": float(score), "meta": doc.metadata}
-            for doc, score in results
-        ]
+        return self.search_by_vectors(self.embed_queries([query]), k, allowed)[0]
+
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        """Embed a batch of queries in one forward pass."""
+        embed = getattr(self.embedding_model, "embed_queries", None)
+        vectors = embed(queries) if embed else [self.embedding_model.embed_query(q) for q in queries]
+        return np.asarray(vectors, dtype=np.float32)
+
+    def search_by_vectors(self, vectors: np.ndarray, k: int, allowed: Optional[np.ndarray] = None) -> List[List[Dict[str, Any]]]:
+        """
+        One `index.search` over a query matrix; per-row results shaped like `similarity_search`.
+        `allowed` (FAISS labels, see app.retrieval.filters) restricts the search to those chunks.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.index is None:
+            log.error("faiss_index_missing | reason=Index not loaded")
+            return [[] for _ in range(len(vectors))]
+        # Over-fetch past tombstoned (deleted but not removable) vectors
+        fetch = k + min(self._tombstones, k)
+        if allowed is not None:
+            if not len(allowed):
+                return [[] for _ in range(len(vectors))]
+            distances, labels = filtered_search(self.index, vectors, fetch, allowed,
+                                                self.settings.faiss_nprobe, self.settings.faiss_ef_search)
+        else:
+            distances, labels = self.index.search(vectors, fetch)
+        # Text and metadata for every hit of the batch in one lookup
+        rows = self._lookup_labels({int(label) for label in labels.ravel() if label != -1})
+        out: List[List[Dict[str, Any]]] = []
+        for row_d, row_l in zip(distances, labels):
+            hits = []
+            seen = set()
+            for dist, label in zip(row_d, row_l):
+                # A chunk re-added after a tombstoned delete has two vectors under one id
+                row = rows.get(int(label)) if label not in seen else None
+                seen.add(label)
+                if row is not None:
+                    hits.append({"text": row["text"], "score": float(dist), "meta": row["meta"]})
+                if len(hits) == k:
+                    break
+            out.append(hits)
+        return out
+
+    def get_documents(self, ids: List[str]) -> List[Optional[Dict[str, Any]]]:
+        """Chunks by id, in order (None for ids no longer in the store)."""
+        if self.index is None:
+            return [None] * len(ids)
+        rows = {i: self._pending[i] for i in ids if i in self._pending}
+        lookup = [i for i in ids if i not in rows and i not in self._deleted]
+        if lookup and self.chunks is not None:
+            rows.update(self.chunks.get(lookup))
+        return [{"id": i, "text": rows[i]["text"], "meta": rows[i]["meta"]} if i in rows else None for i in ids]
 
     def get_all_documents(self) -> List[Dict[str, Any]]:
-        if not self.index:
+        if self.index is None:
             return []
-        docs = self.index.docstore._dict.values()
-        return [{"text": d.page_content, "meta": d.metadata} for d in docs]
\ No newline at end of file
+        docs = [{"id": c["id"], "text": c["text"], "meta": c["meta"]} for c in self._pending.values()]
+        if self.chunks is not None:
+            docs.extend({"id": c["id"], "text": c["text"], "meta": c["meta"]}
+                        for c in self.chunks.all() if c["id"] not in self._deleted and c["id"] not in self._pending)
+        return docs
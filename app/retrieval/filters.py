@@ -0,0 +1,96 @@
+# app/retrieval/filters.py
+"""
+Metadata filters for retrieval, evaluated against the per-document columns of the BM25 index.
+
+A filter is a dict with any of:
+    folder     path prefix or directory name(s) the source file must be under
+    file_type  extension(s), e.g. "pdf" or [".pdf", "docx"]
+    file       file path(s) or base name(s)
+    page_min   first allowed page (inclusive); chunks without a page never match a page bound
+    page_max   last allowed page (inclusive)
+Conditions are ANDed; list values within one condition are ORed.
+
+Matching runs on the small table of distinct source files first; the selected files' position
+lists and the page column then give a boolean mask over index positions. That mask restricts
+BM25 scoring, and its FAISS labels become an ID selector for the vector search, so both
+retrievers only ever rank allowed chunks.
+"""
+from __future__ import annotations
+from typing import Any, Dict, List, Optional
+import numpy as np
+from app.retrieval.bm25 import BM25Index
+
+FILTER_KEYS = ("folder", "file_type", "file", "page_min", "page_max")
+
+
+def _as_list(value: Any) -> List[str]:
+    if value is None:
+        return []
+    values = value if isinstance(value, (list, tuple, set)) else [value]
+    return [str(v) for v in values if str(v).strip()]
+
+
+def normalize_filters(filters: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Drop empty conditions and reject unknown keys; None when nothing is left to filter on."""
+    if not filters:
+        return None
+    unknown = set(filters) - set(FILTER_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown filter field(s) {sorted(unknown)}, expected any of {FILTER_KEYS}")
+    out: Dict[str, Any] = {}
+    for key in ("folder", "file", "file_type"):
+        values = _as_list(filters.get(key))
+        if values:
+            out[key] = values
+    for key in ("page_min", "page_max"):
+        if filters.get(key) is not None:
+            out[key] = int(filters[key])
+    return out or None
+
+
+def _norm_path(path: str) -> str:
+    return "/" + path.replace("\\", "/").strip("/") + "/"
+
+
+def _file_matches(path: str, flt: Dict[str, Any]) -> bool:
+    norm = path.replace("\\", "/")
+    if "folder" in flt:
+        # "reports" matches any .../reports/... directory; "/data/reports" must be a prefix
+        parent = _norm_path(norm.rsplit("/", 1)[0]) if "/" in norm else "/"
+        if not any(parent.startswith(_norm_path(f)) if f.startswith("/") else _norm_path(f) in parent
+                   for f in flt["folder"]):
+            return False
+    if "file_type" in flt:
+        ext = norm.rsplit(".", 1)[-1].lower() if "." in norm.rsplit("/", 1)[-1] else ""
+        if ext not in {t.lower().lstrip(".") for t in flt["file_type"]}:
+            return False
+    if "file" in flt:
+        base = norm.rsplit("/", 1)[-1]
+        if not any(norm == f.replace("\\", "/") or base == f for f in flt["file"]):
+            return False
+    return True
+
+
+def filter_mask(index: BM25Index, filters: Dict[str, Any]) -> np.ndarray:
+    """Boolean mask over `index` positions of the chunks matching `filters`."""
+    if not index.has_facets:
+        raise ValueError("This index has no metadata columns; re-run the indexer to enable filters")
+    n = len(index)
+    if any(k in filters for k in ("folder", "file_type", "file")):
+        codes = [c for c in range(len(index.files)) if _file_matches(index.file_name(c), filters)]
+        mask = np.zeros(n, dtype=bool)
+        for c in codes:
+            mask[index.file_docs[index.file_indptr[c]:index.file_indptr[c + 1]]] = True
+    else:
+        mask = np.ones(n, dtype=bool)
+    if "page_min" in filters or "page_max" in filters:
+        pages = np.asarray(index.doc_page)
+        mask &= pages >= max(filters.get("page_min", 0), 0)
+        if "page_max" in filters:
+            mask &= pages <= filters["page_max"]
+    return mask
+
+
+def allowed_labels(index: BM25Index, mask: np.ndarray) -> np.ndarray:
+    """FAISS labels of the masked positions (input for the vector search ID selector)."""
+    return np.asarray(index.labels)[mask]
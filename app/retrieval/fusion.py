@@ -0,0 +1,95 @@
+# app/retrieval/fusion.py
+from __future__ import annotations
+import hashlib
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+
+FUSION_STRATEGIES = ("rrf", "weighted", "zscore")
+
+
+def doc_key(d: Dict) -> str:
+    """Per-chunk identity for fusion: the chunk id, else a hash of the text (never the source file)."""
+    m = d.get("meta") or {}
+    return m.get("id") or d.get("id") or hashlib.sha1(d.get("text", "").encode("utf-8")).hexdigest()
+
+
+def _oriented(scores: np.ndarray, lower_is_better: bool) -> np.ndarray:
+    # Distances (FAISS L2) become "higher is better" before any score arithmetic
+    return -scores if lower_is_better else scores
+
+
+def _minmax(scores: np.ndarray) -> np.ndarray:
+    lo, hi = float(scores.min()), float(scores.max())
+    if hi - lo < 1e-12:
+        return np.ones_like(scores)
+    return (scores - lo) / (hi - lo)
+
+
+def _zscore(scores: np.ndarray) -> np.ndarray:
+    std = float(scores.std())
+    if std < 1e-12:
+        return np.zeros_like(scores)
+    return (scores - float(scores.mean())) / std
+
+
+def fuse(
+    result_lists: Sequence[List[Dict]],
+    strategy: str = "rrf",
+    weights: Optional[Sequence[float]] = None,
+    lower_is_better: Optional[Sequence[bool]] = None,
+    k_const: int = 60,
+    limit: int = 10,
+) -> List[Dict]:
+    """
+    Fuse ranked result lists (each best-first) into one list keyed by chunk id, in O(total results).
+
+    - rrf: sum of w / (k_const + rank), scaled so a doc ranked first everywhere scores 1.0
+    - weighted: weighted sum of per-list min-max normalized scores (missing = 0)
+    - zscore: weighted sum of per-list z-scores (missing = list minimum), squashed to (0, 1)
+    """
+    if strategy not in FUSION_STRATEGIES:
+        raise ValueError(f"Unknown fusion strategy '{strategy}', expected one of {FUSION_STRATEGIES}")
+    n_lists = len(result_lists)
+    weights = list(weights) if weights is not None else [1.0] * n_lists
+    lower_is_better = list(lower_is_better) if lower_is_better is not None else [False] * n_lists
+
+    base: Dict[str, Dict] = {}
+    per_list: List[Dict[str, float]] = []
+    floors: List[float] = []
+    for results, w, lower in zip(result_lists, weights, lower_is_better):
+        contrib: Dict[str, float] = {}
+        floor = 0.0
+        if results:
+            if strategy == "rrf":
+                values = 1.0 / (k_const + np.arange(1, len(results) + 1, dtype=np.float64))
+            else:
+                raw = _oriented(np.asarray([float(d.get("score", 0.0)) for d in results]), lower)
+                values = _minmax(raw) if strategy == "weighted" else _zscore(raw)
+                if strategy == "zscore":
+                    # Docs absent from this list are treated as scoring at its floor
+                    floor = float(values.min())
+            for d, v in zip(results, values):
+                key = doc_key(d)
+                if key not in contrib:  # first (best) occurrence wins
+                    contrib[key] = w * float(v)
+                    base.setdefault(key, d)
+        per_list.append(contrib)
+        floors.append(w * floor)
+
+    fused = {key: sum(c.get(key, f) for c, f in zip(per_list, floors)) for key in base}
+
+    if strategy == "rrf":
+        scale = sum(weights) / (k_const + 1)
+        final = {k: v / scale for k, v in fused.items()} if scale > 0 else fused
+    elif strategy == "zscore":
+        final = {k: float(1.0 / (1.0 + np.exp(-v))) for k, v in fused.items()}
+    else:
+        total = sum(weights) or 1.0
+        final = {k: v / total for k, v in fused.items()}
+
+    ranked = sorted(final.items(), key=lambda kv: kv[1], reverse=True)[:limit]
+    return [{**base[k], "score": float(s)} for k, s in ranked]
+
+
+def reciprocal_rank_fusion(list1: List[Dict], list2: List[Dict], k_const: int = 60, limit: int = 10) -> List[Dict]:
+    return fuse([list1, list2], strategy="rrf", k_const=k_const, limit=limit)
@@ -1,76 +1,195 @@
 # app/retrieval/hybrid_retriever.py
-from typing import List, Dict
-from app.retrieval.faiss_store import FAISSStore
-from app.retrieval.bm25 import BM25Retriever
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Dict, Optional, Tuple
+import logging
+import threading
+import time
+import numpy as np
+from app.retrieval.faiss_store import read_index_version
+from app.retrieval.sharded_store import VectorStore, open_vector_store
+from app.retrieval.bm25 import BM25Index, BM25_DIRNAME
+from app.retrieval.filters import allowed_labels, filter_mask, normalize_filters
+from app.retrieval.query_batcher import QueryBatcher
+from app.retrieval.reranker import CrossEncoderReranker
+from app.retrieval.fusion import fuse, reciprocal_rank_fusion  # noqa: F401  (re-exported for callers)
 from app.core.config import get_settings
 from app.core.logging import setup_logging
+from app.core.metrics import bind, stage
 
 log = setup_logging()
 
-def reciprocal_rank_fusion(list1: List[Dict], list2: List[Dict], k_const: int = 60, limit: int = 10) -> List[Dict]:
-    def key(d: Dict) -> str:
-        m = d.get("meta", {})
-        return m.get("id") or m.get("file") or d["text"][:64]
-
-    ranks1 = {key(d): r for r, d in enumerate(list1, start=1)}
-    ranks2 = {key(d): r for r, d in enumerate(list2, start=1)}
-    all_keys = set(ranks1) | set(ranks2)
-    fused = []
-    for k in all_keys:
-        r1 = ranks1.get(k, 10**6)
-        r2 = ranks2.get(k, 10**6)
-        score = 1/(k_const + r1) + 1/(k_const + r2)
-        base = next((d for d in list1 if key(d) == k), None) or next((d for d in list2 if key(d) == k), None)
-        fused.append({**base, "score": float(score)})
-    fused.sort(key=lambda d: d["score"], reverse=True)
-    return fused[:limit]
-
-def normalize(scores: List[Dict]) -> List[Dict]:
-    max_score = max((d["score"] for d in scores), default=1)
-    return [{**d, "score": d["score"] / max_score} for d in scores]
-
 class HybridRetriever:
-    def __init__(self, store: FAISSStore | None = None):
+    def __init__(self, store: VectorStore | None = None):
         self.settings = get_settings()
-        self.store = store or FAISSStore()
-        self._bm25 = None
+        # Read before opening: a save racing startup then only costs one extra reload
+        self.version = read_index_version(store.persist_path if store else self.settings.faiss_path)
+        self.store = store or open_vector_store()
+        self._bm25: BM25Index | None = None
+        self._refresh_lock = threading.Lock()
+        # Concurrent queries share one embedding forward pass and one FAISS search
+        self.batcher: QueryBatcher | None = None
+        if self.settings.query_batch_max_size > 1:
+            self.batcher = QueryBatcher(self.store, self.settings.query_batch_max_size, self.settings.query_batch_max_wait_ms)
+        # Vector and lexical searches run side by side; FAISS and NumPy release the GIL
+        self._pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="hybrid")
+        self.reranker: CrossEncoderReranker | None = None
+        if self.settings.rerank_enabled:
+            self.reranker = CrossEncoderReranker(
+                self.settings.rerank_model,
+                candidates=self.settings.rerank_candidates,
+                batch_size=self.settings.rerank_batch_size,
+                cache_size=self.settings.rerank_cache_size,
+                latency_budget_ms=self.settings.rerank_latency_budget_ms,
+            )
+        # Load the persisted lexical index at startup rather than on the first query
+        self._ensure_bm25()
+
+    @staticmethod
+    def _load_bm25(store: VectorStore) -> BM25Index:
+        start = time.perf_counter()
+        path = Path(store.persist_path) / BM25_DIRNAME
+        if BM25Index.exists(path):
+            bm25 = BM25Index.load(path)
+        else:
+            # Legacy index without a persisted BM25 index: build it in memory from the docstore
+            corpus = store.get_all_documents()
+            bm25 = BM25Index.build((d["id"] for d in corpus), (d["text"] for d in corpus), (d["meta"] for d in corpus))
+        log.info(f"bm25_ready | docs={len(bm25)} | duration_ms={round((time.perf_counter() - start) * 1000, 1)}")
+        return bm25
 
     def _ensure_bm25(self):
         if self._bm25 is None:
+            self._bm25 = self._load_bm25(self.store)
+
+    def stale(self) -> bool:
+        """True once the indexer has saved a VERSION other than the one this retriever loaded."""
+        return read_index_version(self.store.persist_path) != self.version
+
+    def refresh(self) -> bool:
+        """Swap in the index the indexer last saved; True if it reloaded. Queries in flight finish on the old one."""
+        with self._refresh_lock:
+            version = read_index_version(self.store.persist_path)
+            if version == self.version:
+                return False
+            start = time.perf_counter()
+            store = self.store.reopen()
+            bm25 = self._load_bm25(store)
+            # Store and lexical index come from the same save; swap them together
+            self.store, self._bm25 = store, bm25
+            if self.batcher is not None:
+                self.batcher.store = store
+            log.info(f"index_reloaded | old={self.version} | new={version} | duration_ms={round((time.perf_counter() - start) * 1000, 1)}")
+            self.version = version
+            return True
+
+    def prefilter(self, filters: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """Mask over lexical-index positions for metadata `filters`; None when nothing is excluded."""
+        filters = normalize_filters(filters)
+        if filters is None:
+            return None
+        self._ensure_bm25()
+        if not self._bm25.has_facets:
+            # Lexical index saved before metadata columns existed: rebuild it once in memory
+            log.warning("bm25_facets_backfill | note=re-run the indexer to persist metadata columns")
             corpus = self.store.get_all_documents()
-            log.info("bm25_init", extra={"corpus_size": len(corpus)})
-            self._bm25 = BM25Retriever(corpus[:1000])
+            self._bm25 = BM25Index.build((d["id"] for d in corpus), (d["text"] for d in corpus), (d["meta"] for d in corpus))
+        with stage("filter"):
+            mask = filter_mask(self._bm25, filters)
+        log.info(f"retrieval_filter | filters={filters} | allowed={int(mask.sum())} | total={len(mask)}")
+        return None if mask.all() else mask
+
+    def vector_search(self, query: str, k: int, mask: Optional[np.ndarray] = None) -> List[Dict]:
+        # Scores are FAISS L2 distances: lower is better
+        # Filtered searches carry their own ID selector, so they skip the micro-batcher
+        if self.batcher is not None and mask is None:
+            # Queue wait, shared embedding and shared search; the batcher times the last two per batch
+            with stage("vector_batch"):
+                return self.batcher.search(query, k)
+        with stage("embed"):
+            vectors = self.store.embed_queries([query])
+        with stage("vector_search"):
+            allowed = allowed_labels(self._bm25, mask) if mask is not None else None
+            return self.store.search_by_vectors(vectors, k, allowed)[0]
 
-    def retrieve(self, query: str) -> List[Dict]:
+    def vector_search_many(self, queries: List[str], k: int, mask: Optional[np.ndarray] = None) -> List[List[Dict]]:
+        """One embedding pass and one FAISS search for a whole batch of queries."""
+        if not queries:
+            return []
+        with stage("embed"):
+            vectors = self.store.embed_queries(queries)
+        with stage("vector_search"):
+            allowed = allowed_labels(self._bm25, mask) if mask is not None else None
+            return self.store.search_by_vectors(vectors, k, allowed)
+
+    def lexical_search(self, query: str, k: int, mask: Optional[np.ndarray] = None) -> List[Dict]:
         self._ensure_bm25()
-        k = self.settings.top_k
-        log.info("retrieval_start", extra={"query": query})
-
-        vec = normalize(self.store.similarity_search(query, k=k))
-        log.info("vector_results", extra={
-            "count": len(vec),
-            "top_preview": vec[0]["text"][:80] if vec else "none"
-        })
-        print("vector results-",len(vec))
-
-        bm25 = normalize(self._bm25.search(query, k=k))
-        log.info("bm25_results", extra={
-            "count": len(bm25),
-            "top_preview": bm25[0]["text"][:80] if bm25 else "none"
-        })
-        print("bm25 results-", len(bm25))
-
-        #fused = reciprocal_rank_fusion(vec, bm25, limit=k)
-        fused=vec
-        for i, ch in enumerate(fused):
-            log.info("fused_chunk", extra={
-                "index": i,
-                "score": ch["score"],
-                "source": ch.get("meta", {}).get("file", ch.get("meta", {}).get("id", "unknown")),
-                "length": len(ch.get("text", ""))
-            })
+        with stage("bm25"):
+            hits = self._bm25.search(query, k, mask)
+            docs = self.store.get_documents([self._bm25.doc_id(pos) for pos, _ in hits])
+        return [
+            {"text": d["text"], "score": score, "meta": d["meta"]}
+            for (_, score), d in zip(hits, docs) if d is not None
+        ]
+
+    def fuse(self, vec: List[Dict], bm25: List[Dict], k: int, strategy: str | None = None) -> List[Dict]:
+        alpha = self.settings.hybrid_alpha
+        with stage("fusion"):
+            return fuse(
+                [vec, bm25],
+                strategy=strategy or self.settings.fusion_strategy,
+                weights=[alpha, 1.0 - alpha],
+                lower_is_better=[True, False],
+                k_const=self.settings.rrf_k,
+                limit=k,
+            )
+
+    def fetch_sizes(self, k: int | None = None) -> Tuple[int, int]:
+        """(final k, candidates fetched per retriever before fusion)."""
+        k = k or self.settings.top_k
+        fetch_k = max(k, self.settings.hybrid_fetch_k)
+        if self.reranker is not None:
+            fetch_k = max(fetch_k, self.reranker.candidates)
+        return k, fetch_k
+
+    def retrieve(self, query: str, k: int | None = None, strategy: str | None = None,
+                 filters: Optional[Dict[str, Any]] = None) -> List[Dict]:
+        k, fetch_k = self.fetch_sizes(k)
+        log.info(f"retrieval_start | top_k={k} | fetch_k={fetch_k}")
+        # Filters are applied before scoring in both retrievers, never by post-filtering hits
+        mask = self.prefilter(filters)
+
+        vec_future = self._pool.submit(bind(self.vector_search), query, fetch_k, mask)
+        bm25_future = self._pool.submit(bind(self.lexical_search), query, fetch_k, mask)
+        vec, bm25 = vec_future.result(), bm25_future.result()
+        log.info(f"retrieval_candidates | vector={len(vec)} | bm25={len(bm25)}")
+        return self._rank(query, vec, bm25, k, strategy)
+
+    def retrieve_many(self, queries: List[str], k: int | None = None, strategy: str | None = None,
+                      filters: Optional[Dict[str, Any]] = None) -> List[List[Dict]]:
+        """`retrieve` for a batch: the vector side is one embedding call and one FAISS search."""
+        k, fetch_k = self.fetch_sizes(k)
+        mask = self.prefilter(filters)
+        # BM25 scores query by query on this thread while the batched vector search runs
+        vec_future = self._pool.submit(bind(self.vector_search_many), queries, fetch_k, mask)
+        bm25 = [self.lexical_search(q, fetch_k, mask) for q in queries]
+        vec = vec_future.result()
+        log.info(f"retrieval_batch | queries={len(queries)} | top_k={k} | fetch_k={fetch_k}")
+        return [self._rank(q, v, b, k, strategy) for q, v, b in zip(queries, vec, bm25)]
+
+    def _rank(self, query: str, vec: List[Dict], bm25: List[Dict], k: int, strategy: str | None) -> List[Dict]:
+        if self.reranker is not None:
+            candidates = self.fuse(vec, bm25, self.reranker.candidates, strategy=strategy)
+            with stage("rerank"):
+                fused = self.reranker.rerank(query, candidates, k)
+        else:
+            fused = self.fuse(vec, bm25, k, strategy=strategy)
+        if log.isEnabledFor(logging.DEBUG):
+            for i, ch in enumerate(fused):
+                meta = ch.get("meta", {})
+                log.debug(f"fused_chunk | index={i} | score={round(ch['score'], 4)} | source={meta.get('file', meta.get('id', 'unknown'))} | length={len(ch.get('text', ''))}")
 
         if not fused:
-            log.warning("retrieval_empty", extra={"query": query})
+            log.warning("retrieval_empty")
 
-        return fused
\ No newline at end of file
+        return fused
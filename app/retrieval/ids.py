@@ -0,0 +1,17 @@
+# app/retrieval/ids.py
+from __future__ import annotations
+import hashlib
+from typing import Iterable
+import numpy as np
+
+_MASK = (1 << 63) - 1
+
+
+def chunk_int_id(chunk_id: str) -> int:
+    """Stable non-negative int64 for a chunk id (FAISS ids); 63-bit hash, so never -1."""
+    digest = hashlib.blake2b(chunk_id.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") & _MASK
+
+
+def chunk_int_ids(chunk_ids: Iterable[str]) -> np.ndarray:
+    return np.fromiter((chunk_int_id(c) for c in chunk_ids), dtype=np.int64)
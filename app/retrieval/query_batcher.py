@@ -0,0 +1,98 @@
+# app/retrieval/query_batcher.py
+from __future__ import annotations
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Tuple
+from app.retrieval.sharded_store import VectorStore
+from app.core.logging import setup_logging
+from app.core.metrics import observe
+
+log = setup_logging()
+
+
+class QueryBatcher:
+    """
+    Micro-batches concurrent vector searches.
+
+    Callers (request threads) enqueue a query and block on a Future. A single worker thread takes
+    the first waiting query, keeps collecting for up to `max_wait_ms` or until `max_batch` queries,
+    then embeds the distinct questions in one model call, runs one FAISS search over the query
+    matrix (at the largest k requested) and hands each caller its own slice.
+    An idle batcher adds no delay beyond one queue hop: a lone query waits at most `max_wait_ms`.
+    """
+
+    def __init__(self, store: VectorStore, max_batch: int = 32, max_wait_ms: float = 2.0):
+        self.store = store
+        self.max_batch = max(1, max_batch)
+        self.max_wait_s = max(0.0, max_wait_ms) / 1000.0
+        self._queue: "queue.Queue[Tuple[str, int, Future]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self.stats = {"queries": 0, "batches": 0, "max_batch_seen": 0}
+        self._worker = threading.Thread(target=self._run, name="query-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, query: str, k: int) -> Future:
+        fut: Future = Future()
+        self._queue.put((query, k, fut))
+        return fut
+
+    def search(self, query: str, k: int) -> List[Dict[str, Any]]:
+        return self.submit(query, k).result()
+
+    @property
+    def mean_batch_size(self) -> float:
+        return self.stats["queries"] / self.stats["batches"] if self.stats["batches"] else 0.0
+
+    def _collect(self) -> List[Tuple[str, int, Future]]:
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait_s
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                # Drain whatever is already queued without waiting, then wait out the window
+                batch.append(self._queue.get_nowait() if remaining <= 0 else self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            batch = [item for item in batch if item[2].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                self._process(batch)
+            except Exception as e:
+                log.error(f"query_batch_error | size={len(batch)} | error={str(e)}")
+                for _, _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+
+    def _process(self, batch: List[Tuple[str, int, Future]]):
+        start = time.perf_counter()
+        unique: Dict[str, int] = {}
+        for q, _, _ in batch:
+            unique.setdefault(q, len(unique))
+        queries = list(unique)
+        vectors = self.store.embed_queries(queries)
+        embedded = time.perf_counter()
+        k_max = max(k for _, k, _ in batch)
+        results = self.store.search_by_vectors(vectors, k_max)
+        searched = time.perf_counter()
+        for q, k, fut in batch:
+            fut.set_result(results[unique[q]][:k])
+        # Once per batch: the worker thread belongs to no single request trace
+        observe("embed", embedded - start)
+        observe("vector_search", searched - embedded)
+
+        with self._lock:
+            self.stats["queries"] += len(batch)
+            self.stats["batches"] += 1
+            self.stats["max_batch_seen"] = max(self.stats["max_batch_seen"], len(batch))
+        log.info(
+            f"query_batch | size={len(batch)} | unique={len(queries)} | k={k_max}"
+            f" | embed_ms={round((embedded - start) * 1000, 1)} | search_ms={round((searched - embedded) * 1000, 1)}"
+        )
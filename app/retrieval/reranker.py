@@ -0,0 +1,135 @@
+# app/retrieval/reranker.py
+from __future__ import annotations
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Dict, List, Optional, Sequence
+from app.retrieval.embedding_cache import normalize_text
+from app.retrieval.fusion import doc_key
+from app.core.logging import setup_logging
+
+log = setup_logging()
+
+
+def _sigmoid(x: float) -> float:
+    return 1.0 / (1.0 + math.exp(-x)) if x >= 0 else math.exp(x) / (1.0 + math.exp(x))
+
+
+class CrossEncoderReranker:
+    """
+    Second-stage reranker: scores (query, chunk) pairs with a local cross-encoder.
+
+    All uncached pairs of a query are scored in one batched `predict` call. Pair scores are kept in
+    an LRU keyed by (query, chunk id), so repeated or paraphrase-free retries cost nothing. If the
+    model does not finish within `latency_budget_ms`, the first-stage order is returned instead; a call
+    already running finishes in the background to warm the cache, one still queued is dropped, so
+    the backlog never outgrows the callers waiting on it. The model loads lazily; if
+    sentence-transformers is missing, reranking is a no-op.
+    """
+
+    def __init__(self, model_name: str, candidates: int = 50, batch_size: int = 32, cache_size: int = 20000,
+                 latency_budget_ms: float = 300.0, model: Any = None):
+        self.model_name = model_name
+        self.candidates = candidates
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self.latency_budget_ms = latency_budget_ms
+        self._model = model
+        self._model_failed = False
+        self._load_lock = threading.Lock()
+        self._cache: "OrderedDict[bytes, float]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # One scoring call at a time: the model already uses all cores for a batch
+        self._scorer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+        self.stats = {"queries": 0, "pairs": 0, "cache_hits": 0, "scored": 0, "budget_fallbacks": 0,
+                      "dropped": 0}
+
+    def _get_model(self):
+        if self._model is not None or self._model_failed:
+            return self._model
+        with self._load_lock:
+            if self._model is None and not self._model_failed:
+                try:
+                    from sentence_transformers import CrossEncoder
+                    start = time.perf_counter()
+                    self._model = CrossEncoder(self.model_name)
+                    log.info(f"reranker_loaded | model={self.model_name} | duration_ms={round((time.perf_counter() - start) * 1000, 1)}")
+                except Exception as e:
+                    self._model_failed = True
+                    log.error(f"reranker_load_error | model={self.model_name} | error={str(e)}")
+        return self._model
+
+    def warmup(self):
+        model = self._get_model()
+        if model is not None:
+            model.predict([("warmup", "warmup")], batch_size=1)
+
+    def _key(self, query: str, doc: Dict[str, Any]) -> bytes:
+        h = hashlib.blake2b(digest_size=16)
+        h.update(f"{normalize_text(query).lower()}\x00{doc_key(doc)}".encode("utf-8"))
+        return h.digest()
+
+    def _score(self, model, pairs: Sequence[tuple], keys: Sequence[bytes], deadline: Optional[float] = None) -> Optional[List[float]]:
+        if deadline is not None and time.perf_counter() > deadline:
+            # Its query already fell back; scoring it now would only delay the queries behind it
+            with self._cache_lock:
+                self.stats["dropped"] += 1
+            return None
+        scores = [float(s) for s in model.predict(list(pairs), batch_size=self.batch_size)]
+        with self._cache_lock:
+            for k, s in zip(keys, scores):
+                self._cache[k] = s
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            self.stats["scored"] += len(scores)
+        return scores
+
+    def rerank(self, query: str, docs: List[Dict[str, Any]], k: int) -> List[Dict[str, Any]]:
+        """Top-k of `docs` by cross-encoder score (sigmoid, in `score`), or first-stage top-k on fallback."""
+        model = self._get_model()
+        if model is None or not docs:
+            return docs[:k]
+        start = time.perf_counter()
+        keys = [self._key(query, d) for d in docs]
+        scores: Dict[bytes, float] = {}
+        with self._cache_lock:
+            for key in keys:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    scores[key] = self._cache[key]
+            self.stats["queries"] += 1
+            self.stats["pairs"] += len(keys)
+            self.stats["cache_hits"] += len(scores)
+
+        missing = [i for i, key in enumerate(keys) if key not in scores]
+        if missing:
+            pairs = [(query, docs[i].get("text", "")) for i in missing]
+            miss_keys = [keys[i] for i in missing]
+            budget = self.latency_budget_ms / 1000.0 if self.latency_budget_ms > 0 else None
+            future = self._scorer.submit(self._score, model, pairs, miss_keys,
+                                         time.perf_counter() + budget if budget is not None else None)
+            try:
+                scores.update(zip(miss_keys, future.result(timeout=budget)))
+            except FutureTimeout:
+                # Keep the first-stage order; a call already running still fills the cache for next time
+                if future.cancel():
+                    with self._cache_lock:
+                        self.stats["dropped"] += 1
+                self.stats["budget_fallbacks"] += 1
+                log.warning(f"rerank_budget_exceeded | pairs={len(pairs)} | budget_ms={self.latency_budget_ms}")
+                return docs[:k]
+            except Exception as e:
+                log.error(f"rerank_error | error={str(e)}")
+                return docs[:k]
+
+        order = sorted(range(len(docs)), key=lambda i: scores[keys[i]], reverse=True)[:k]
+        out = [{**docs[i], "score": _sigmoid(scores[keys[i]]), "first_stage_score": docs[i].get("score"),
+                "first_stage_rank": i} for i in order]
+        log.info(
+            f"rerank | candidates={len(docs)} | scored={len(missing)} | cached={len(docs) - len(missing)}"
+            f" | top_k={k} | duration_ms={round((time.perf_counter() - start) * 1000, 1)}"
+        )
+        return out
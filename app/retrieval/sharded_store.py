@@ -0,0 +1,305 @@
+# app/retrieval/sharded_store.py
+from __future__ import annotations
+import heapq
+import json
+import os
+import shutil
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Union
+import numpy as np
+from app.core.config import get_settings
+from app.core.logging import setup_logging
+from app.retrieval.embedding_cache import make_embeddings
+from app.retrieval.faiss_store import INDEX_VERSION_FILE, FAISSStore
+from app.retrieval.ids import chunk_int_id
+from app.utils.fs import atomic_write_dir, carry_over, recover_dir
+
+log = setup_logging()
+
+SHARD_LAYOUT_FILE = "shards.json"
+SHARD_STRATEGIES = ("hash", "source")
+
+
+def shard_root(persist_path: str | os.PathLike) -> Path:
+    """Shards live next to the root index directory: <faiss_path>-shards/000, 001, ..."""
+    root = Path(persist_path)
+    return root.with_name(f"{root.name}-shards")
+
+
+def read_shard_layout(persist_path: str | os.PathLike) -> Optional[Dict[str, Any]]:
+    try:
+        return json.loads((Path(persist_path) / SHARD_LAYOUT_FILE).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+class ShardedFAISSStore:
+    """
+    N independent FAISSStore shards behind the FAISSStore interface.
+
+    Chunks are routed by chunk id (`hash`, even spread) or by source file (`source`, so
+    re-indexing a document rewrites a single shard). Each shard is its own index directory,
+    saved only when it changed. Searches fan out to all shards on a thread pool (FAISS releases
+    the GIL) and the per-shard top-k lists are merged with a heap. The root directory
+    (`faiss_path`) keeps what is corpus-wide: the shard layout, VERSION and the indexer's
+    companion files (BM25, manifest), saved after the shards so it never runs ahead of them.
+    """
+
+    def __init__(self, writable_cache: bool = False, num_shards: Optional[int] = None,
+                 shard_by: Optional[str] = None, workers: Optional[int] = None, embedding_model=None):
+        self.settings = get_settings()
+        self.persist_path = self.settings.faiss_path or "./faiss_index"
+        self.embedding_model = embedding_model or make_embeddings(writable_cache=writable_cache)
+        self._writable_cache = writable_cache
+        if writable_cache:
+            recover_dir(self.persist_path)
+
+        layout = read_shard_layout(self.persist_path)
+        if layout is not None and num_shards is None and shard_by is None:
+            # Searches must use the layout the index was built with; FAISS_SHARDS applies on --full
+            num_shards, shard_by = layout["shards"], layout["shard_by"]
+        self.num_shards = num_shards or self.settings.faiss_shards
+        self.shard_by = shard_by or self.settings.faiss_shard_by
+        if self.shard_by not in SHARD_STRATEGIES:
+            raise ValueError(f"Unknown shard strategy '{self.shard_by}', expected one of {SHARD_STRATEGIES}")
+        self.shards = self._open_shards()
+        self._pool = ThreadPoolExecutor(max_workers=workers or self.settings.faiss_shard_workers or self.num_shards,
+                                        thread_name_prefix="shard")
+
+        self._bulk_depth = 0
+        self._dirty = 0
+        self._checkpoint_every = 0
+        self._on_save: Optional[Callable[[Path], None]] = None
+        self._was_reset = False
+        loaded = sum(1 for s in self.shards if s.index is not None)
+        log.info(f"shards_loaded | shards={self.num_shards} | loaded={loaded} | shard_by={self.shard_by} | path={self.persist_path}")
+
+    def reopen(self) -> "ShardedFAISSStore":
+        """A fresh read-only store on the same directory, picking up the saved layout."""
+        return ShardedFAISSStore(embedding_model=self.embedding_model)
+
+    def _open_shards(self) -> List[FAISSStore]:
+        base = shard_root(self.persist_path)
+        return [FAISSStore(writable_cache=self._writable_cache, persist_path=str(base / f"{i:03d}"),
+                           embedding_model=self.embedding_model) for i in range(self.num_shards)]
+
+    # ---- FAISSStore interface ----------------------------------------------------------------
+
+    @property
+    def index(self) -> Optional[List[Any]]:
+        """Loaded shard indexes, or None when every shard is empty (mirrors FAISSStore.index)."""
+        return [s.index for s in self.shards if s.index is not None] or None
+
+    @property
+    def tombstones(self) -> int:
+        return sum(s.tombstones for s in self.shards)
+
+    def shard_for(self, doc: Dict[str, Any]) -> int:
+        if self.shard_by == "source":
+            key = (doc.get("meta") or {}).get("file") or doc["id"]
+        else:
+            key = doc["id"]
+        return chunk_int_id(key) % self.num_shards
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embedding_model.embed_documents(texts)
+
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        return self.shards[0].embed_queries(queries)
+
+    def upsert(self, docs: List[Dict[str, Any]]):
+        docs = [d for d in docs or [] if d.get("text")]
+        if not docs:
+            return
+        docs = [{**d, "id": d.get("id") or d["meta"].get("id") or str(uuid.uuid4())} for d in docs]
+        self.add_embeddings(docs, self.embed_documents([d["text"] for d in docs]))
+
+    def add_embeddings(self, docs: List[Dict[str, Any]], vectors: List[List[float]]) -> List[str]:
+        groups: Dict[int, tuple] = {}
+        for d, v in zip(docs, vectors):
+            batch = groups.setdefault(self.shard_for(d), ([], []))
+            batch[0].append(d)
+            batch[1].append(v)
+        added: List[str] = []
+        with self.bulk():
+            for i, (shard_docs, shard_vectors) in groups.items():
+                added.extend(self.shards[i].add_embeddings(shard_docs, shard_vectors))
+            self._written(len(added))
+        return added
+
+    def delete(self, ids: List[str]) -> int:
+        if not ids:
+            return 0
+        with self.bulk():
+            if self.shard_by == "hash":
+                routed: Dict[int, List[str]] = {}
+                for i in ids:
+                    routed.setdefault(chunk_int_id(i) % self.num_shards, []).append(i)
+                removed = sum(self.shards[s].delete(part) for s, part in routed.items())
+            else:
+                # Only the chunk's source picks its shard; each shard ignores ids it does not hold
+                removed = sum(s.delete(ids) for s in self.shards)
+            self._written(removed)
+        return removed
+
+    def reset(self):
+        configured = (self.settings.faiss_shards, self.settings.faiss_shard_by)
+        if configured != (self.num_shards, self.shard_by):
+            # A full rebuild is the one point where the layout may change
+            log.info(f"shards_relayout | shards={self.num_shards}->{configured[0]} | shard_by={self.shard_by}->{configured[1]}")
+            self.num_shards, self.shard_by = configured
+            self.shards = self._open_shards()
+            for shard in self.shards:
+                shard._bulk_depth = self._bulk_depth
+        with self.bulk():
+            for shard in self.shards:
+                shard.reset()
+            self._was_reset = True
+            self._written(1)
+
+    def _written(self, n: int):
+        self._dirty += n
+        if self._checkpoint_every and self._dirty >= self._checkpoint_every:
+            log.info(f"shards_checkpoint | pending={self._dirty} | path={self.persist_path}")
+            self.save()
+
+    def save(self):
+        """Save every changed shard, then the root directory (layout, VERSION, companion files)."""
+        start = time.perf_counter()
+        saved = 0
+        for shard in self.shards:
+            if shard._dirty or shard._was_reset:
+                shard.save()
+                saved += 1
+
+        def _write(staging: Path):
+            layout = {"shards": self.num_shards, "shard_by": self.shard_by}
+            (staging / SHARD_LAYOUT_FILE).write_text(json.dumps(layout), encoding="utf-8")
+            if self._on_save:
+                self._on_save(staging)
+            (staging / INDEX_VERSION_FILE).write_text(f"{time.time_ns()}-{uuid.uuid4().hex[:8]}", encoding="utf-8")
+            if not self._was_reset:
+                carry_over(self.persist_path, staging)
+
+        atomic_write_dir(self.persist_path, _write)
+        if self._was_reset:
+            self._drop_orphan_shards()
+        self._dirty = 0
+        self._was_reset = False
+        log.info(f"shards_saved | saved={saved} | shards={self.num_shards} | duration_ms={round((time.perf_counter() - start) * 1000, 1)}")
+
+    def _drop_orphan_shards(self):
+        base = shard_root(self.persist_path)
+        keep = {f"{i:03d}" for i in range(self.num_shards)}
+        for entry in base.iterdir() if base.exists() else []:
+            if entry.is_dir() and not entry.name.startswith(".") and entry.name not in keep:
+                shutil.rmtree(entry, ignore_errors=True)
+                log.info(f"shard_removed | path={entry}")
+
+    @contextmanager
+    def bulk(self, checkpoint_every: int = 0, on_save: Optional[Callable[[Path], None]] = None):
+        """
+        Same contract as FAISSStore.bulk, across all shards: every shard buffers its writes and
+        the whole set is saved on successful exit (or at checkpoints); on error each shard rolls
+        back to its last save. Nested calls join the outer transaction.
+        """
+        outer = self._bulk_depth == 0
+        if outer:
+            self._checkpoint_every = checkpoint_every
+            self._on_save = on_save
+        self._bulk_depth += 1
+        try:
+            with ExitStack() as stack:
+                if outer:
+                    # Shards only buffer; saving (and checkpointing) is coordinated here
+                    for shard in self.shards:
+                        shard._bulk_depth += 1
+                    stack.callback(self._leave_shard_bulk)
+                try:
+                    yield self
+                except BaseException:
+                    if outer:
+                        log.error(f"shards_bulk_rollback | discarded={self._dirty} | path={self.persist_path}")
+                        self._dirty = 0
+                        self._was_reset = False
+                        self._rollback_shards()
+                    raise
+                if outer and (self._dirty or on_save):
+                    self.save()
+        finally:
+            self._bulk_depth -= 1
+            if outer:
+                self._checkpoint_every = 0
+                self._on_save = None
+
+    def _rollback_shards(self):
+        layout = read_shard_layout(self.persist_path)
+        if layout is not None and (layout["shards"], layout["shard_by"]) != (self.num_shards, self.shard_by):
+            # An aborted --full rebuild under a new layout: go back to the one on disk
+            self.num_shards, self.shard_by = layout["shards"], layout["shard_by"]
+            self.shards = self._open_shards()
+            return
+        for shard in self.shards:
+            shard._dirty = 0
+            shard._reload()
+
+    def _leave_shard_bulk(self):
+        for shard in self.shards:
+            shard._bulk_depth = max(0, shard._bulk_depth - 1)
+
+    # ---- search ------------------------------------------------------------------------------
+
+    def similarity_search(self, query: str, k: int, allowed: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        return self.search_by_vectors(self.embed_queries([query]), k, allowed)[0]
+
+    def search_by_vectors(self, vectors: np.ndarray, k: int, allowed: Optional[np.ndarray] = None) -> List[List[Dict[str, Any]]]:
+        """Scatter the query matrix to every shard in parallel, gather the global top-k per row."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        live = [i for i, s in enumerate(self.shards) if s.index is not None]
+        if not live:
+            log.error("faiss_index_missing | reason=No shard loaded")
+            return [[] for _ in range(len(vectors))]
+        parts = {i: allowed for i in live}
+        if allowed is not None and self.shard_by == "hash":
+            # Labels are routed like chunk ids, so each shard only gets the ones it can hold
+            owner = allowed % self.num_shards
+            parts = {i: allowed[owner == i] for i in live}
+        per_shard = list(self._pool.map(lambda i: self.shards[i].search_by_vectors(vectors, k, parts[i]), live))
+        # L2 distances: lower is better; each shard list is already sorted
+        return [list(heapq.merge(*(rows[q] for rows in per_shard), key=lambda h: h["score"]))[:k]
+                for q in range(len(vectors))]
+
+    def get_documents(self, ids: List[str]) -> List[Optional[Dict[str, Any]]]:
+        if self.shard_by == "hash":
+            out: List[Optional[Dict[str, Any]]] = [None] * len(ids)
+            routed: Dict[int, List[int]] = {}
+            for pos, i in enumerate(ids):
+                routed.setdefault(chunk_int_id(i) % self.num_shards, []).append(pos)
+            for s, positions in routed.items():
+                for pos, doc in zip(positions, self.shards[s].get_documents([ids[p] for p in positions])):
+                    out[pos] = doc
+            return out
+        found: List[Optional[Dict[str, Any]]] = [None] * len(ids)
+        for shard in self.shards:
+            for pos, doc in enumerate(shard.get_documents(ids)):
+                if doc is not None:
+                    found[pos] = doc
+        return found
+
+    def get_all_documents(self) -> List[Dict[str, Any]]:
+        return [d for s in self.shards for d in s.get_all_documents()]
+
+
+VectorStore = Union[FAISSStore, ShardedFAISSStore]
+
+
+def open_vector_store(writable_cache: bool = False, embedding_model=None) -> VectorStore:
+    """The configured store: sharded when FAISS_SHARDS > 1 or the index on disk is sharded."""
+    settings = get_settings()
+    if settings.faiss_shards > 1 or read_shard_layout(settings.faiss_path or "./faiss_index") is not None:
+        return ShardedFAISSStore(writable_cache=writable_cache, embedding_model=embedding_model)
+    return FAISSStore(writable_cache=writable_cache, embedding_model=embedding_model)
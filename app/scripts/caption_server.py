@@ -0,0 +1,112 @@
+# app/scripts/caption_server.py
+"""
+Persistent FastVLM caption server for SubprocessCaptioner (app/ingestion/captioner.py).
+
+Loads the model once, prints {"ready": true}, then reads {"images": [paths]} JSON lines on stdin
+and answers each with {"captions": [...]} (null for images that failed) until stdin closes.
+Needs the ml-fastvlm package (`llava`) importable, e.g. `pip install -e ml-fastvlm`.
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import sys
+from typing import List, Optional
+
+
+class FastVLM:
+    def __init__(self, model_path: str, prompt: str, conv_mode: str = "qwen_2", max_new_tokens: int = 256):
+        import torch
+        from llava.constants import DEFAULT_IM_END_TOKEN, DEFAULT_IM_START_TOKEN, DEFAULT_IMAGE_TOKEN, IMAGE_TOKEN_INDEX
+        from llava.conversation import conv_templates
+        from llava.mm_utils import get_model_name_from_path, process_images, tokenizer_image_token
+        from llava.model.builder import load_pretrained_model
+        from llava.utils import disable_torch_init
+
+        self.torch = torch
+        self.process_images = process_images
+        self.max_new_tokens = max_new_tokens
+        if torch.cuda.is_available():
+            self.device = torch.device("cuda")
+        elif torch.backends.mps.is_available():
+            self.device = torch.device("mps")
+        else:
+            self.device = torch.device("cpu")
+        self.dtype = torch.float32 if self.device.type == "cpu" else torch.float16
+
+        model_path = os.path.expanduser(model_path)
+        disable_torch_init()
+        self.tokenizer, self.model, self.image_processor, _ = load_pretrained_model(
+            model_path, None, get_model_name_from_path(model_path), device=self.device.type)
+        if self.model.config.mm_use_im_start_end:
+            qs = DEFAULT_IM_START_TOKEN + DEFAULT_IMAGE_TOKEN + DEFAULT_IM_END_TOKEN + "\n" + prompt
+        else:
+            qs = DEFAULT_IMAGE_TOKEN + "\n" + prompt
+        conv = conv_templates[conv_mode].copy()
+        conv.append_message(conv.roles[0], qs)
+        conv.append_message(conv.roles[1], None)
+        self.model.generation_config.pad_token_id = self.tokenizer.pad_token_id
+        # Same prompt for every image, so one tokenization serves the whole run
+        self.input_ids = tokenizer_image_token(conv.get_prompt(), self.tokenizer, IMAGE_TOKEN_INDEX,
+                                               return_tensors="pt").unsqueeze(0).to(self.device)
+
+    def caption(self, paths: List[str]) -> List[Optional[str]]:
+        from PIL import Image
+
+        images, slots = [], []
+        for i, path in enumerate(paths):
+            try:
+                images.append(Image.open(path).convert("RGB"))
+                slots.append(i)
+            except Exception as e:
+                print(f"caption_server | unreadable image {path}: {e}", file=sys.stderr)
+        out: List[Optional[str]] = [None] * len(paths)
+        if not images:
+            return out
+        # Every image is resized to the model's input size, so the batch stacks into one generate call
+        pixels = self.torch.stack(self.process_images(images, self.image_processor, self.model.config))
+        with self.torch.inference_mode():
+            output_ids = self.model.generate(
+                self.input_ids.repeat(len(images), 1),
+                images=pixels.to(self.device, dtype=self.dtype),
+                image_sizes=[img.size for img in images],
+                do_sample=False,
+                max_new_tokens=self.max_new_tokens,
+                use_cache=True,
+            )
+        for slot, text in zip(slots, self.tokenizer.batch_decode(output_ids, skip_special_tokens=True)):
+            out[slot] = text.strip()
+        return out
+
+
+def serve(model, stdin, stdout):
+    stdout.write(json.dumps({"ready": True}) + "\n")
+    stdout.flush()
+    for line in stdin:
+        if not line.strip():
+            continue
+        paths = json.loads(line)["images"]
+        try:
+            captions = model.caption(paths)
+        except Exception as e:
+            print(f"caption_server | batch failed: {e}", file=sys.stderr)
+            captions = [None] * len(paths)
+        stdout.write(json.dumps({"captions": captions}) + "\n")
+        stdout.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Persistent FastVLM image caption server (JSON lines on stdin/stdout).")
+    parser.add_argument("--model-path", required=True)
+    parser.add_argument("--prompt", default="Describe tables, charts, and key numeric values from this image.")
+    parser.add_argument("--conv-mode", default="qwen_2")
+    parser.add_argument("--max-new-tokens", type=int, default=256)
+    args = parser.parse_args()
+    # stdout carries the protocol; anything the model libraries print goes to stderr
+    protocol, sys.stdout = sys.stdout, sys.stderr
+    model = FastVLM(args.model_path, args.prompt, conv_mode=args.conv_mode, max_new_tokens=args.max_new_tokens)
+    serve(model, sys.stdin, protocol)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,19 @@
 # app/scripts/index_documents.py
 
 from __future__ import annotations
-import argparse, subprocess, tempfile, hashlib, os, faulthandler
+import argparse, hashlib, os, time, faulthandler
 from pathlib import Path
 from typing import Dict, Any, Iterable, List
 from app.core.config import get_settings
 from app.core.logging import setup_logging
-from app.ingestion.loader import load_documents
+from app.ingestion.loader import IMAGE_SUFFIXES, load_document, page_workers_for
+from app.ingestion.captioner import CaptionService, open_captioner
 from app.ingestion.chunker import make_text_splitter, chunk_text_doc
+from app.ingestion.manifest import IndexManifest, file_sha1
+from app.ingestion.streaming import run_streaming_ingest
 # from app.retrieval.chroma_store import ChromaStore
-from app.retrieval.faiss_store import FAISSStore
+from app.retrieval.sharded_store import VectorStore, open_vector_store
+from app.retrieval.bm25 import BM25Index, BM25_DIRNAME
 
 # 🛡️ Environment safety
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
@@ -19,26 +23,7 @@ faulthandler.enable()
 
 log = setup_logging()
 
-def _fastvlm_caption(pil_image) -> str | None:
-    settings = get_settings()
-    ckpt = getattr(settings, "fastvlm_checkpoint", None)
-    if not ckpt:
-        return None
-    with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as tmp:
-        pil_image.save(tmp.name)
-        img_path = tmp.name
-    cmd = [
-        "python", "predict.py",
-        "--model-path", ckpt,
-        "--image-file", img_path,
-        "--prompt", "Describe tables, charts, and key numeric values from this image."
-    ]
-    try:
-        out = subprocess.check_output(cmd, text=True, timeout=60)
-        return (out or "").strip() or None
-    except Exception as e:
-        log.error(f"fastvlm_error | error={str(e)}")
-        return None
+MANIFEST_NAME = "manifest.json"
 
 def _to_chunks_from_doc(doc: Dict[str, Any], splitter) -> Iterable[Dict[str, Any]]:
     dtype = doc.get("type")
@@ -47,13 +32,8 @@ def _to_chunks_from_doc(doc: Dict[str, Any], splitter) -> Iterable[Dict[str, Any
         for ch in chunk_text_doc(doc, splitter):
             yield {"text": ch["text"], "meta": meta}
     elif dtype == "image":
-        caption = _fastvlm_caption(doc.get("content"))
-        if caption:
-            mm_meta = {**meta, "modality": "image"}
-            for ch in chunk_text_doc({"content": caption, "meta": mm_meta}, splitter):
-                yield {"text": ch["text"], "meta": mm_meta}
-        else:
-            log.info(f"image_skipped_no_vlm | file={meta.get('file', 'unknown')}")
+        # Images are captioned by the ingest caption stage, never per document
+        log.info(f"image_skipped_no_vlm | file={meta.get('file', 'unknown')}")
     else:
         log.info(f"doc_skipped_unknown_type | meta={meta}")
 
@@ -68,66 +48,217 @@ def _make_chunk_id(text: str, meta: Dict[str, Any], idx: int) -> str:
     chunk_id = f"{src_abs}#{page}#{digest}"
     return chunk_id
 
-def index_directory(data_dir: str) -> int:
-    settings = get_settings()
-    splitter = make_text_splitter(settings.max_chunk_tokens, settings.chunk_overlap)
-    # store = ChromaStore()
-    store = FAISSStore()
-
-    base = Path(data_dir)
-    if not base.exists():
-        log.error(f"data_dir_not_found | data_dir={base}")
-        return 0
-
-    files = [p for p in base.glob("**/*") if p.is_file()]
-    log.info(f"index_start | data_dir={base} | file_count={len(files)}")
-
-    raw_docs = list(load_documents([str(p) for p in files]))
-    log.info(f"loaded_docs | count={len(raw_docs)}")
-
+def _chunks_from_docs(docs: Iterable[Dict[str, Any]], splitter) -> tuple[List[Dict[str, Any]], int]:
     chunks: List[Dict[str, Any]] = []
-    idx = 0
-    for d in raw_docs:
+    seen: Dict[tuple, int] = {}
+    pages = 0
+    for d in docs:
+        pages += 1
         try:
             for ch in _to_chunks_from_doc(d, splitter):
                 text = ch.get("text", "").strip()
                 if not text:
                     continue
-                meta = ch.get("meta", {}) or {}
-                cid = _make_chunk_id(text, meta, idx)
+                meta = dict(ch.get("meta", {}) or {})
+                # Content-addressed ids: unchanged chunks of an edited file keep their id
+                occ_key = (str(meta.get("page", "")), text)
+                occurrence = seen.get(occ_key, 0)
+                seen[occ_key] = occurrence + 1
+                cid = _make_chunk_id(text, meta, occurrence)
                 meta["id"] = cid
                 chunks.append({"id": cid, "text": text, "meta": meta})
-                idx += 1
         except Exception as e:
-
             file_name = d.get("meta", {}).get("file", "unknown")
             log.error(f"chunking_error | error={str(e)} | file={file_name}")
+    return chunks, pages
+
+def _chunks_for_file(path: Path, splitter, sha1: str | None = None, pdf_workers: int | None = None) -> tuple[List[Dict[str, Any]], int]:
+    return _chunks_from_docs(load_document(path, sha1=sha1, pdf_workers=pdf_workers), splitter)
+
+def _set_chunks(result: Dict[str, Any], chunks: List[Dict[str, Any]], old_ids: Iterable[str]):
+    old_ids = set(old_ids or [])
+    new_ids = {c["id"] for c in chunks}
+    result.update({
+        "chunks": len(chunks),
+        "chunk_ids": [c["id"] for c in chunks],
+        "chunks_to_embed": [{**c, "key": result["key"]} for c in chunks if c["id"] not in old_ids],
+        "stale": [cid for cid in old_ids if cid not in new_ids],
+    })
+
+_WORKER_SPLITTER = None
+
+def _init_worker(max_tokens: int, overlap: int):
+    global _WORKER_SPLITTER
+    _WORKER_SPLITTER = make_text_splitter(max_tokens, overlap)
 
-    log.info(f"chunks_generated | count={len(chunks)}")
+def _extract_task(task: Dict[str, Any]) -> Dict[str, Any]:
+    """Runs in an ingest worker process: hash, load and chunk one file, diffing against its old chunk ids."""
+    t0 = time.perf_counter()
+    path = Path(task["path"])
+    digest = file_sha1(path)
+    result = {"key": task["key"], "sha1": digest, "pages": 0, "chunks": 0, "chunks_to_embed": []}
+    if digest == task.get("sha1"):
+        result["unchanged"] = True
+        result["extract_s"] = time.perf_counter() - t0
+        return result
 
-    if not chunks:
-        log.info("no_chunks_to_index")
+    if path.suffix.lower() in IMAGE_SUFFIXES:
+        # Left to the caption stage in the parent, which keeps one vision model loaded for the whole run
+        chunks, pages = [], 1
+        if get_settings().fastvlm_checkpoint:
+            result.update({"images": [{"sha1": digest, "file": str(path)}], "old_ids": task.get("old_ids") or []})
+        else:
+            log.info(f"image_skipped_no_vlm | file={path}")
+    else:
+        chunks, pages = _chunks_for_file(path, _WORKER_SPLITTER, sha1=digest, pdf_workers=task.get("pdf_workers", 1))
+    _set_chunks(result, chunks, task.get("old_ids"))
+    result.update({"pages": pages, "extract_s": time.perf_counter() - t0})
+    return result
+
+def _caption_results(results: List[Dict[str, Any]], service: CaptionService, splitter):
+    """Caption stage: one batched captioner call for the images of several files, then chunk the captions."""
+    captions = iter(service.caption([img for r in results for img in r["images"]]))
+    for r in results:
+        docs = []
+        for img in r["images"]:
+            caption = next(captions)
+            if caption is None:
+                r["retry"] = True
+                continue
+            docs.append({"type": "text", "content": caption, "meta": {"file": img["file"], "modality": "image"}})
+        if r.get("retry"):
+            # Keep what was indexed before and try this file again next run
+            log.warning(f"caption_failed | file={r['key']}")
+            _set_chunks(r, [], [])
+            r["chunk_ids"] = list(r["old_ids"])
+            continue
+        chunks, _ = _chunks_from_docs(docs, splitter)
+        _set_chunks(r, chunks, r["old_ids"])
+
+def _load_bm25(store: VectorStore, path: Path) -> BM25Index:
+    if BM25Index.exists(path):
+        index = BM25Index.load(path, mmap=False)
+        if index.has_facets:
+            return index
+    # Index built before the lexical index (or its metadata columns) was persisted: derive it once
+    docs = store.get_all_documents()
+    log.info(f"bm25_bootstrap | docs={len(docs)}")
+    return BM25Index.build((d["id"] for d in docs), (d["text"] for d in docs), (d["meta"] for d in docs))
+
+def index_directory(data_dir: str, full: bool = False, workers: int | None = None) -> int:
+    settings = get_settings()
+    # store = ChromaStore()
+    store = open_vector_store(writable_cache=True)
+
+    base = Path(data_dir)
+    if not base.exists():
+        log.error(f"data_dir_not_found | data_dir={base}")
         return 0
 
-    batch_size = 50
-    total = len(chunks)
+    manifest_path = Path(settings.faiss_path) / MANIFEST_NAME
+    manifest = IndexManifest.load(manifest_path)
+    bm25_path = Path(settings.faiss_path) / BM25_DIRNAME
+    files = {str(p.resolve()): p for p in sorted(base.glob("**/*")) if p.is_file() and p.name != MANIFEST_NAME}
+    stats_by_key = {key: path.stat() for key, path in files.items()}
+    counters = {"embedded": 0, "skipped": 0}
+    ingest_workers = (workers if workers is not None else settings.ingest_workers) or os.cpu_count() or 1
+
+    def _tasks() -> Iterable[Dict[str, Any]]:
+        todo = []
+        for key, path in files.items():
+            entry = manifest.get(key)
+            if entry and IndexManifest.stat_unchanged(entry, stats_by_key[key]):
+                counters["skipped"] += 1
+                continue
+            todo.append((key, path, entry))
+        for i, (key, path, entry) in enumerate(todo):
+            # Page pools share the ingest budget instead of multiplying it; the last files of the
+            # queue run with ingest workers idle, so they may split their pages wider
+            yield {"key": key, "path": str(path), "sha1": (entry or {}).get("sha1"),
+                   "old_ids": manifest.chunk_ids(key),
+                   "pdf_workers": page_workers_for(ingest_workers, len(todo) - i)}
+
+    bm25 = _load_bm25(store, bm25_path)
+    captions = open_captioner()
+    caption_splitter = make_text_splitter(settings.max_chunk_tokens, settings.chunk_overlap) if captions else None
+
+    def _write(batch: List[Dict[str, Any]], vectors: List[List[float]]):
+        # Chunks may reach a checkpoint before their file is done; track them so a crash can't orphan them
+        for ch in batch:
+            manifest.mark_pending(ch["key"], ch["id"])
+        added = set(store.add_embeddings(batch, vectors))
+        fresh = [ch for ch in batch if ch["id"] in added]
+        bm25.add((ch["id"] for ch in fresh), (ch["text"] for ch in fresh), (ch["meta"] for ch in fresh))
+
+    def _on_save(staging: Path):
+        # FAISS, BM25 and manifest land in one atomic directory swap, so they can't drift apart
+        bm25.save(staging / BM25_DIRNAME)
+        manifest.save(staging / MANIFEST_NAME)
+
+    def _on_file_done(result: Dict[str, Any]):
+        key = result["key"]
+        if result.get("unchanged"):
+            manifest.touch(key, stats_by_key[key])
+            counters["skipped"] += 1
+            return
+        store.delete(result.get("stale", []))
+        bm25.delete(result.get("stale", []))
+        manifest.record(key, result["sha1"], stats_by_key[key], result["chunk_ids"])
+        if result.get("retry"):
+            manifest.invalidate(key)
+        counters["embedded"] += len(result["chunks_to_embed"])
+        log.info(f"file_indexed | file={key} | chunks={result['chunks']} | embedded={len(result['chunks_to_embed'])} | removed={len(result.get('stale', []))}")
+
     try:
-        for start in range(0, total, batch_size):
-            batch = chunks[start : start + batch_size]
-            store.upsert(batch)
-            log.info(f"batch_upsert | start_index={start} | batch_size={len(batch)} | total_chunks={total}")
-        log.info(f"upsert_done | total_chunks={total} | faiss_path={settings.faiss_path}")
+        # One atomic save at the end (plus optional checkpoints) covering the index and its companions
+        with store.bulk(checkpoint_every=settings.faiss_checkpoint_every, on_save=_on_save):
+            if full or (store.index is None) != (len(manifest) == 0):
+                # Forced rebuild, a manifest without an index, or a legacy index without a manifest: start clean
+                log.info(f"index_reset | full={full} | tracked={len(manifest)} | index_loaded={store.index is not None}")
+                store.reset()
+                bm25.clear()
+                manifest.files.clear()
+            log.info(f"index_start | data_dir={base} | file_count={len(files)} | tracked={len(manifest)}")
+
+            removed = [key for key in manifest.files if key.startswith(str(base.resolve())) and key not in files]
+            for key in removed:
+                store.delete(manifest.chunk_ids(key))
+                bm25.delete(manifest.chunk_ids(key))
+                manifest.remove(key)
+                log.info(f"file_removed | file={key}")
+
+            stats = run_streaming_ingest(
+                _tasks(),
+                extract=_extract_task,
+                embed=store.embed_documents,
+                write=_write,
+                on_file_done=_on_file_done,
+                workers=ingest_workers,
+                embed_batch_size=settings.embed_batch_size,
+                queue_size=settings.ingest_queue_size,
+                initializer=_init_worker,
+                initargs=(settings.max_chunk_tokens, settings.chunk_overlap),
+                caption=(lambda results: _caption_results(results, captions, caption_splitter)) if captions else None,
+                caption_batch_size=settings.caption_batch_size,
+            )
+        stats.log_report()
+        log.info(f"upsert_done | embedded_chunks={counters['embedded']} | skipped_files={counters['skipped']} | removed_files={len(removed)} | faiss_path={settings.faiss_path}")
     except Exception as e:
         log.error(f"upsert_error | error={str(e)}")
         return 0
+    finally:
+        if captions:
+            captions.close()
 
-    return total
+    return counters["embedded"]
 
 def main():
     parser = argparse.ArgumentParser(description="Index documents into FAISS (text + optional images via FastVLM).")
     parser.add_argument("--data_dir", type=str, required=True)
+    parser.add_argument("--full", action="store_true", help="Ignore the manifest and re-index every file.")
+    parser.add_argument("--workers", type=int, default=None, help="Extraction processes (default: settings.ingest_workers or all cores).")
     args = parser.parse_args()
-    count = index_directory(args.data_dir)
+    count = index_directory(args.data_dir, full=args.full, workers=args.workers)
     print(f"Indexed {count} chunks into Faiss at {get_settings().faiss_path}")
 
 if __name__ == "__main__":
@@ -0,0 +1,134 @@
+# app/utils/fs.py
+from __future__ import annotations
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator
+from app.core.logging import setup_logging
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, recovery runs unguarded
+    fcntl = None
+
+log = setup_logging()
+
+
+def _fsync_tree(root: Path):
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            with open(os.path.join(dirpath, name), "rb") as f:
+                os.fsync(f.fileno())
+    if hasattr(os, "O_DIRECTORY"):
+        fd = os.open(root, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+@contextmanager
+def dir_lock(target: str | Path, blocking: bool = True) -> Iterator[bool]:
+    """
+    Exclusive advisory lock on `.<name>.lock` next to `target`; yields False if `blocking` is off
+    and another process holds it. atomic_write_dir holds it for the whole save.
+    """
+    target = Path(target)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    if fcntl is None:
+        yield True
+        return
+    with open(target.parent / f".{target.name}.lock", "a+b") as f:
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def recover_dir(target: str | Path) -> Path:
+    """
+    Finish or undo an interrupted atomic_write_dir: if the target vanished between the two renames,
+    restore the previous copy, and drop any half-written staging directories.
+
+    Only writers may call this, and it does nothing while another process is saving: a live save
+    looks exactly like a crashed one from the outside.
+    """
+    target = Path(target)
+    with dir_lock(target, blocking=False) as locked:
+        if not locked:
+            log.info(f"dir_recovery_skipped | path={target} | reason=save in progress")
+            return target
+        _recover(target)
+    return target
+
+
+def _recover(target: Path):
+    parent = target.parent
+    old = parent / f".{target.name}.old"
+    if not target.exists() and old.exists():
+        os.rename(old, target)
+        log.warning(f"dir_recovered | path={target}")
+    if parent.exists():
+        for stale in parent.glob(f".{target.name}.tmp-*"):
+            shutil.rmtree(stale, ignore_errors=True)
+        if old.exists():
+            shutil.rmtree(old, ignore_errors=True)
+
+
+def carry_over(src: str | Path, staging: str | Path):
+    """Hard-link (or copy) entries of `src` that the staging dir did not rewrite, e.g. companion files."""
+    src, staging = Path(src), Path(staging)
+    if not src.is_dir():
+        return
+    for entry in src.iterdir():
+        dst = staging / entry.name
+        if dst.exists():
+            continue
+        if entry.is_dir():
+            shutil.copytree(entry, dst, copy_function=_link_or_copy)
+        else:
+            _link_or_copy(entry, dst)
+
+
+def _link_or_copy(src, dst):
+    # Files inside a committed directory are never modified in place, so sharing inodes is safe
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+    return dst
+
+
+def atomic_write_dir(target: str | Path, write: Callable[[Path], None]):
+    """
+    Write a directory atomically: `write(staging_dir)` fills a sibling temp dir which is fsynced and
+    then swapped in with two renames, target -> `.<name>.old` and staging -> target. No reader ever
+    sees a partly written directory, but between the two renames the target does not exist: a
+    reader that finds it missing must retry, or read `.<name>.old`, which holds the previous copy
+    until the swap completes. A crash in that window is undone by recover_dir on the next writer start.
+    """
+    target = Path(target)
+    parent = target.parent
+    with dir_lock(target):
+        staging = Path(tempfile.mkdtemp(prefix=f".{target.name}.tmp-", dir=parent))
+        try:
+            write(staging)
+            _fsync_tree(staging)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        old = parent / f".{target.name}.old"
+        if old.exists():
+            shutil.rmtree(old)
+        if target.exists():
+            os.rename(target, old)
+        os.rename(staging, target)
+        shutil.rmtree(old, ignore_errors=True)
@@ -0,0 +1,49 @@
+# app/utils/singleflight.py
+from __future__ import annotations
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Future):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls with the same key: the first caller runs `fn`, later callers that
+    arrive while it is in flight await the same result (or exception). Nothing is cached after
+    the call completes. A cancelled caller leaves the shared call running for the others; once
+    the last caller is gone it is cancelled, so abandoned upstream work does not run on.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, _Flight] = {}
+        self.stats = {"calls": 0, "coalesced": 0, "cancelled": 0}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self.stats["calls"] += 1
+        flight = self._inflight.get(key)
+        if flight is not None:
+            self.stats["coalesced"] += 1
+        else:
+            flight = _Flight(asyncio.ensure_future(fn()))
+            self._inflight[key] = flight
+            flight.task.add_done_callback(lambda t, f=flight: self._forget(key, f))
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if not flight.waiters and not flight.task.done():
+                # Nobody is waiting any more; later callers start a fresh call instead of joining this one
+                self._forget(key, flight)
+                flight.task.cancel()
+                self.stats["cancelled"] += 1
+
+    def _forget(self, key: Hashable, flight: _Flight):
+        if self._inflight.get(key) is flight:
+            del self._inflight[key]
@@ -0,0 +1,43 @@
+# app/utils/tokens.py
+from __future__ import annotations
+import math
+import re
+from functools import lru_cache
+from typing import Callable
+from app.core.config import get_settings
+from app.core.logging import setup_logging
+
+log = setup_logging()
+
+_PIECES = re.compile(r"\w+|[^\w\s]")
+
+
+def approx_tokens(text: str) -> int:
+    # Words and punctuation, plus ~30% for subword splits: close to WordPiece/BPE counts on prose
+    return math.ceil(len(_PIECES.findall(text)) * 1.3)
+
+
+@lru_cache
+def get_token_counter() -> Callable[[str], int]:
+    """
+    Token counter for chunking and context budgeting: the HF tokenizer named by `tokenizer_model`
+    (default: the embedding model's) when transformers is available, else a regex estimate.
+    """
+    settings = get_settings()
+    name = settings.tokenizer_model or settings.embedding_model
+    try:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(name)
+    except Exception as e:
+        log.warning(f"tokenizer_fallback | model={name} | error={str(e)[:200]}")
+        return approx_tokens
+
+    def count(text: str) -> int:
+        return len(tokenizer.encode(text, add_special_tokens=False))
+
+    log.info(f"tokenizer_loaded | model={name}")
+    return count
+
+
+def count_tokens(text: str) -> int:
+    return get_token_counter()(text)
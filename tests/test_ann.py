@@ -0,0 +1,108 @@
+# tests/test_ann.py
+import numpy as np
+import pytest
+from app.core.config import get_settings
+from app.retrieval.ann import build_index, filtered_search, is_id_mapped, min_train_points, supports_remove
+from app.retrieval.faiss_store import FAISSStore
+from app.retrieval.ids import chunk_int_ids
+
+DIM = 8
+
+
+def _clusters(n_clusters=16, per=20, seed=0):
+    """Tight, well separated clusters: which IVF list a vector lands in is predictable."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, DIM)).astype(np.float32) * 20
+    points = np.repeat(centers, per, axis=0) + rng.standard_normal((n_clusters * per, DIM)).astype(np.float32) * 0.1
+    return centers, points
+
+
+def _docs(n, start=0):
+    return [{"id": f"c{i}", "text": f"chunk {i}", "meta": {"file": "f.txt"}} for i in range(start, start + n)]
+
+
+@pytest.fixture
+def factory(monkeypatch):
+    settings = get_settings()
+
+    def _use(spec, train_min=0):
+        monkeypatch.setattr(settings, "faiss_index_factory", spec)
+        monkeypatch.setattr(settings, "faiss_train_min", train_min)
+    return _use
+
+
+def test_factory_and_training_needs():
+    flat, ivf, ivfpq, hnsw = (build_index(f, DIM) for f in ("Flat", "IVF4,Flat", "IVF4,PQ4", "HNSW8"))
+    assert all(is_id_mapped(i) for i in (flat, ivf, ivfpq, hnsw))
+    assert min_train_points(flat) == 0 and min_train_points(hnsw) == 0
+    assert min_train_points(ivf) == 4 * 39
+    assert min_train_points(ivfpq) == 256 * 39  # the PQ codebooks need more than the coarse quantizer
+    assert supports_remove(ivf) and not supports_remove(hnsw)
+
+
+def test_untrained_index_buffers_until_the_threshold(tmp_path, factory):
+    factory("IVF4,Flat", train_min=50)
+    _, points = _clusters(4, 20)
+    store = FAISSStore(writable_cache=True, persist_path=str(tmp_path / "index"), embedding_model=object())
+    with store.bulk():
+        store.add_embeddings(_docs(30), points[:30].tolist())
+        assert not store.index.is_trained and store.index.ntotal == 0
+        store.add_embeddings(_docs(30, start=30), points[30:60].tolist())
+        assert store.index.is_trained and store.index.ntotal == 60
+        # Below the threshold again: the save trains on (adds) whatever is buffered
+        store.add_embeddings(_docs(20, start=60), points[60:].tolist())
+    assert store.index.ntotal == 80
+    hits = store.search_by_vectors(points[65:66], 1)[0]
+    assert hits[0]["text"] == "chunk 65"
+
+
+def test_hnsw_deletes_are_tombstoned(tmp_path, factory):
+    factory("HNSW8")
+    _, points = _clusters(4, 5)
+    path = str(tmp_path / "index")
+    store = FAISSStore(writable_cache=True, persist_path=path, embedding_model=object())
+    with store.bulk():
+        store.add_embeddings(_docs(20), points.tolist())
+        store.delete([f"c{i}" for i in range(5)])
+    assert store.tombstones == 5 and store.index.ntotal == 20
+
+    reader = FAISSStore(persist_path=path, embedding_model=object())
+    assert reader.tombstones == 5
+    hits = reader.search_by_vectors(points[:1], 5)[0]
+    # The deleted cluster's own vectors are skipped, the over-fetch still fills k
+    assert len(hits) == 5 and all(int(h["text"].split()[1]) >= 5 for h in hits)
+
+    # Re-adding a tombstoned chunk leaves two vectors under one id, but only one hit
+    store.add_embeddings(_docs(1), points[:1].tolist())
+    texts = [h["text"] for h in store.search_by_vectors(points[:1], 3)[0]]
+    assert texts.count("chunk 0") == 1
+
+
+def test_filtered_search_retries_short_rows_exhaustively():
+    centers, points = _clusters()
+    index = build_index("IVF16,Flat", DIM)
+    index.train(points)
+    labels = np.arange(len(points), dtype=np.int64)
+    index.add_with_ids(points, labels)
+    # Allowed vectors all live in one far-away list; nprobe=1 only scans the query's own list
+    allowed = labels[15 * 20:15 * 20 + 3]
+    distances, found = filtered_search(index, centers[:2], 5, allowed, nprobe=1)
+    assert (found >= 0).sum(axis=1).tolist() == [3, 3]
+    assert set(found[found >= 0].tolist()) == set(allowed.tolist())
+    assert np.all(np.isfinite(distances[found >= 0]))
+
+    # A row the first pass filled is not retried: hits stay in the one probed list
+    allowed = labels[:40]
+    _, found = filtered_search(index, centers[:1], 5, allowed, nprobe=1)
+    assert set(found[0].tolist()) <= set(range(20))
+
+
+def test_filtered_hnsw_fills_k_from_a_sparse_filter():
+    _, points = _clusters(16, 20)
+    index = build_index("HNSW8", DIM)
+    ids = chunk_int_ids([f"c{i}" for i in range(len(points))])
+    index.add_with_ids(points, ids)
+    allowed = ids[::40]
+    _, found = filtered_search(index, points[:3], 4, allowed, ef_search=4)
+    assert (found >= 0).sum(axis=1).tolist() == [4, 4, 4]
+    assert set(found.ravel().tolist()) <= set(allowed.tolist())
@@ -0,0 +1,42 @@
+# tests/test_answer_cache.py
+import time
+from app.rag.answer_cache import AnswerCache, normalize_question
+
+VECTORS = {
+    "how do i reset my password": [1.0, 0.0, 0.0],
+    "password reset steps": [0.98, 0.2, 0.0],
+    "what is the refund policy": [0.0, 1.0, 0.0],
+}
+
+
+def _cache(version, **kwargs):
+    return AnswerCache(embed_fn=lambda q: VECTORS[normalize_question(q)], version_fn=lambda: version[0], **kwargs)
+
+
+def test_exact_then_semantic_hit():
+    cache = _cache(["v1"], threshold=0.9)
+    cache.put("How do I reset my password?", {"answer": "Use the portal", "retrieved": [1]})
+    assert cache.get("how do i  reset my password")["cache"] == "exact"
+    hit = cache.get("Password reset steps")
+    assert hit["cache"] == "semantic" and hit["answer"] == "Use the portal"
+    assert cache.get("What is the refund policy?") is None
+    stats = cache.snapshot()
+    assert (stats["exact_hits"], stats["semantic_hits"], stats["misses"]) == (1, 1, 1)
+
+
+def test_index_version_change_invalidates():
+    version = ["v1"]
+    cache = _cache(version)
+    cache.put("what is the refund policy", {"answer": "30 days"})
+    version[0] = "v2"
+    assert cache.get("what is the refund policy") is None
+    assert cache.snapshot()["invalidations"] == 1
+
+
+def test_ttl_and_lru_eviction():
+    cache = _cache(["v1"], max_entries=2, ttl_s=0.05)
+    for q in VECTORS:
+        cache.put(q, {"answer": q})
+    assert len(cache) == 2 and cache.snapshot()["evictions"] == 1
+    time.sleep(0.06)
+    assert cache.get("what is the refund policy") is None
@@ -0,0 +1,115 @@
+# tests/test_api_stream.py
+import asyncio
+import importlib
+import json
+import httpx
+import pytest
+from app.api.schemas import QueryRequest
+from app.benchmarks.synthetic import HashingEmbeddings
+from app.core.config import get_settings
+from app.rag.pipeline import RAGPipeline
+from app.retrieval import faiss_store
+from app.retrieval.async_retriever import RetrievalOverloaded
+from app.retrieval.faiss_store import FAISSStore
+from app.retrieval.hybrid_retriever import HybridRetriever
+
+EMB = HashingEmbeddings(["refund", "policy", "shipping", "days"], dim=16)
+TOKENS = ["Refunds ", "take ", "thirty ", "days ", "[doc:1]."]
+
+
+class TrackingLLM:
+    """Streams TOKENS, pausing after each; records whether its stream was closed."""
+
+    def __init__(self):
+        self.closed = asyncio.Event()
+        self.sent = 0
+
+    async def stream(self, prompt):
+        try:
+            for token in TOKENS:
+                self.sent += 1
+                yield token
+                await asyncio.sleep(0.01)
+        finally:
+            self.closed.set()
+
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    path = str(tmp_path / "index")
+    monkeypatch.setattr(get_settings(), "faiss_path", path)
+    monkeypatch.setattr(faiss_store, "make_embeddings", lambda writable_cache=False: EMB)
+    store = FAISSStore(writable_cache=True, persist_path=path, embedding_model=EMB)
+    docs = [{"id": "c0", "text": "refund policy is thirty days", "meta": {"file": "refunds.txt"}}]
+    with store.bulk():
+        store.add_embeddings(docs, EMB.embed_documents([d["text"] for d in docs]).tolist())
+    # The module builds its pipeline on import; swap in one over the test index
+    main = importlib.import_module("app.api.main")
+    llm = TrackingLLM()
+    pipeline = RAGPipeline(retriever=HybridRetriever(store=FAISSStore(persist_path=path, embedding_model=EMB)), llm=llm)
+    monkeypatch.setattr(main, "pipeline", pipeline)
+    return main, pipeline, llm
+
+
+def _events(body):
+    out = []
+    for block in body.strip().split("\n\n"):
+        name, data = block.split("\n")
+        out.append((name.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+    return out
+
+
+async def _post(main, question="refund policy"):
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await client.post("/query/stream", json={"question": question})
+
+
+def test_stream_sends_context_tokens_then_done(api):
+    main, _, _ = api
+    resp = asyncio.run(_post(main))
+    assert resp.status_code == 200 and resp.headers["content-type"].startswith("text/event-stream")
+    events = _events(resp.text)
+    assert [name for name, _ in events] == ["context"] + ["token"] * len(TOKENS) + ["done"]
+    assert events[0][1]["sources"][0]["source"] == "refunds.txt"
+    assert "".join(data["text"] for name, data in events if name == "token") == "".join(TOKENS)
+    assert events[-1][1]["answer"] and events[-1][1]["ttft_ms"] is not None
+
+
+def test_overload_before_the_first_event_is_a_503(api, monkeypatch):
+    main, pipeline, _ = api
+
+    async def _overloaded(*args, **kwargs):
+        raise RetrievalOverloaded("saturated", retry_after_s=2.5)
+
+    monkeypatch.setattr(pipeline.async_retriever, "retrieve", _overloaded)
+    resp = asyncio.run(_post(main))
+    assert resp.status_code == 503 and resp.headers["retry-after"] == "3"
+
+
+def test_failure_after_the_first_event_ends_with_an_error_event(api, monkeypatch):
+    main, pipeline, _ = api
+
+    def _broken(*args, **kwargs):
+        raise RuntimeError("citation step failed")
+
+    monkeypatch.setattr(pipeline, "_finalize", _broken)
+    events = _events(asyncio.run(_post(main)).text)
+    assert events[0][0] == "context" and events[-1] == ("error", {"detail": "Internal error"})
+
+
+def test_client_disconnect_stops_generation(api):
+    main, _, llm = api
+
+    async def run():
+        resp = await main.query_stream(QueryRequest(question="refund policy"))
+        body = resp.body_iterator
+        assert (await body.__anext__()).startswith("event: context")
+        assert (await body.__anext__()).startswith("event: token")
+        # What Starlette does when the client goes away mid-stream: the LLM stream is closed before
+        # aclose returns, not whenever the abandoned generators get garbage collected
+        await body.aclose()
+        assert llm.closed.is_set()
+
+    asyncio.run(run())
+    assert llm.sent < len(TOKENS)
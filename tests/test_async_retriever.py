@@ -0,0 +1,78 @@
+# tests/test_async_retriever.py
+import asyncio
+import time
+import pytest
+from app.retrieval.async_retriever import AsyncRetriever, RetrievalOverloaded
+
+
+class SlowRetriever:
+    """Stands in for HybridRetriever: each search half blocks for `delay` seconds."""
+
+    def __init__(self, delay=0.1):
+        self.delay = delay
+
+    def fetch_sizes(self, k=None):
+        return k or 3, 10
+
+    def vector_search(self, query, k, mask=None):
+        time.sleep(self.delay)
+        return [{"text": query, "score": 0.1, "meta": {"id": f"v-{query}"}}]
+
+    def lexical_search(self, query, k, mask=None):
+        time.sleep(self.delay)
+        return [{"text": query, "score": 1.0, "meta": {"id": f"v-{query}"}}]
+
+    def _rank(self, query, vec, bm25, k, strategy=None):
+        return (vec + bm25)[:1]
+
+
+def test_vector_and_lexical_run_in_parallel():
+    async def main():
+        retriever = AsyncRetriever(SlowRetriever(0.2), max_concurrency=2, max_queue=4, queue_timeout_s=5)
+        start = time.perf_counter()
+        results = await asyncio.gather(retriever.retrieve("a"), retriever.retrieve("b"))
+        return results, time.perf_counter() - start
+
+    results, elapsed = asyncio.run(main())
+    assert [r[0]["meta"]["id"] for r in results] == ["v-a", "v-b"]
+    assert elapsed < 0.35  # serial execution would take 0.8s
+
+
+def test_rejects_when_queue_is_full():
+    async def main():
+        retriever = AsyncRetriever(SlowRetriever(0.2), max_concurrency=1, max_queue=1, queue_timeout_s=5)
+        return await asyncio.gather(*(retriever.retrieve(str(i)) for i in range(4)), return_exceptions=True)
+
+    outcomes = asyncio.run(main())
+    rejected = [o for o in outcomes if isinstance(o, RetrievalOverloaded)]
+    assert len(rejected) == 2
+    assert rejected[0].retry_after_s >= 1
+
+
+def test_rejects_after_queue_timeout():
+    async def main():
+        retriever = AsyncRetriever(SlowRetriever(0.3), max_concurrency=1, max_queue=8, queue_timeout_s=0.05)
+        return await asyncio.gather(retriever.retrieve("a"), retriever.retrieve("b"), return_exceptions=True)
+
+    first, second = asyncio.run(main())
+    assert isinstance(first, list)
+    with pytest.raises(RetrievalOverloaded):
+        raise second
+
+
+def test_cancelled_waiters_do_not_leak_slots():
+    async def main():
+        retriever = AsyncRetriever(SlowRetriever(0.0), max_concurrency=1, max_queue=4, queue_timeout_s=5)
+        await retriever._acquire()
+        waiters = [asyncio.ensure_future(retriever._acquire()) for _ in range(3)]
+        await asyncio.sleep(0)
+        # The slot is handed to the first waiter in the same tick every waiter is cancelled
+        retriever._release()
+        for w in waiters:
+            w.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        assert retriever.queue_depth == 0 and retriever._active == 0
+        return await asyncio.wait_for(asyncio.gather(retriever.retrieve("a"), retriever.retrieve("b")), timeout=1)
+
+    first, second = asyncio.run(main())
+    assert first[0]["meta"]["id"] == "v-a" and second[0]["meta"]["id"] == "v-b"
@@ -0,0 +1,62 @@
+# tests/test_benchmark_suite.py
+import pytest
+from app.benchmarks import suite
+from app.core.config import get_settings
+
+
+@pytest.mark.parametrize("text,expected", [("100000", 100000), ("10k", 10000), ("2.5m", 2500000), (" 1M ", 1000000)])
+def test_count(text, expected):
+    assert suite.count(text) == expected
+
+
+def _report(chunks_per_s=100.0, build_s=10.0, p99=20.0, qps=50.0):
+    return {
+        "ingest": {"chunks_per_s": chunks_per_s},
+        "build": {"duration_s": build_s},
+        "retrieve": {"8": {"p99_ms": p99, "p50_ms": 5.0, "qps": qps}},
+    }
+
+
+def test_compare_flags_regressions_in_the_right_direction():
+    baseline = _report()
+    # Slower ingest (higher is better) and slower build (lower is better) both regress
+    regressions = suite.compare(_report(chunks_per_s=50.0, build_s=20.0), baseline, 0.1)
+    assert {r["metric"]: r["change"] for r in regressions} == {"ingest.chunks_per_s": -0.5, "build.duration_s": 1.0}
+    # The same moves the other way are improvements
+    assert suite.compare(_report(chunks_per_s=200.0, build_s=5.0), baseline, 0.1) == []
+    # Per-client-level metrics are tracked too
+    assert [r["metric"] for r in suite.compare(_report(p99=40.0, qps=10.0), baseline, 0.1)] == \
+        ["retrieve.8.p99_ms", "retrieve.8.qps"]
+
+
+def test_compare_tolerance_edge_and_missing_metrics():
+    baseline = _report()
+    # Exactly at the tolerance is not a regression; just past it is
+    assert suite.compare(_report(build_s=12.5), baseline, 0.25) == []
+    assert suite.compare(_report(build_s=12.75), baseline, 0.25)[0]["metric"] == "build.duration_s"
+    # Metrics missing on either side, or a zero baseline, are skipped rather than failing
+    assert suite.compare({"ingest": {}}, baseline, 0.1) == []
+    assert suite.compare(_report(build_s=99.0), {"build": {"duration_s": 0}}, 0.1) == []
+    assert suite.compare(_report(), {"ingest": {"chunks_per_s": "n/a"}}, 0.1) == []
+
+
+def test_tiny_end_to_end_run(tmp_path, monkeypatch):
+    # What main() does via _apply, undone after the test; the serve phase runs in a spawned process
+    settings = get_settings()
+    overrides = {"faiss_path": str(tmp_path / "faiss_index"), "embedding_cache_dir": "", "answer_cache_size": 0,
+                 "faiss_index_factory": "Flat", "faiss_shards": 1}
+    for key, value in overrides.items():
+        monkeypatch.setenv(key.upper(), str(value))
+        monkeypatch.setattr(settings, key, value)
+
+    cfg = {"chunks": 300, "dim": 16, "vocab": 400, "topics": 8, "seed": 0, "batch_size": 64,
+           "checkpoint_every": 0, "clients": [1, 2], "requests": 3, "k": 4, "llm_delay_ms": 0.0}
+    report = suite.run(cfg)
+
+    assert report["ingest"]["chunks"] == 300 and report["build"]["index_bytes"] > 0
+    assert report["config"]["faiss_index_factory"] == "Flat"
+    for phase in ("retrieve", "pipeline"):
+        assert set(report[phase]) == {"1", "2"}
+        assert all(level["qps"] > 0 for level in report[phase].values())
+    # A report compared with itself has no regressions
+    assert suite.compare(report, report, 0.0) == []
@@ -0,0 +1,82 @@
+# tests/test_bm25.py
+import math
+import random
+from collections import Counter
+import pytest
+from app.retrieval.bm25 import BM25Index, BM25Retriever, tokenize
+
+
+def _brute_force(query, texts, k, k1=1.5, b=0.75):
+    toks = [tokenize(t) for t in texts]
+    n = len(toks)
+    avgdl = sum(map(len, toks)) / n
+    df = Counter()
+    for t in toks:
+        df.update(set(t))
+    scored = []
+    for i, t in enumerate(toks):
+        c = Counter(t)
+        s = 0.0
+        for w in tokenize(query):
+            if w in c:
+                idf = math.log1p((n - df[w] + 0.5) / (df[w] + 0.5))
+                s += idf * c[w] * (k1 + 1) / (c[w] + k1 * (1 - b + b * len(t) / avgdl))
+        if s > 0:
+            scored.append((s, i))
+    scored.sort(key=lambda x: (-x[0], x[1]))
+    return scored[:k]
+
+
+def _corpus(n=500, seed=7):
+    rnd = random.Random(seed)
+    words = [f"w{i}" for i in range(300)]
+    return [" ".join(rnd.choices(words, k=rnd.randint(5, 40))) for _ in range(n)]
+
+
+def test_search_matches_brute_force():
+    texts = _corpus()
+    index = BM25Index.build([str(i) for i in range(len(texts))], texts)
+    for query in ["w1 w2", "w299", "w10 w10 w150 w7"]:
+        got = index.search(query, 10)
+        expected = _brute_force(query, texts, 10)
+        # Positions can swap between exactly tied docs, scores must not
+        assert [s for _, s in got] == pytest.approx([s for s, _ in expected], rel=1e-5)
+        assert got[0][0] == expected[0][1]
+
+
+def test_delete_and_add_stay_consistent():
+    texts = _corpus()
+    ids = [f"d{i}" for i in range(len(texts))]
+    index = BM25Index.build(ids, texts)
+    index.delete(ids[:250])
+    index.add(["new"], ["w42 w42 w42"])
+    index.commit()
+    remaining = texts[250:] + ["w42 w42 w42"]
+    got = [index.doc_ids[pos] for pos, _ in index.search("w42", 5)]
+    expected = [(ids[250:] + ["new"])[i] for _, i in _brute_force("w42", remaining, 5)]
+    assert len(index) == 251
+    assert got == expected
+
+
+def test_delete_then_readd_keeps_the_new_version():
+    index = BM25Index.build(["a", "b"], ["old words", "other text"])
+    index.delete(["a"])
+    index.add(["a"], ["fresh words"])
+    index.commit()
+    assert sorted(index.doc_ids) == ["a", "b"]
+    assert [index.doc_ids[pos] for pos, _ in index.search("fresh", 5)] == ["a"]
+    assert index.search("old", 5) == []
+
+    # Add then delete before a commit drops both
+    index.add(["c"], ["brand new"])
+    index.delete(["c"])
+    index.commit()
+    assert sorted(index.doc_ids) == ["a", "b"]
+
+
+def test_retriever_has_no_document_cap():
+    corpus = [{"text": f"filler text {i}", "meta": {"id": f"c{i}"}} for i in range(1500)]
+    corpus.append({"text": "needle in the haystack", "meta": {"id": "needle"}})
+    hits = BM25Retriever(corpus, normalize=True).search("needle", k=3)
+    assert hits[0]["meta"]["id"] == "needle"
+    assert hits[0]["score"] == 1.0
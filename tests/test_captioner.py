@@ -0,0 +1,110 @@
+# tests/test_captioner.py
+import sys
+import threading
+import time
+from app.ingestion.captioner import CaptionService, SubprocessCaptioner
+from app.ingestion.streaming import run_streaming_ingest
+
+
+class StubCaptioner:
+    def __init__(self, fail=()):
+        self.batches = []
+        self.fail = set(fail)
+
+    def caption_batch(self, paths):
+        self.batches.append(list(paths))
+        return [None if p in self.fail else f"caption of {p}" for p in paths]
+
+    def close(self):
+        pass
+
+
+def _images(*names):
+    return [{"sha1": f"h-{n}", "file": n} for n in names]
+
+
+def test_service_batches_dedupes_and_caches(tmp_path):
+    stub = StubCaptioner(fail={"c.png"})
+    service = CaptionService(stub, model_key="m", cache_path=str(tmp_path / "c.sqlite"), batch_size=2)
+    out = service.caption(_images("a.png", "b.png", "a.png", "c.png"))
+    assert out == ["caption of a.png", "caption of b.png", "caption of a.png", None]
+    assert stub.batches == [["a.png", "b.png"], ["c.png"]]
+
+    # Cached by image hash: only the failed image goes back to the model
+    stub.batches.clear()
+    assert service.caption(_images("b.png", "c.png"))[0] == "caption of b.png"
+    assert stub.batches == [["c.png"]]
+
+    other = CaptionService(stub, model_key="other", cache_path=str(tmp_path / "c.sqlite"))
+    stub.batches.clear()
+    other.caption(_images("a.png"))
+    assert stub.batches == [["a.png"]]
+
+
+# Speaks the caption server protocol; dies on a path containing "crash"
+_FAKE_SERVER = """
+import os, sys
+from app.scripts.caption_server import serve
+class Model:
+    def caption(self, paths):
+        if any("crash" in p for p in paths):
+            os._exit(3)
+        return [f"{os.getpid()}:{p}" for p in paths]
+serve(Model(), sys.stdin, sys.stdout)
+"""
+
+
+def test_subprocess_captioner_keeps_server_and_restarts_after_crash():
+    captioner = SubprocessCaptioner([sys.executable, "-c", _FAKE_SERVER], timeout_s=5, load_timeout_s=30)
+    try:
+        first = captioner.caption_batch(["a.png", "b.png"])
+        second = captioner.caption_batch(["c.png"])
+        pid = first[0].split(":")[0]
+        assert [c.split(":")[1] for c in first + second] == ["a.png", "b.png", "c.png"]
+        assert second[0].split(":")[0] == pid  # model loaded once
+
+        assert captioner.caption_batch(["crash.png", "d.png"]) == [None, None]
+        after = captioner.caption_batch(["d.png"])[0]
+        assert after.endswith(":d.png") and after.split(":")[0] != pid
+    finally:
+        captioner.close()
+
+
+def _fake_extract(task):
+    result = {"key": task["key"], "pages": 1, "chunks": 0, "chunks_to_embed": []}
+    if task["key"].endswith(".png"):
+        result["images"] = [{"sha1": task["key"], "file": task["key"]}]
+    else:
+        result["chunks_to_embed"] = [{"id": task["key"], "text": "text", "meta": {}}]
+    return result
+
+
+def test_captioning_runs_alongside_text_ingestion():
+    text_done = threading.Event()
+    done = []
+
+    def caption(results):
+        # Blocks until the text file got all the way through; a serial pipeline would time out here
+        assert text_done.wait(timeout=10)
+        for r in results:
+            r["chunks_to_embed"] = [{"id": r["key"], "text": "caption", "meta": {}}]
+
+    def on_file_done(result):
+        done.append(result["key"])
+        if result["key"] == "doc.txt":
+            text_done.set()
+
+    start = time.perf_counter()
+    stats = run_streaming_ingest(
+        [{"key": "img.png"}, {"key": "doc.txt"}],
+        extract=_fake_extract,
+        embed=lambda texts: [[0.0] for _ in texts],
+        write=lambda batch, vectors: None,
+        on_file_done=on_file_done,
+        workers=1,
+        embed_batch_size=1,
+        caption=caption,
+    )
+    assert done == ["doc.txt", "img.png"]
+    assert stats.report()["caption"]["images"] == 1
+    assert time.perf_counter() - start < 10
@@ -0,0 +1,33 @@
+# tests/test_chunk_store.py
+from app.retrieval.chunk_store import ChunkStore
+from app.retrieval.ids import chunk_int_ids
+
+
+def _rows(ids):
+    return [{"id": i, "label": int(label), "text": f"text of {i}", "meta": {"id": i, "page": n}}
+            for n, (i, label) in enumerate(zip(ids, chunk_int_ids(ids)))]
+
+
+def test_lookup_by_id_and_label(tmp_path):
+    store = ChunkStore(tmp_path / "chunks.sqlite", readonly=False)
+    rows = _rows(["a", "b", "c"])
+    store.put_many(rows)
+    store.delete_many(["b"])
+    store.close()
+
+    ro = ChunkStore(tmp_path / "chunks.sqlite", readonly=True)
+    assert len(ro) == 2
+    assert set(ro.get(["a", "b"])) == {"a"}
+    by_label = ro.get_by_labels([rows[2]["label"], rows[1]["label"]])
+    assert list(by_label) == [rows[2]["label"]]
+    assert by_label[rows[2]["label"]]["meta"] == {"id": "c", "page": 2}
+
+
+def test_copy_leaves_source_untouched(tmp_path):
+    src = ChunkStore(tmp_path / "a.sqlite", readonly=False)
+    src.put_many(_rows(["a", "b"]))
+    copy = src.copy_to(tmp_path / "b.sqlite")
+    copy.delete_many(["a"])
+    copy.put_many(_rows(["z"]))
+    assert sorted(src.ids()) == ["a", "b"]
+    assert sorted(copy.ids()) == ["b", "z"]
@@ -0,0 +1,37 @@
+# tests/test_context_budget.py
+from app.rag.context_budget import ContextBudget
+from app.utils.tokens import approx_tokens
+
+
+def _chunk(cid, text):
+    return {"text": text, "score": 1.0, "meta": {"id": cid, "file": "doc.pdf", "page": 1}}
+
+
+def _budget(**kwargs):
+    return ContextBudget(counter=approx_tokens, **kwargs)
+
+
+def test_near_duplicates_are_dropped():
+    base = "the quarterly revenue grew by twelve percent driven by strong cloud sales in europe"
+    chunks = [_chunk("a", base), _chunk("b", base + " overall"), _chunk("c", "completely different text about hiring")]
+    packed = _budget(budget_tokens=1000).pack("revenue", chunks)
+    assert [c["meta"]["id"] for c in packed] == ["a", "c"]
+
+
+def test_budget_is_respected_and_smaller_chunks_still_fit():
+    big = _chunk("big", "word " * 400)
+    small = _chunk("small", "short relevant answer")
+    budget = _budget(budget_tokens=100, trim=False)
+    packed = budget.pack("answer", [big, small])
+    assert [c["meta"]["id"] for c in packed] == ["small"]
+    assert sum(budget._cost(c) for c in packed) <= 100
+
+
+def test_oversized_chunk_is_trimmed_to_relevant_sentences():
+    filler = " ".join(f"Unrelated sentence number {i} about the office." for i in range(60))
+    text = filler + " The warranty period is two years from purchase. " + filler
+    packed = _budget(budget_tokens=80).pack("How long is the warranty period?", [_chunk("w", text)])
+    assert len(packed) == 1
+    assert packed[0]["meta"]["trimmed"] is True
+    assert "warranty period is two years" in packed[0]["text"]
+    assert "Unrelated" not in packed[0]["text"]
@@ -0,0 +1,120 @@
+# tests/test_embedding_cache.py
+import numpy as np
+import pytest
+from app.core.config import get_settings
+from app.retrieval import embedding_cache
+from app.retrieval.embedding_cache import KEY_BYTES, CachedEmbeddings, EmbeddingCache, embedding_key
+from app.retrieval.faiss_store import FAISSStore
+
+
+class CountingModel:
+    """Deterministic 4-d embeddings; records every batch it is asked to embed."""
+
+    def __init__(self):
+        self.calls = []
+
+    def _vec(self, text):
+        rng = np.random.default_rng(sum(map(ord, text)))
+        return rng.standard_normal(4).tolist()
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [self._vec(t) for t in texts]
+
+    def embed_query(self, text):
+        self.calls.append([text])
+        return self._vec(text)
+
+
+def _keys(*texts):
+    return [embedding_key("m", "doc", t) for t in texts]
+
+
+def _rows(n, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, 4)).astype(np.float32)
+
+
+def test_torn_tail_is_ignored_and_truncated(tmp_path):
+    cache = EmbeddingCache(tmp_path, "m", dtype="float32")
+    cache.put_many(_keys("a", "b", "c"), _rows(3))
+    # An append interrupted after its vector and half of the next one, before any key was written
+    with open(cache._vectors_path, "ab") as f:
+        f.write(_rows(1, seed=9).tobytes() + b"\x00" * 6)
+    with open(cache._keys_path, "ab") as f:
+        f.write(b"\x01" * (KEY_BYTES // 2))
+
+    reader = EmbeddingCache(tmp_path, "m", readonly=True)
+    assert len(reader) == 3
+    assert cache._vectors_path.stat().st_size > 3 * 4 * 4  # readers never modify the files
+
+    writer = EmbeddingCache(tmp_path, "m")
+    assert len(writer) == 3
+    assert writer._vectors_path.stat().st_size == 3 * 4 * 4
+    assert writer._keys_path.stat().st_size == 3 * KEY_BYTES
+    # New rows line up with their keys again
+    writer.put_many(_keys("d"), _rows(1, seed=4))
+    got = EmbeddingCache(tmp_path, "m", readonly=True).get_many(_keys("a", "d"))
+    np.testing.assert_array_equal(got[_keys("a")[0]], _rows(3)[0])
+    np.testing.assert_array_equal(got[_keys("d")[0]], _rows(1, seed=4)[0])
+
+
+@pytest.mark.parametrize("dtype,tol", [("float16", 1e-2), ("float32", 0.0)])
+def test_round_trip_by_dtype(tmp_path, dtype, tol):
+    rows = _rows(5)
+    cache = EmbeddingCache(tmp_path, "m", dtype=dtype)
+    cache.put_many(_keys(*"abcde"), rows)
+    reopened = EmbeddingCache(tmp_path, "m", dtype="float32", readonly=True)
+    assert reopened.dtype == np.dtype(dtype)  # the stored dtype wins over the argument
+    got = reopened.get_many(_keys(*"abcde"))
+    out = np.stack([got[k] for k in _keys(*"abcde")])
+    assert out.dtype == np.float32
+    np.testing.assert_allclose(out, rows, atol=tol)
+
+
+def test_memmap_grows_with_appends_and_reopens(tmp_path):
+    cache = EmbeddingCache(tmp_path, "m", dtype="float32")
+    cache.put_many(_keys("a"), _rows(1))
+    assert set(cache.get_many(_keys("a", "x"))) == set(_keys("a"))
+    # Rows appended after the map was made are visible without reopening
+    cache.put_many(_keys("a", "b", "c"), _rows(3, seed=1))
+    got = cache.get_many(_keys("b", "c"))
+    np.testing.assert_array_equal(got[_keys("c")[0]], _rows(3, seed=1)[2])
+    # "a" was already cached: its first vector is kept and no row is duplicated
+    assert len(cache) == 3
+    np.testing.assert_array_equal(cache.get_many(_keys("a"))[_keys("a")[0]], _rows(1)[0])
+    assert len(EmbeddingCache(tmp_path, "m", readonly=True)) == 3
+
+
+def test_cached_embeddings_dedupe_and_reuse_the_disk_cache(tmp_path):
+    model = CountingModel()
+    emb = CachedEmbeddings(model, "m", cache=EmbeddingCache(tmp_path, "m"), batch_size=2)
+    first = emb.embed_documents(["alpha", "alpha  ", "beta", "gamma"])
+    # Whitespace variants share a key; misses go to the model in batches of two
+    assert model.calls == [["alpha", "beta"], ["gamma"]]
+    assert first[0] == first[1]
+    assert emb.stats == {"requested": 4, "computed": 3}
+
+    fresh = CachedEmbeddings(model, "m", cache=EmbeddingCache(tmp_path, "m", readonly=True))
+    assert np.allclose(fresh.embed_documents(["gamma", "beta"]), [first[3], first[2]], atol=1e-2)
+    assert len(model.calls) == 2
+
+    # Queries are keyed apart from documents, then served from the in-memory LRU
+    fresh.embed_query("alpha")
+    fresh.embed_queries(["alpha", "alpha"])
+    assert model.calls[2:] == [["alpha"]]
+
+
+def test_read_only_stores_do_not_open_the_disk_cache(tmp_path, monkeypatch):
+    EmbeddingCache(tmp_path, "m").put_many(_keys("a", "b"), _rows(2))
+    monkeypatch.setattr(get_settings(), "embedding_cache_dir", str(tmp_path))
+    monkeypatch.setattr(get_settings(), "embedding_model", "m")
+    monkeypatch.setattr(embedding_cache, "HuggingFaceEmbeddings", lambda model_name: CountingModel())
+    loads = []
+    monkeypatch.setattr(EmbeddingCache, "_load", lambda self: loads.append(self.dir))
+
+    reader = FAISSStore(persist_path=str(tmp_path / "index"))
+    assert reader.embedding_model.cache is None and loads == []
+    assert reader.embedding_model.embed_query("alpha")
+
+    writer = FAISSStore(writable_cache=True, persist_path=str(tmp_path / "index"))
+    assert writer.embedding_model.cache is not None and len(loads) == 1
@@ -0,0 +1,102 @@
+# tests/test_faiss_store.py
+import json
+import os
+import numpy as np
+import pytest
+from app.retrieval.faiss_store import INDEX_VERSION_FILE, FAISSStore, read_index_version
+from app.utils import fs
+
+
+def _docs(n, start=0):
+    rng = np.random.default_rng(start)
+    docs = [{"id": f"c{i}", "text": f"chunk {i}", "meta": {"file": "f.txt"}} for i in range(start, start + n)]
+    return docs, rng.standard_normal((n, 8)).astype(np.float32).tolist()
+
+
+def _open(path, writable=False):
+    return FAISSStore(writable_cache=writable, persist_path=path, embedding_model=object())
+
+
+def _saved(path, n):
+    store = _open(path, writable=True)
+    with store.bulk():
+        store.add_embeddings(*_docs(n))
+    return store
+
+
+def test_bulk_rolls_back_on_error(tmp_path):
+    path = str(tmp_path / "index")
+    store = _saved(path, 3)
+    version = read_index_version(path)
+
+    with pytest.raises(RuntimeError):
+        with store.bulk():
+            store.add_embeddings(*_docs(2, start=3))
+            store.delete(["c0"])
+            raise RuntimeError("embed failed")
+
+    # Neither the disk nor the in-memory store keep any of the failed batch
+    assert read_index_version(path) == version
+    assert store.index.ntotal == 3
+    assert [d["id"] for d in store.get_documents(["c0", "c3"]) if d] == ["c0"]
+    assert _open(path).index.ntotal == 3
+    assert not list(tmp_path.glob(".index.tmp-*"))
+    # ... and the rolled-back ids can be added again
+    assert store.add_embeddings(*_docs(2, start=3)) == ["c3", "c4"]
+
+
+def test_checkpoints_save_companions_in_the_same_swap(tmp_path):
+    path = str(tmp_path / "index")
+    store = _open(path, writable=True)
+    added = []
+    saves = []
+
+    def _on_save(staging):
+        (staging / "manifest.json").write_text(json.dumps(added), encoding="utf-8")
+        saves.append(staging.name)
+
+    with pytest.raises(RuntimeError):
+        with store.bulk(checkpoint_every=2, on_save=_on_save):
+            for start in range(0, 6, 2):
+                docs, vectors = _docs(2, start=start)
+                # Like the indexer's manifest: recorded before the write that may trigger the save
+                added.extend(d["id"] for d in docs)
+                store.add_embeddings(docs, vectors)
+                # Each checkpoint is one directory: vectors and manifest always agree
+                on_disk = _open(path)
+                manifest = json.loads((tmp_path / "index" / "manifest.json").read_text(encoding="utf-8"))
+                assert on_disk.index.ntotal == len(manifest) == len(added)
+                assert (tmp_path / "index" / INDEX_VERSION_FILE).exists()
+            store.add_embeddings(*_docs(1, start=6))
+            raise RuntimeError("crash after the last checkpoint")
+
+    assert len(saves) == 3
+    # The rollback lands on the last checkpoint, companion file included
+    assert store.index.ntotal == 6
+    assert json.loads((tmp_path / "index" / "manifest.json").read_text(encoding="utf-8")) == [f"c{i}" for i in range(6)]
+
+
+def test_recover_after_crash_between_renames(tmp_path, monkeypatch):
+    path = str(tmp_path / "index")
+    store = _saved(path, 3)
+    rename = os.rename
+
+    def _crash(src, dst):
+        # The first rename parks the committed dir; die before the staging dir takes its place
+        if ".tmp-" in str(src):
+            raise OSError("power lost")
+        rename(src, dst)
+
+    monkeypatch.setattr(fs.os, "rename", _crash)
+    with pytest.raises(OSError):
+        with store.bulk():
+            store.add_embeddings(*_docs(2, start=3))
+    monkeypatch.setattr(fs.os, "rename", rename)
+    assert not (tmp_path / "index").exists() and (tmp_path / ".index.old").exists()
+
+    # A reader finds nothing to serve and leaves the directory alone; the next writer restores it
+    assert _open(path).index is None
+    restored = _open(path, writable=True)
+    assert restored.index.ntotal == 3
+    assert not (tmp_path / ".index.old").exists()
+    assert not list(tmp_path.glob(".index.tmp-*"))
@@ -0,0 +1,52 @@
+# tests/test_filters.py
+import numpy as np
+from app.retrieval.ann import build_index, filtered_search
+from app.retrieval.bm25 import BM25Index
+from app.retrieval.filters import allowed_labels, filter_mask, normalize_filters
+from app.retrieval.ids import chunk_int_ids
+
+
+def _index():
+    docs = [
+        ("a1", "revenue grew in europe", {"file": "/data/reports/q1.pdf", "page": 1}),
+        ("a2", "revenue fell in asia", {"file": "/data/reports/q1.pdf", "page": 7}),
+        ("b1", "revenue notes for the board", {"file": "/data/notes/board.docx"}),
+        ("c1", "hiring plan and revenue", {"file": "/data/reports/2024/plan.PDF", "page": 3}),
+    ]
+    return BM25Index.build([d[0] for d in docs], [d[1] for d in docs], [d[2] for d in docs])
+
+
+def _ids(index, mask):
+    return sorted(index.doc_id(i) for i in np.flatnonzero(mask))
+
+
+def test_file_and_page_filters():
+    index = _index()
+    assert _ids(index, filter_mask(index, normalize_filters({"folder": "reports"}))) == ["a1", "a2", "c1"]
+    assert _ids(index, filter_mask(index, normalize_filters({"file_type": ".pdf", "page_min": 3}))) == ["a2", "c1"]
+    assert _ids(index, filter_mask(index, normalize_filters({"file": ["board.docx"]}))) == ["b1"]
+    assert _ids(index, filter_mask(index, normalize_filters({"folder": "/data/reports/2024"}))) == ["c1"]
+
+
+def test_filtered_bm25_only_scores_allowed_docs(tmp_path):
+    index = _index()
+    index.delete(["a1"])
+    index.save(tmp_path / "bm25")
+    loaded = BM25Index.load(tmp_path / "bm25")
+    mask = filter_mask(loaded, normalize_filters({"folder": "reports"}))
+    hits = loaded.search("revenue", 10, mask)
+    assert sorted(loaded.doc_id(pos) for pos, _ in hits) == ["a2", "c1"]
+    assert set(allowed_labels(loaded, mask).tolist()) == set(chunk_int_ids(["a2", "c1"]).tolist())
+
+
+def test_filtered_ann_search_returns_k_allowed_hits():
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((4000, 16)).astype(np.float32)
+    labels = np.arange(4000, dtype=np.int64)
+    index = build_index("IVF64,Flat", 16)
+    index.train(vectors)
+    index.add_with_ids(vectors, labels)
+    allowed = labels[::200]  # 20 allowed vectors spread over the lists
+    _, found = filtered_search(index, vectors[:5], 10, allowed, nprobe=1)
+    assert (found >= 0).sum(axis=1).tolist() == [10] * 5
+    assert np.isin(found, allowed).all()
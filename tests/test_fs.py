@@ -0,0 +1,60 @@
+# tests/test_fs.py
+import os
+import numpy as np
+from app.retrieval.faiss_store import INDEX_FILE, FAISSStore
+from app.utils.fs import atomic_write_dir, dir_lock, recover_dir
+
+
+def _docs(n, start=0):
+    rng = np.random.default_rng(start)
+    docs = [{"id": f"c{i}", "text": f"chunk {i}", "meta": {"file": "f.txt"}} for i in range(start, start + n)]
+    return docs, rng.standard_normal((n, 8)).astype(np.float32).tolist()
+
+
+def test_reader_opened_during_save_leaves_the_save_alone(tmp_path):
+    path = str(tmp_path / "index")
+    writer = FAISSStore(writable_cache=True, persist_path=path, embedding_model=object())
+    writer.add_embeddings(*_docs(3))
+    seen = {}
+
+    def _on_save(staging):
+        # A reader and a second writer start while the staging dir is live
+        seen["reader"] = FAISSStore(persist_path=path, embedding_model=object())
+        recover_dir(path)
+        seen["staging_alive"] = staging.exists()
+
+    with writer.bulk(on_save=_on_save):
+        writer.add_embeddings(*_docs(2, start=3))
+
+    assert seen["staging_alive"]
+    assert seen["reader"].index.ntotal == 3  # still the previous save
+    assert FAISSStore(persist_path=path, embedding_model=object()).index.ntotal == 5
+    assert not list(tmp_path.glob(".index.tmp-*"))
+
+
+def test_recover_dir_waits_for_the_writer_lock(tmp_path):
+    target = tmp_path / "index"
+    atomic_write_dir(target, lambda d: (d / "a.txt").write_text("v1"))
+    old = tmp_path / ".index.old"
+
+    with dir_lock(target):
+        # Between the writer's two renames: target gone, previous copy parked
+        os.rename(target, old)
+        recover_dir(target)
+        assert not target.exists() and old.exists()
+        os.rename(old, target)
+
+    # A crash at the same point, with no writer left holding the lock, is rolled back
+    os.rename(target, old)
+    (tmp_path / ".index.tmp-dead").mkdir()
+    recover_dir(target)
+    assert (target / "a.txt").read_text() == "v1"
+    assert not old.exists() and not (tmp_path / ".index.tmp-dead").exists()
+
+
+def test_readers_do_not_recover(tmp_path):
+    path = tmp_path / "index"
+    os.makedirs(tmp_path / ".index.tmp-live")
+    FAISSStore(persist_path=str(path), embedding_model=object())
+    assert (tmp_path / ".index.tmp-live").exists()
+    assert not (path / INDEX_FILE).exists()
@@ -0,0 +1,27 @@
+# tests/test_fusion.py
+import pytest
+from app.retrieval.fusion import fuse, reciprocal_rank_fusion
+
+
+def _doc(cid, score, file="a.pdf"):
+    return {"text": f"text {cid}", "score": score, "meta": {"id": cid, "file": file}}
+
+
+def test_rrf_keys_by_chunk_id_not_file():
+    vec = [_doc("c1", 0.1), _doc("c2", 0.2)]
+    lex = [_doc("c2", 9.0), _doc("c3", 5.0)]
+    fused = reciprocal_rank_fusion(vec, lex, k_const=60, limit=10)
+    # Same file, three distinct chunks; c2 appears in both lists and wins
+    assert [d["meta"]["id"] for d in fused] == ["c2", "c1", "c3"]
+    assert fused[0]["score"] == pytest.approx((1 / 62 + 1 / 61) / (2 / 61))
+
+
+def test_weighted_orients_distances():
+    vec = [_doc("near", 0.1), _doc("far", 2.0)]  # L2 distances, lower is better
+    fused = fuse([vec, []], strategy="weighted", lower_is_better=[True, False], limit=2)
+    assert [d["meta"]["id"] for d in fused] == ["near", "far"]
+
+
+def test_unknown_strategy():
+    with pytest.raises(ValueError):
+        fuse([[]], strategy="nope")
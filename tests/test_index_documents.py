@@ -0,0 +1,173 @@
+# tests/test_index_documents.py
+import os
+import shutil
+from pathlib import Path
+import pytest
+from app.benchmarks.synthetic import HashingEmbeddings
+from app.core.config import get_settings
+from app.ingestion.chunker import make_text_splitter
+from app.ingestion.streaming import IngestStats
+from app.ingestion.manifest import IndexManifest
+from app.retrieval import faiss_store
+from app.retrieval.bm25 import BM25_DIRNAME, BM25Index
+from app.retrieval.faiss_store import FAISSStore, read_index_version
+from app.scripts import index_documents
+from app.scripts.index_documents import MANIFEST_NAME, _chunks_for_file, _load_bm25, index_directory
+
+EMB = HashingEmbeddings(["refund", "policy", "shipping", "days", "password"], dim=16)
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    settings = get_settings()
+    monkeypatch.setattr(settings, "faiss_path", str(tmp_path / "index"))
+    monkeypatch.setattr(settings, "faiss_shards", 1)
+    monkeypatch.setattr(settings, "faiss_checkpoint_every", 0)
+    monkeypatch.setattr(settings, "embedding_cache_dir", "")
+    monkeypatch.setattr(settings, "fastvlm_checkpoint", "")
+    monkeypatch.setattr(faiss_store, "make_embeddings", lambda writable_cache=False: EMB)
+    data = tmp_path / "data"
+    data.mkdir()
+    (data / "refunds.txt").write_text("The refund policy allows returns within thirty days.", encoding="utf-8")
+    (data / "shipping.txt").write_text("Shipping takes five business days.", encoding="utf-8")
+    return data
+
+
+def _index(data_dir):
+    return index_directory(str(data_dir), workers=1)
+
+
+def _saved_state():
+    """Chunk ids as seen by the FAISS store, the persisted BM25 index and the manifest."""
+    root = Path(get_settings().faiss_path)
+    store = FAISSStore(persist_path=str(root), embedding_model=EMB)
+    bm25 = BM25Index.load(root / BM25_DIRNAME)
+    manifest = IndexManifest.load(root / MANIFEST_NAME)
+    return ({d["id"] for d in store.get_all_documents()},
+            {bm25.doc_id(i) for i in range(len(bm25))},
+            set(manifest.all_chunk_ids()))
+
+
+def test_bm25_and_manifest_are_saved_with_the_index(data_dir):
+    assert _index(data_dir) == 2
+    faiss_ids, bm25_ids, manifest_ids = _saved_state()
+    assert len(faiss_ids) == 2 and faiss_ids == bm25_ids == manifest_ids
+
+    (data_dir / "refunds.txt").write_text("Refunds are no longer offered.", encoding="utf-8")
+    (data_dir / "shipping.txt").unlink()
+    _index(data_dir)
+    faiss_ids, bm25_ids, manifest_ids = _saved_state()
+    assert len(faiss_ids) == 1 and faiss_ids == bm25_ids == manifest_ids
+    bm25 = BM25Index.load(Path(get_settings().faiss_path) / BM25_DIRNAME)
+    assert bm25.has_facets and bm25.search("thirty", 5) == [] and bm25.search("offered", 5)
+
+
+@pytest.mark.parametrize("legacy", ["no_bm25", "no_facets"])
+def test_legacy_index_bootstraps_bm25(data_dir, legacy):
+    _index(data_dir)
+    root = Path(get_settings().faiss_path)
+    faiss_ids, _, _ = _saved_state()
+    # Bundles saved before the lexical index, or before its metadata columns, were persisted
+    if legacy == "no_bm25":
+        shutil.rmtree(root / BM25_DIRNAME)
+    else:
+        (root / BM25_DIRNAME / "files.npy").unlink()
+
+    store = FAISSStore(persist_path=str(root), embedding_model=EMB)
+    bm25 = _load_bm25(store, root / BM25_DIRNAME)
+    assert bm25.has_facets and set(bm25.doc_ids) == faiss_ids
+
+    # The next run persists the derived index, without re-embedding anything
+    version = read_index_version(root)
+    assert _index(data_dir) == 0
+    assert read_index_version(root) != version
+    faiss_after, bm25_ids, _ = _saved_state()
+    assert faiss_after == bm25_ids == faiss_ids
+    assert BM25Index.load(root / BM25_DIRNAME).has_facets
+
+
+def _manifest():
+    return IndexManifest.load(Path(get_settings().faiss_path) / MANIFEST_NAME)
+
+
+def test_reindex_skips_unchanged_and_replaces_edited_files(data_dir):
+    _index(data_dir)
+    refunds, shipping = str((data_dir / "refunds.txt").resolve()), str((data_dir / "shipping.txt").resolve())
+    before = _manifest()
+    assert _index(data_dir) == 0
+
+    # Same content under a new mtime: re-hashed, not re-embedded, stat refreshed
+    os.utime(data_dir / "shipping.txt", ns=(1, 1))
+    assert _index(data_dir) == 0
+    assert _manifest().get(shipping)["mtime_ns"] == 1
+    assert _manifest().chunk_ids(shipping) == before.chunk_ids(shipping)
+
+    (data_dir / "refunds.txt").write_text("Refunds are no longer offered.", encoding="utf-8")
+    assert _index(data_dir) == 1
+    faiss_ids, bm25_ids, _ = _saved_state()
+    new_ids = _manifest().chunk_ids(refunds)
+    assert not set(before.chunk_ids(refunds)) & faiss_ids
+    assert faiss_ids == bm25_ids == set(new_ids) | set(before.chunk_ids(shipping))
+
+    (data_dir / "shipping.txt").unlink()
+    assert _index(data_dir) == 0
+    assert _manifest().get(shipping) is None
+    assert _saved_state()[0] == set(new_ids)
+
+
+def test_chunks_of_an_interrupted_run_are_adopted_or_purged(data_dir):
+    # A checkpoint saved chunks of two files, then the run died before either file finished
+    (data_dir / "gone.txt").write_text("This file is deleted before the next run.", encoding="utf-8")
+    root = Path(get_settings().faiss_path)
+    splitter = make_text_splitter(get_settings().max_chunk_tokens, get_settings().chunk_overlap)
+    store = FAISSStore(writable_cache=True, persist_path=str(root), embedding_model=EMB)
+    manifest, bm25 = IndexManifest(root / MANIFEST_NAME), BM25Index()
+
+    def _on_save(staging):
+        bm25.save(staging / BM25_DIRNAME)
+        manifest.save(staging / MANIFEST_NAME)
+
+    with store.bulk(on_save=_on_save):
+        for name in ("refunds.txt", "gone.txt"):
+            key = str((data_dir / name).resolve())
+            chunks, _ = _chunks_for_file(data_dir / name, splitter)
+            for ch in chunks:
+                manifest.mark_pending(key, ch["id"])
+            store.add_embeddings(chunks, EMB.embed_documents([c["text"] for c in chunks]))
+            bm25.add([c["id"] for c in chunks], [c["text"] for c in chunks], [c["meta"] for c in chunks])
+    gone = _manifest().chunk_ids(str((data_dir / "gone.txt").resolve()))
+    (data_dir / "gone.txt").unlink()
+
+    # Only shipping.txt is new; the pending refunds chunk is adopted, the orphaned one purged
+    assert _index(data_dir) == 1
+    refunds = _manifest().get(str((data_dir / "refunds.txt").resolve()))
+    assert refunds["sha1"] and refunds["size"]
+    faiss_ids, bm25_ids, manifest_ids = _saved_state()
+    assert len(faiss_ids) == 2 and faiss_ids == bm25_ids == manifest_ids
+    assert not set(gone) & faiss_ids
+
+
+def test_a_lone_large_pdf_gets_the_idle_cores(data_dir, monkeypatch):
+    monkeypatch.setattr(get_settings(), "ingest_workers", 0)
+    monkeypatch.setattr(get_settings(), "pdf_workers", 0)
+    monkeypatch.setattr(os, "cpu_count", lambda: 8)
+    queued = []
+
+    def _capture(tasks, **kwargs):
+        queued.extend(tasks)
+        return IngestStats()
+
+    monkeypatch.setattr(index_documents, "run_streaming_ingest", _capture)
+    shutil.rmtree(data_dir)
+    data_dir.mkdir()
+    (data_dir / "manual.pdf").write_bytes(b"%PDF-1.4")
+    index_directory(str(data_dir))
+    # Default settings: eight ingest workers, but only one file to extract
+    assert [t["pdf_workers"] for t in queued] == [8]
+
+    for i in range(9):
+        (data_dir / f"note{i}.txt").write_text(f"note {i}", encoding="utf-8")
+    queued.clear()
+    index_directory(str(data_dir), full=True)
+    # A queue longer than the ingest pool splits cores per file until its last few files
+    assert [t["pdf_workers"] for t in queued] == [1] * 6 + [2, 2, 4, 8]
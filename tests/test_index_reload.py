@@ -0,0 +1,41 @@
+# tests/test_index_reload.py
+import asyncio
+from app.benchmarks.synthetic import HashingEmbeddings, StubLLM
+from app.rag.pipeline import RAGPipeline
+from app.retrieval.faiss_store import FAISSStore
+from app.retrieval.hybrid_retriever import HybridRetriever
+
+EMB = HashingEmbeddings(["refund", "policy", "shipping", "days", "password"], dim=32)
+
+
+def _write(path, docs):
+    store = FAISSStore(writable_cache=True, persist_path=path, embedding_model=EMB)
+    with store.bulk():
+        store.add_embeddings(docs, EMB.embed_documents([d["text"] for d in docs]).tolist())
+
+
+def _doc(i, text):
+    return {"id": f"c{i}", "text": text, "meta": {"file": f"f{i}.txt"}}
+
+
+def test_pipeline_serves_and_caches_against_the_reloaded_index(tmp_path):
+    path = str(tmp_path / "index")
+    _write(path, [_doc(0, "shipping takes five days"), _doc(1, "reset your password online")])
+    retriever = HybridRetriever(store=FAISSStore(persist_path=path, embedding_model=EMB))
+    pipeline = RAGPipeline(retriever=retriever, llm=StubLLM())
+
+    async def ask():
+        return await pipeline.run("refund policy")
+
+    first = asyncio.run(ask())
+    assert "f2.txt" not in {r["meta"]["file"] for r in first["retrieved"]}
+    assert asyncio.run(ask())["cache"] == "exact"
+
+    # The indexer saves a new version while the API is running
+    _write(path, [_doc(2, "refund policy is thirty days")])
+    assert retriever.stale()
+    second = asyncio.run(ask())
+    assert "cache" not in second
+    assert second["retrieved"][0]["meta"]["file"] == "f2.txt"
+    assert not retriever.stale() and pipeline.answer_cache.snapshot()["invalidations"] == 1
+    assert asyncio.run(ask())["cache"] == "exact"
@@ -0,0 +1,42 @@
+# tests/test_llm_ollama.py
+import asyncio
+import json
+import httpx
+from app.models.llm_ollama import OllamaLLM
+
+
+def _llm(delay=0.05):
+    state = {"calls": 0, "active": 0, "peak": 0}
+
+    async def handler(request):
+        state["calls"] += 1
+        state["active"] += 1
+        state["peak"] = max(state["peak"], state["active"])
+        await asyncio.sleep(delay)
+        state["active"] -= 1
+        prompt = json.loads(request.content)["prompt"]
+        return httpx.Response(200, json={"response": f"echo {prompt}"})
+
+    llm = OllamaLLM(client=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    return llm, state
+
+
+def test_identical_prompts_share_one_generation():
+    llm, state = _llm()
+
+    async def main():
+        return await asyncio.gather(*(llm.generate("same") for _ in range(5)))
+
+    assert asyncio.run(main()) == ["echo same"] * 5
+    assert state["calls"] == 1
+
+
+def test_concurrency_gate_limits_upstream_parallelism():
+    llm, state = _llm()
+    llm.router.endpoints[0].slots = asyncio.Semaphore(2)
+
+    async def main():
+        return await asyncio.gather(*(llm.generate(f"p{i}") for i in range(6)))
+
+    assert asyncio.run(main()) == [f"echo p{i}" for i in range(6)]
+    assert state["calls"] == 6 and state["peak"] == 2
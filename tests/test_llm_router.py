@@ -0,0 +1,203 @@
+# tests/test_llm_router.py
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import httpx
+import pytest
+from app.models.router import LLMRouter, NoHealthyEndpoint
+
+
+class StubOllama:
+    """Local HTTP server answering /api/generate after `delay` seconds with `status`."""
+
+    def __init__(self, name, delay=0.0, status=200):
+        self.name, self.delay, self.status, self.hits = name, delay, status, 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._reply(stub.status, {"models": []})
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                stub.hits += 1
+                time.sleep(stub.delay)
+                self._reply(stub.status, {"response": stub.name, "done": True})
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stubs():
+    created = []
+
+    def make(*args, **kwargs):
+        s = StubOllama(*args, **kwargs)
+        created.append(s)
+        return s
+
+    yield make
+    for s in created:
+        s.close()
+
+
+def _run(router_kwargs, urls, fn):
+    async def main():
+        async with httpx.AsyncClient(timeout=5.0) as client:
+            router = LLMRouter(urls, client_fn=lambda: client, **router_kwargs)
+            return router, await fn(router)
+    return asyncio.run(main())
+
+
+def test_failover_and_circuit_breaker(stubs):
+    bad, good = stubs("bad", status=500), stubs("good")
+
+    async def fn(router):
+        return [(await router.post_json("/api/generate", {}))["response"] for _ in range(5)]
+
+    router, answers = _run({"failure_threshold": 2, "cooldown_s": 60, "hedge": False}, [bad.url, good.url], fn)
+    assert answers == ["good"] * 5
+    assert router.endpoints[0].state == "open"
+    assert bad.hits == 2  # no traffic once the circuit is open
+
+
+def test_all_endpoints_down_raises(stubs):
+    bad = stubs("bad", status=503)
+
+    async def fn(router):
+        with pytest.raises(RuntimeError):
+            await router.post_json("/api/generate", {})
+        with pytest.raises(NoHealthyEndpoint):
+            await router.post_json("/api/generate", {})
+
+    _run({"failure_threshold": 1, "cooldown_s": 60}, [bad.url], fn)
+
+
+def test_least_outstanding_spreads_concurrent_load(stubs):
+    a, b = stubs("a", delay=0.1), stubs("b", delay=0.1)
+
+    async def fn(router):
+        return await asyncio.gather(*(router.post_json("/api/generate", {}) for _ in range(6)))
+
+    _run({"hedge": False}, [a.url, b.url], fn)
+    assert (a.hits, b.hits) == (3, 3)
+
+
+def test_hedges_slow_node(stubs):
+    slow, fast = stubs("slow", delay=1.0), stubs("fast", delay=0.0)
+
+    async def fn(router):
+        # Pretend recent p95 is 50ms, then make the slow node the preferred one
+        router.endpoints[0].latencies_ms.extend([50.0] * 20)
+        router.endpoints[1].ewma_ms = 500.0
+        start = time.perf_counter()
+        result = await router.post_json("/api/generate", {})
+        return result, time.perf_counter() - start
+
+    router, (result, elapsed) = _run({"hedge_min_samples": 20}, [slow.url, fast.url], fn)
+    assert result["response"] == "fast"
+    assert elapsed < 0.5
+    assert router.endpoints[1].stats["hedges"] == 1
+
+
+def test_health_check_marks_unhealthy(stubs):
+    up, down = stubs("up"), stubs("down", status=500)
+
+    async def fn(router):
+        await router.check_health()
+        return [ep.healthy for ep in router.endpoints]
+
+    _, health = _run({}, [up.url, down.url], fn)
+    assert health == [True, False]
+
+
+def test_stream_ttft_does_not_set_hedge_delay():
+    async def handler(request):
+        return httpx.Response(200, text='{"response": "a"}\n{"done": true}\n')
+
+    async def main():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            router = LLMRouter(["http://a", "http://b"], client_fn=lambda: client, hedge_min_samples=5)
+            router.endpoints[0].latencies_ms.extend([2000.0] * 5)
+            router.endpoints[0].ewma_ms = 2000.0
+            for _ in range(20):
+                async for _line in router.stream_lines("/api/generate", {}):
+                    pass
+            return router
+
+    router = asyncio.run(main())
+    assert router.hedge_delay_s() == 2.0
+    assert router.endpoints[0].ewma_ms == 2000.0
+    assert sum(len(ep.ttft_ms) for ep in router.endpoints) == 20
+
+
+def test_hedge_only_goes_to_a_node_with_a_free_slot():
+    hits = {"a": 0, "b": 0}
+
+    async def handler(request):
+        hits[request.url.host] += 1
+        await asyncio.sleep(0.3 if request.url.host == "a" else 0.0)
+        return httpx.Response(200, json={"response": request.url.host})
+
+    async def main():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            router = LLMRouter(["http://a", "http://b"], client_fn=lambda: client, hedge_min_samples=1,
+                               max_concurrency=1)
+            a, b = router.endpoints
+            a.latencies_ms.append(20.0)
+            b.ewma_ms = 500.0  # prefer a
+            async with b.slot():  # b is saturated: no hedge may be sent to it
+                first = await router.post_json("/api/generate", {})
+            a.latencies_ms.clear()
+            a.latencies_ms.append(20.0)
+            second = await router.post_json("/api/generate", {})
+            return first, second, b.stats["hedges"]
+
+    first, second, hedges = asyncio.run(main())
+    assert first["response"] == "a" and second["response"] == "b"
+    assert hedges == 1 and hits == {"a": 2, "b": 1}
+
+
+def test_caller_cancelled_during_hedge_delay_cancels_the_request():
+    cancelled = []
+
+    async def handler(request):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(request.url.host)
+            raise
+        return httpx.Response(200, json={"response": "late"})
+
+    async def main():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            router = LLMRouter(["http://a", "http://b"], client_fn=lambda: client, hedge_min_samples=1)
+            a = router.endpoints[0]
+            a.latencies_ms.append(1000.0)  # hedge delay of a second: the caller leaves before it
+            call = asyncio.ensure_future(router.post_json("/api/generate", {}))
+            await asyncio.sleep(0.05)
+            assert a.outstanding == 1
+            call.cancel()
+            await asyncio.sleep(0.05)
+            return cancelled, [ep.outstanding for ep in router.endpoints]
+
+    assert asyncio.run(main()) == (["a"], [0, 0])
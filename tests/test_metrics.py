@@ -0,0 +1,70 @@
+# tests/test_metrics.py
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from app.core import metrics
+
+
+@pytest.fixture(autouse=True)
+def _fresh_metrics():
+    metrics.configure(enabled=True, sample_rate=0.0)
+    for hist in metrics.REGISTRY:
+        hist.reset()
+    yield
+    metrics.configure(enabled=True, sample_rate=0.0)
+
+
+def test_histogram_renders_cumulative_buckets():
+    hist = metrics.Histogram("x_seconds", "Test.", ("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        hist.observe(value, "bm25")
+    text = "\n".join(hist.render())
+    assert 'x_seconds_bucket{stage="bm25",le="0.1"} 1' in text
+    assert 'x_seconds_bucket{stage="bm25",le="1.0"} 3' in text
+    assert 'x_seconds_bucket{stage="bm25",le="+Inf"} 4' in text
+    assert 'x_seconds_count{stage="bm25"} 4' in text
+
+
+def test_disabled_stage_is_a_noop():
+    metrics.configure(enabled=False)
+    with metrics.stage("embed"):
+        pass
+    fn = len
+    assert metrics.bind(fn) is fn
+    assert metrics.STAGE_SECONDS.count("embed") == 0
+
+
+def test_trace_collects_stages_from_executor_threads():
+    trace = metrics.start_trace("req-1")
+    token = metrics._current.set(trace)
+    try:
+        def work():
+            with metrics.stage("bm25"):
+                pass
+        with ThreadPoolExecutor(1) as pool:
+            pool.submit(metrics.bind(work)).result()
+            pool.submit(work).result()  # unbound: histogram only
+    finally:
+        metrics._current.reset(token)
+    assert [name for name, _ in trace.spans] == ["bm25"]
+    assert metrics.STAGE_SECONDS.count("bm25") == 2
+
+
+def test_middleware_times_route_and_echoes_request_id():
+    async def app(scope, receive, send):
+        scope["route"] = type("Route", (), {"path": "/query"})()
+        with metrics.stage("llm_total"):
+            pass
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "path": "/query", "headers": [(b"x-request-id", b"abc")]}
+    asyncio.run(metrics.TraceMiddleware(app)(scope, None, send))
+    assert (b"x-request-id", b"abc") in sent[0]["headers"]
+    assert metrics.REQUEST_SECONDS.count("/query", "200") == 1
+    assert 'rag_stage_seconds_count{stage="llm_total"} 1' in metrics.render()
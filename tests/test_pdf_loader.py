@@ -0,0 +1,71 @@
+# tests/test_pdf_loader.py
+import pytest
+from app.ingestion import loader
+from app.ingestion.loader import PDF_BACKENDS, load_pdf_pages
+
+
+def _write_pdf(path, texts):
+    """Minimal valid PDF with one line of Helvetica text per page."""
+    n = len(texts)
+    objs = ["<< /Type /Catalog /Pages 2 0 R >>",
+            "<< /Type /Pages /Kids [%s] /Count %d >>" % (" ".join(f"{4 + 2 * i} 0 R" for i in range(n)), n),
+            "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    for i, text in enumerate(texts):
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET"
+        objs.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>")
+        objs.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+    out, offsets = b"%PDF-1.4\n", []
+    for i, body in enumerate(objs, 1):
+        offsets.append(len(out))
+        out += f"{i} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objs) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    out += "".join(f"{o:010d} 00000 n \n" for o in offsets).encode("latin-1")
+    out += f"trailer\n<< /Size {len(objs) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    path.write_bytes(out)
+    return path
+
+
+TEXTS = [f"Page number {i} body" for i in range(1, 13)]
+
+
+@pytest.mark.parametrize("backend", sorted(PDF_BACKENDS))
+def test_parallel_extraction_matches_serial(tmp_path, backend):
+    pdf = _write_pdf(tmp_path / "doc.pdf", TEXTS)
+    serial = list(load_pdf_pages(pdf, backend=backend, workers=1, cache_path=""))
+    parallel = list(load_pdf_pages(pdf, backend=backend, workers=2, min_pages=4, cache_path=""))
+    assert [p for p, _ in serial] == list(range(1, 13))
+    assert [t.strip() for _, t in serial] == TEXTS
+    assert parallel == serial
+
+
+def test_cached_pages_are_not_parsed_again(tmp_path, monkeypatch):
+    pdf = _write_pdf(tmp_path / "doc.pdf", TEXTS)
+    cache = str(tmp_path / "pages.sqlite")
+    first = list(load_pdf_pages(pdf, backend="pdfplumber", workers=1, cache_path=cache))
+
+    def _fail(*args):
+        raise AssertionError("page re-parsed")
+
+    monkeypatch.setattr(loader.PlumberBackend, "extract", staticmethod(_fail))
+    monkeypatch.setattr(loader.PlumberBackend, "page_count", staticmethod(_fail))
+    assert list(load_pdf_pages(pdf, backend="pdfplumber", workers=1, cache_path=cache)) == first
+
+    # A new extractor version misses the cache
+    monkeypatch.setattr(loader, "EXTRACTOR_VERSION", loader.EXTRACTOR_VERSION + 1)
+    with pytest.raises(AssertionError, match="re-parsed"):
+        list(load_pdf_pages(pdf, backend="pdfplumber", workers=1, cache_path=cache))
+
+
+def test_page_workers_share_the_ingest_budget(monkeypatch):
+    monkeypatch.setattr(loader.os, "cpu_count", lambda: 8)
+    monkeypatch.setattr(loader.get_settings(), "pdf_workers", 0)
+    assert loader.page_workers_for(8) == 1
+    assert loader.page_workers_for(2) == 4
+    # Fewer files queued than ingest workers: the idle cores go to their pages
+    assert loader.page_workers_for(8, queued=20) == 1
+    assert loader.page_workers_for(8, queued=2) == 4
+    assert loader.page_workers_for(8, queued=1) == 8
+    monkeypatch.setattr(loader.get_settings(), "pdf_workers", 2)
+    assert loader.page_workers_for(1) == 2
+    assert loader.page_workers_for(8, queued=1) == 2
@@ -0,0 +1,69 @@
+# tests/test_query_batcher.py
+import threading
+import time
+import numpy as np
+import pytest
+from app.retrieval.query_batcher import QueryBatcher
+
+
+class RecordingStore:
+    """Stands in for the vector store: one hit per rank, tagged with the query it answers."""
+
+    def __init__(self, fail_on=None):
+        self.embedded = []
+        self.searches = []
+        self.fail_on = fail_on
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def embed_queries(self, queries):
+        self.gate.wait(timeout=5)
+        self.embedded.append(list(queries))
+        if self.fail_on in queries:
+            raise RuntimeError(f"cannot embed {self.fail_on}")
+        return np.arange(len(queries), dtype=np.float32).reshape(-1, 1)
+
+    def search_by_vectors(self, vectors, k):
+        self.searches.append(k)
+        queries = self.embedded[-1]
+        return [[{"text": f"{queries[int(v[0])]}-{i}"} for i in range(k)] for v in vectors]
+
+
+def test_concurrent_queries_share_one_batch():
+    store = RecordingStore()
+    batcher = QueryBatcher(store, max_batch=8, max_wait_ms=200)
+    futures = [batcher.submit(q, k) for q, k in [("a", 2), ("b", 3), ("a", 1)]]
+    results = [f.result(timeout=5) for f in futures]
+
+    # Duplicate questions are embedded once; one search at the largest k, sliced per caller
+    assert store.embedded == [["a", "b"]]
+    assert store.searches == [3]
+    assert [[h["text"] for h in r] for r in results] == [["a-0", "a-1"], ["b-0", "b-1", "b-2"], ["a-0"]]
+    assert batcher.stats["batches"] == 1 and batcher.mean_batch_size == 3
+
+
+def test_batches_flush_at_max_batch_and_after_max_wait():
+    store = RecordingStore()
+    store.gate.clear()  # hold the worker so the queries pile up behind it
+    batcher = QueryBatcher(store, max_batch=2, max_wait_ms=5)
+    futures = [batcher.submit(str(i), 1) for i in range(5)]
+    store.gate.set()
+    assert [f.result(timeout=5)[0]["text"] for f in futures] == [f"{i}-0" for i in range(5)]
+    sizes = [len(b) for b in store.embedded]
+    assert sum(sizes) == 5 and max(sizes) == 2
+
+    # A lone query only waits out the window
+    start = time.perf_counter()
+    assert batcher.search("solo", 1)[0]["text"] == "solo-0"
+    assert time.perf_counter() - start < 0.5
+
+
+def test_errors_reach_every_waiter_of_the_batch():
+    store = RecordingStore(fail_on="bad")
+    batcher = QueryBatcher(store, max_batch=8, max_wait_ms=200)
+    futures = [batcher.submit(q, 1) for q in ("ok", "bad", "also ok")]
+    for f in futures:
+        with pytest.raises(RuntimeError, match="cannot embed bad"):
+            f.result(timeout=5)
+    # The worker survives and serves the next batch
+    assert batcher.search("fine", 1)[0]["text"] == "fine-0"
@@ -0,0 +1,64 @@
+# tests/test_ragas_runner.py
+import threading
+import time
+from app.evaluation.ragas_runner import EvalEngine, aggregate
+
+
+class FakeScorer:
+    """Scores `faithfulness` from the answer length; fails `context_precision` for empty contexts."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, sample, names):
+        with self.lock:
+            self.calls.append((sample["question"], tuple(names)))
+        time.sleep(self.delay)
+        out = {"faithfulness": len(sample["answer"]) / 10}
+        out["context_precision"] = 1.0 if sample["contexts"] else float("nan")
+        return {n: out[n] for n in names}
+
+
+def _samples():
+    return [{"question": f"q{i}", "answer": "a" * i, "contexts": [f"c{i}"]} for i in range(1, 5)]
+
+
+def test_rerun_only_scores_changed_samples(tmp_path):
+    metrics = ("faithfulness", "context_precision")
+    scorer = FakeScorer()
+    engine = EvalEngine(metrics, llm_model="judge", embedding_model="emb", workers=2, cache_path=str(tmp_path / "s.sqlite"), scorer=scorer)
+    first = list(engine.iter_scores(_samples()))
+    assert sorted(r["index"] for r in first) == [0, 1, 2, 3]
+    assert aggregate(first) == {"faithfulness": 0.25, "context_precision": 1.0}
+
+    samples = _samples()
+    samples[2]["answer"] = "changed"
+    scorer.calls.clear()
+    second = {r["index"]: r for r in engine.iter_scores(samples)}
+    assert scorer.calls == [("q3", metrics)]
+    assert [second[i]["cached"] for i in range(4)] == [True, True, False, True]
+    assert second[2]["scores"]["faithfulness"] == 0.7
+
+
+def test_failed_metric_is_retried_and_identical_samples_scored_once(tmp_path):
+    scorer = FakeScorer()
+    engine = EvalEngine(("faithfulness", "context_precision"), llm_model="judge", embedding_model="emb",
+                        workers=2, cache_path=str(tmp_path / "s.sqlite"), scorer=scorer)
+    sample = {"question": "q", "answer": "abc", "contexts": []}
+    rows = list(engine.iter_scores([sample, dict(sample)]))
+    assert len(rows) == 2 and len(scorer.calls) == 1
+    assert rows[0]["scores"]["context_precision"] is None
+
+    scorer.calls.clear()
+    list(engine.iter_scores([sample]))
+    assert scorer.calls == [("q", ("context_precision",))]
+
+
+def test_samples_are_scored_in_parallel(tmp_path):
+    engine = EvalEngine(("faithfulness",), llm_model="judge", embedding_model="emb", workers=4,
+                        cache_path="", scorer=FakeScorer(delay=0.2))
+    start = time.perf_counter()
+    assert len(list(engine.iter_scores(_samples()))) == 4
+    assert time.perf_counter() - start < 0.5  # serial scoring would take 0.8s
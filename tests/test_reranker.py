@@ -0,0 +1,50 @@
+# tests/test_reranker.py
+import threading
+import time
+from app.retrieval.reranker import CrossEncoderReranker
+
+
+class SlowModel:
+    """Scores a pair by text length after `delay` seconds per call."""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def predict(self, pairs, batch_size=32):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        return [float(len(text)) for _, text in pairs]
+
+
+def _docs(query):
+    return [{"id": f"{query}-{i}", "text": "x" * i, "score": 1.0 / (i + 1)} for i in range(1, 4)]
+
+
+def test_over_budget_queries_fall_back_without_queueing_work():
+    model = SlowModel(delay=0.3)
+    reranker = CrossEncoderReranker("stub", latency_budget_ms=50, model=model)
+    start = time.perf_counter()
+    for q in ("q0", "q1", "q2", "q3"):
+        docs = _docs(q)
+        assert reranker.rerank(q, docs, k=2) == docs[:2]
+    assert time.perf_counter() - start < 0.5  # each query waited only its own budget
+
+    time.sleep(0.4)
+    # Only the call already running when q0 gave up reached the model; the queued ones were dropped
+    assert model.calls == 1
+    assert reranker.stats["budget_fallbacks"] == 4
+    assert reranker.stats["dropped"] == 3
+
+    # ... and it warmed the cache: q0 is now reranked without touching the model
+    out = reranker.rerank("q0", _docs("q0"), k=2)
+    assert [d["id"] for d in out] == ["q0-3", "q0-2"]
+    assert model.calls == 1
+
+
+def test_within_budget_reranks():
+    reranker = CrossEncoderReranker("stub", latency_budget_ms=1000, model=SlowModel(delay=0.0))
+    out = reranker.rerank("q", _docs("q"), k=3)
+    assert [d["first_stage_rank"] for d in out] == [2, 1, 0]
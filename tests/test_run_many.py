@@ -0,0 +1,98 @@
+# tests/test_run_many.py
+import asyncio
+import json
+import httpx
+import pytest
+from app.core.config import get_settings
+from app.models.llm_ollama import OllamaLLM
+from app.rag.pipeline import RAGPipeline
+
+
+class BatchRetriever:
+    """Stands in for HybridRetriever; records the query groups it was asked for."""
+
+    reranker = None
+    version = "v1"
+
+    def __init__(self):
+        self.groups = []
+
+    def stale(self):
+        return False
+
+    def fetch_sizes(self, k=None):
+        return k or 3, 10
+
+    def retrieve_many(self, queries, k=None, strategy=None, filters=None):
+        self.groups.append(list(queries))
+        return [[{"text": f"evidence for {q}", "score": 0.5, "meta": {"id": q, "file": f"{q}.txt"}}] for q in queries]
+
+
+class CountingLLM:
+    def __init__(self):
+        self.calls = 0
+        self.active = 0
+        self.peak = 0
+
+    async def generate(self, prompt):
+        self.calls += 1
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        return "answer [doc:1]"
+
+
+@pytest.fixture
+def batch_settings(monkeypatch):
+    settings = get_settings()
+    monkeypatch.setattr(settings, "answer_cache_size", 0)
+    monkeypatch.setattr(settings, "batch_retrieval_size", 2)
+    monkeypatch.setattr(settings, "batch_generate_concurrency", 2)
+    return settings
+
+
+def test_run_many_dedupes_batches_and_bounds_generation(batch_settings):
+    retriever, llm = BatchRetriever(), CountingLLM()
+    pipeline = RAGPipeline(retriever=retriever, llm=llm)
+    questions = ["a", "b", "a", "c", "d", "b"]
+
+    async def collect():
+        return [(i, r) async for i, r in pipeline.run_many(questions)]
+
+    results = asyncio.run(collect())
+    assert sorted(i for i, _ in results) == list(range(len(questions)))
+    assert all(r["answer"] and r["retrieved"] for _, r in results)
+    assert retriever.groups == [["a", "b"], ["c", "d"]]
+    assert llm.calls == 4
+    assert llm.peak <= 2
+
+
+def test_abandoned_batch_cancels_upstream_generations(batch_settings):
+    state = {"started": 0, "cancelled": 0}
+
+    async def handler(request):
+        prompt = json.loads(request.content)["prompt"]
+        if "slow" in prompt:
+            state["started"] += 1
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                state["cancelled"] += 1
+                raise
+        return httpx.Response(200, json={"response": "answer [doc:1]"})
+
+    llm = OllamaLLM(client=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    pipeline = RAGPipeline(retriever=BatchRetriever(), llm=llm)
+
+    async def main():
+        batch = pipeline.run_many(["fast", "slow"])
+        _, first = await batch.__anext__()
+        assert first["answer"]
+        # The caller goes away; the coalesced Ollama request for "slow" must not run on
+        await batch.aclose()
+        await asyncio.sleep(0.05)
+        # Checked before asyncio.run tears down, which would cancel any leftover task anyway
+        assert state == {"started": 1, "cancelled": 1}
+
+    asyncio.run(main())
@@ -0,0 +1,73 @@
+# tests/test_sharded_store.py
+import numpy as np
+import pytest
+from app.core.config import get_settings
+from app.retrieval.faiss_store import FAISSStore
+from app.retrieval.ids import chunk_int_ids
+from app.retrieval.sharded_store import ShardedFAISSStore, read_shard_layout
+
+N, DIM = 120, 8
+
+
+def _corpus(seed=0):
+    rng = np.random.default_rng(seed)
+    docs = [{"id": f"c{i}", "text": f"chunk {i}", "meta": {"file": f"f{i % 7}.txt"}} for i in range(N)]
+    return docs, rng.standard_normal((N, DIM)).astype(np.float32)
+
+
+@pytest.fixture
+def index_path(tmp_path, monkeypatch):
+    path = str(tmp_path / "index")
+    monkeypatch.setattr(get_settings(), "faiss_path", path)
+    monkeypatch.setattr(get_settings(), "faiss_index_factory", "Flat")
+    return path
+
+
+def _sharded(shard_by, num_shards=4):
+    docs, vectors = _corpus()
+    store = ShardedFAISSStore(writable_cache=True, num_shards=num_shards, shard_by=shard_by, embedding_model=object())
+    with store.bulk():
+        store.add_embeddings(docs, vectors.tolist())
+    return store
+
+
+@pytest.mark.parametrize("shard_by", ["hash", "source"])
+def test_scatter_gather_matches_a_single_index(tmp_path, index_path, shard_by):
+    docs, vectors = _corpus()
+    single = FAISSStore(writable_cache=True, persist_path=str(tmp_path / "single"), embedding_model=object())
+    with single.bulk():
+        single.add_embeddings(docs, vectors.tolist())
+    sharded = _sharded(shard_by)
+    loaded = [s.index.ntotal for s in sharded.shards if s.index is not None]
+    assert len(loaded) > 1 and sum(loaded) == N
+
+    queries = np.random.default_rng(1).standard_normal((5, DIM)).astype(np.float32)
+    expected = single.search_by_vectors(queries, 10)
+    got = sharded.search_by_vectors(queries, 10)
+    for want, hits in zip(expected, got):
+        # The global top-k, in distance order, even though every shard returned its own top-k
+        assert [h["text"] for h in hits] == [h["text"] for h in want]
+        assert [h["score"] for h in hits] == sorted(h["score"] for h in hits)
+
+
+@pytest.mark.parametrize("shard_by", ["hash", "source"])
+def test_filtered_search_and_lookups_route_to_the_owning_shard(index_path, shard_by):
+    store = _sharded(shard_by)
+    wanted = [f"c{i}" for i in (3, 50, 77, 101)]
+    queries = np.random.default_rng(2).standard_normal((2, DIM)).astype(np.float32)
+    for hits in store.search_by_vectors(queries, 10, allowed=chunk_int_ids(wanted)):
+        assert sorted(h["text"] for h in hits) == sorted(f"chunk {c[1:]}" for c in wanted)
+
+    assert [d["id"] if d else None for d in store.get_documents(wanted + ["missing"])] == wanted + [None]
+    assert store.delete(wanted[:2]) == 2
+    assert store.get_documents(wanted[:2]) == [None, None]
+
+
+def test_reopen_keeps_the_saved_layout(index_path, monkeypatch):
+    _sharded("source", num_shards=3)
+    assert read_shard_layout(index_path) == {"shards": 3, "shard_by": "source"}
+    # A different configured layout only applies to the next full rebuild
+    monkeypatch.setattr(get_settings(), "faiss_shards", 5)
+    reader = ShardedFAISSStore(embedding_model=object())
+    assert (reader.num_shards, reader.shard_by) == (3, "source")
+    assert len(reader.get_all_documents()) == N
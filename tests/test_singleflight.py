@@ -0,0 +1,52 @@
+# tests/test_singleflight.py
+import asyncio
+from app.utils.singleflight import SingleFlight
+
+
+class Upstream:
+    """A slow call that records how it ended."""
+
+    def __init__(self):
+        self.started = 0
+        self.cancelled = 0
+
+    async def call(self):
+        self.started += 1
+        try:
+            await asyncio.sleep(0.1)
+            return f"result {self.started}"
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+
+
+def test_shared_call_survives_one_cancelled_caller():
+    async def main():
+        flights, upstream = SingleFlight(), Upstream()
+        first = asyncio.ensure_future(flights.do("k", upstream.call))
+        second = asyncio.ensure_future(flights.do("k", upstream.call))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second, upstream, flights
+
+    result, upstream, flights = asyncio.run(main())
+    assert result == "result 1"
+    assert upstream.started == 1 and upstream.cancelled == 0
+    assert flights.stats == {"calls": 2, "coalesced": 1, "cancelled": 0}
+
+
+def test_shared_call_is_cancelled_with_its_last_caller():
+    async def main():
+        flights, upstream = SingleFlight(), Upstream()
+        callers = [asyncio.ensure_future(flights.do("k", upstream.call)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        for c in callers:
+            c.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.sleep(0)
+        assert upstream.cancelled == 1
+        # A later caller does not join the dead call
+        return await flights.do("k", upstream.call), upstream
+
+    result, upstream = asyncio.run(main())
+    assert result == "result 2" and upstream.started == 2
@@ -0,0 +1,83 @@
+# tests/test_streaming.py
+import time
+import pytest
+from app.ingestion.streaming import run_streaming_ingest
+
+
+def _extract(task):
+    # Runs in a spawned worker, so it must be importable from this module
+    if task.get("broken"):
+        raise ValueError(f"cannot parse {task['key']}")
+    chunks = [{"id": f"{task['key']}-{i}", "text": f"{task['key']} {i}", "meta": {}} for i in range(task["n"])]
+    return {"key": task["key"], "pages": 1, "chunks": task["n"], "chunks_to_embed": chunks}
+
+
+def _embed(texts):
+    return [[float(len(t))] for t in texts]
+
+
+def _tasks(**sizes):
+    return [{"key": key, "n": n} for key, n in sizes.items()]
+
+
+def test_files_are_done_only_after_their_last_chunk_is_written():
+    written, events = [], []
+
+    def write(batch, vectors):
+        assert len(batch) == len(vectors) <= 3
+        written.extend(c["id"] for c in batch)
+        events.append(("write", [c["id"] for c in batch]))
+
+    def on_file_done(result):
+        events.append(("done", result["key"], result.get("_remaining")))
+
+    stats = run_streaming_ingest(_tasks(a=5, b=0, c=4), extract=_extract, embed=_embed, write=write,
+                                 on_file_done=on_file_done, workers=1, embed_batch_size=3)
+
+    assert sorted(written) == sorted([f"a-{i}" for i in range(5)] + [f"c-{i}" for i in range(4)])
+    done = [e for e in events if e[0] == "done"]
+    assert sorted(key for _, key, _ in done) == ["a", "b", "c"]
+    for _, key, remaining in done:
+        # Every chunk accounted for, and all of them written before the file is reported
+        assert remaining in (0, None)
+        last_write = max((i for i, e in enumerate(events) if e[0] == "write" and any(c.startswith(f"{key}-") for c in e[1])), default=-1)
+        assert events.index(("done", key, remaining)) > last_write
+    report = stats.report()
+    assert report["write"]["chunks"] == 9 and report["write"]["files"] == 3
+    assert report["extract"]["files"] == 3 and report["embed"]["embeddings"] == 9
+
+
+def test_extract_errors_skip_only_that_file():
+    done = []
+    tasks = _tasks(a=2, b=2)
+    tasks.insert(1, {"key": "bad", "n": 1, "broken": True})
+    run_streaming_ingest(tasks, extract=_extract, embed=_embed, write=lambda b, v: None,
+                         on_file_done=lambda r: done.append(r["key"]), workers=1, embed_batch_size=2)
+    assert sorted(done) == ["a", "b"]
+
+
+@pytest.mark.parametrize("failing", ["embed", "write", "on_file_done"])
+def test_a_failing_stage_stops_the_run_and_raises(failing):
+    done = []
+
+    def embed(texts):
+        if failing == "embed" and any(t.startswith("b") for t in texts):
+            raise RuntimeError("embed stage failed")
+        return _embed(texts)
+
+    def write(batch, vectors):
+        if failing == "write" and any(c["id"].startswith("b") for c in batch):
+            raise RuntimeError("write stage failed")
+
+    def on_file_done(result):
+        if failing == "on_file_done" and result["key"] == "b":
+            raise RuntimeError("on_file_done stage failed")
+        done.append(result["key"])
+
+    start = time.perf_counter()
+    with pytest.raises(RuntimeError, match=f"{failing} stage failed"):
+        run_streaming_ingest(_tasks(a=2, b=2, c=2, d=2, e=2), extract=_extract, embed=embed, write=write,
+                             on_file_done=on_file_done, workers=1, embed_batch_size=2, queue_size=1)
+    assert time.perf_counter() - start < 30  # stop unblocks every stage; nothing hangs on a full queue
+    # The failed file is never reported as done
+    assert "b" not in done